@@ -1,9 +1,21 @@
 """
 Telegram Bot для погоды - точка входа.
+
+Режим задаётся переменной окружения BOT_MODE:
+- sync (по умолчанию) — TeleBot с потоками;
+- async — AsyncTeleBot, все обработчики в одном event loop.
 """
 
-from src.bot import main
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+if os.getenv("BOT_MODE", "sync").lower() == "async":
+    from src.async_bot import main
+else:
+    from src.bot import main
 
 if __name__ == "__main__":
     main()
-
@@ -1,64 +1,55 @@
 from typing import Dict, Any, Optional
-from src.api_client import get_current_weather, get_hourly_weather, get_air_pollution
+from src.api_client import get_current_weather, get_air_pollution
+from src.forecast import ParsedForecast, get_parsed_forecast
+from src.storage import get_stale_age
 
 
-def display_forecast(forecast: Dict[str, Any], location: Optional[Dict[str, str]] = None) -> None:
+def display_forecast(forecast: ParsedForecast, location: Optional[Dict[str, str]] = None) -> None:
     """Отобразить почасовой прогноз погоды с пагинацией."""
-    try:
-        city_name = forecast.get("city", {}).get("name", "Неизвестный город")
-        if location:
-            region = location.get("state") or location.get("country") or "неизвестная область"
-            city_name = f"{location.get('name', city_name)} ({region})"
+    city_name = forecast.city_name or "Неизвестный город"
+    if location:
+        region = location.get("state") or location.get("country") or "неизвестная область"
+        city_name = f"{location.get('name', city_name)} ({region})"
+    
+    print(f"\n{'='*60}")
+    print(f"Прогноз погоды на 5 дней (каждые 3 часа): {city_name}")
+    print(f"{'='*60}")
+    
+    total = len(forecast)
+    if not total:
+        print("Нет данных прогноза")
+        return
+    
+    print(f"Всего доступно прогнозов: {total}")
+    
+    # Показываем по 10 записей за раз
+    start_index = 0
+    page_size = 10
+    
+    while start_index < total:
+        end_index = min(start_index + page_size, total)
         
         print(f"\n{'='*60}")
-        print(f"Прогноз погоды на 5 дней (каждые 3 часа): {city_name}")
+        print(f"Показаны записи {start_index + 1}-{end_index} из {total}")
         print(f"{'='*60}")
         
-        forecast_list = forecast.get("list", [])
-        if not forecast_list:
-            print("Нет данных прогноза")
-            return
-        
-        total = len(forecast_list)
-        print(f"Всего доступно прогнозов: {total}")
+        for i in range(start_index, end_index):
+            print(f"\n{forecast.time_text(i)}")
+            print(f"  Температура: {forecast.temp[i]}°C")
+            print(f"  Описание: {forecast.description(i)}")
+            print(f"  Влажность: {forecast.humidity[i]}%")
+            print(f"  Скорость ветра: {forecast.wind[i]} м/с")
         
-        # Показываем по 10 записей за раз
-        start_index = 0
-        page_size = 10
+        start_index = end_index
         
-        while start_index < total:
-            end_index = min(start_index + page_size, total)
-            
-            print(f"\n{'='*60}")
-            print(f"Показаны записи {start_index + 1}-{end_index} из {total}")
-            print(f"{'='*60}")
-            
-            for item in forecast_list[start_index:end_index]:
-                dt_txt = item.get("dt_txt", "")
-                temp = item.get("main", {}).get("temp", "N/A")
-                description = item.get("weather", [{}])[0].get("description", "N/A")
-                humidity = item.get("main", {}).get("humidity", "N/A")
-                wind_speed = item.get("wind", {}).get("speed", "N/A")
-                
-                print(f"\n{dt_txt}")
-                print(f"  Температура: {temp}°C")
-                print(f"  Описание: {description}")
-                print(f"  Влажность: {humidity}%")
-                print(f"  Скорость ветра: {wind_speed} м/с")
-            
-            start_index = end_index
-            
-            # Если есть еще данные, спрашиваем пользователя
-            if start_index < total:
-                remaining = total - start_index
-                choice = input(f"\nПоказать еще {min(page_size, remaining)} записей? (да/нет): ").strip().lower()
-                if choice not in ["да", "yes", "y", "д"]:
-                    break
-        
-        print(f"\n{'='*60}")
-    except (KeyError, TypeError, IndexError) as e:
-        print(f"Ошибка при отображении прогноза: {e}")
-        print(forecast)
+        # Если есть еще данные, спрашиваем пользователя
+        if start_index < total:
+            remaining = total - start_index
+            choice = input(f"\nПоказать еще {min(page_size, remaining)} записей? (да/нет): ").strip().lower()
+            if choice not in ["да", "yes", "y", "д"]:
+                break
+    
+    print(f"\n{'='*60}")
 
 
 def get_pollutant_level(value: float, pollutant_type: str) -> str:
@@ -159,6 +150,13 @@ def display_air_pollution(pollution_data: Dict[str, Any], location: Optional[Dic
         print(pollution_data)
 
 
+def _stale_suffix(weather: Dict[str, Any]) -> str:
+    age = get_stale_age(weather)
+    if age is None:
+        return ""
+    return f" (данные {max(age // 60, 1)} мин назад)"
+
+
 def display_current_weather(weather: Any) -> None:
     """Отобразить текущую погоду."""
     if not weather:
@@ -177,6 +175,7 @@ def display_current_weather(weather: Any) -> None:
                 print(
                     f"Погода в городе - {city_name} ({region}): "
                     f"{weather_data['main']['temp']}°C, {weather_data['weather'][0]['description']}"
+                    f"{_stale_suffix(weather_data)}"
                 )
             except (KeyError, TypeError):
                 print("Получен неожиданный формат ответа от API:")
@@ -186,6 +185,7 @@ def display_current_weather(weather: Any) -> None:
             print(
                 f"Погода в городе - {weather['name']}: "
                 f"{weather['main']['temp']}°C, {weather['weather'][0]['description']}"
+                f"{_stale_suffix(weather)}"
             )
         except (KeyError, TypeError):
             print("Получен неожиданный формат ответа от API:")
@@ -226,7 +226,7 @@ def submenu_by_city() -> None:
             weather = get_current_weather(city=city)
             display_current_weather(weather)
         elif choice == "2":
-            forecast = get_hourly_weather(location["lat"], location["lon"])
+            forecast = get_parsed_forecast(location["lat"], location["lon"])
             if forecast:
                 display_forecast(forecast, location)
             else:
@@ -269,7 +269,7 @@ def submenu_by_coordinates() -> None:
             weather = get_current_weather(latitude=latitude, longitude=longitude)
             display_current_weather(weather)
         elif choice == "2":
-            forecast = get_hourly_weather(latitude, longitude)
+            forecast = get_parsed_forecast(latitude, longitude)
             if forecast:
                 display_forecast(forecast)
             else:
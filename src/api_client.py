@@ -1,47 +1,141 @@
 import os
+import threading
 import time
-from typing import Optional, Dict, Any, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Sequence, Tuple, Union
 
 import requests
 from dotenv import load_dotenv
-from src.storage import load_cache, is_cache_fresh, cache_weather, load_api_cache, save_api_cache
+from src.gazetteer import lookup_city
+from src.http_client import http_get
+from src.prefetch import Prefetcher
+from src.quota import API_KEYS, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, current_priority, quota, request_priority
+from src.retry import (
+    RETRY_AFTER_MAX,
+    RETRY_INTERACTIVE_MAX_DELAY,
+    get_breaker,
+    is_retryable_status,
+    parse_retry_after,
+    retry_delay,
+)
+from src.storage import (
+    cache_weather,
+    load_last_known_weather,
+    acquire_api_fetch_lock,
+    release_api_fetch_lock,
+    wait_for_api_cache,
+    load_api_cache,
+    load_stale_api_cache,
+    save_api_cache,
+    get_stale_age,
+    load_geocode_cache,
+    save_geocode_cache,
+    get_api_cache_key,
+    get_parts_expiry,
+    normalize_city_name,
+)
+from src.singleflight import SingleFlight
 
 load_dotenv()
-API_KEY = os.getenv("API_KEY")
+API_KEY = os.getenv("API_KEY") or (API_KEYS[0] if API_KEYS else None)
 
+# Объединение одновременных одинаковых запросов к API
+_flights = SingleFlight()
 
-def request_with_retries(url: str, max_retries: int = 3) -> Optional[requests.Response]:
-    """HTTP-запрос с ретраями и экспоненциальной паузой при временных ошибках."""
-    backoff = 1
+# Сколько потоков выполняют пакетные запросы погоды (общий пул на процесс)
+BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", "8"))
+_batch_pool: Optional[ThreadPoolExecutor] = None
+_batch_pool_lock = threading.Lock()
+
+# Цель пакетного запроса: название города, координаты (lat, lon) или местоположение {"lat", "lon", ...}
+BatchTarget = Union[str, Tuple[float, float], Dict[str, Any]]
+
+# Фоновое обновление истёкших записей, отданных пользователю устаревшими
+REVALIDATE_WORKERS = 2
+_revalidate_pool: Optional[ThreadPoolExecutor] = None
+_revalidating: set = set()
+_revalidate_lock = threading.Lock()
+
+
+def request_with_retries(url: str, endpoint: str = "default", max_retries: int = 3) -> Optional[requests.Response]:
+    """HTTP-запрос с ретраями: пауза с full jitter, учёт Retry-After,
+    общий бюджет повторов и circuit breaker на endpoint (src/retry.py).
+
+    Ключ API (`appid`) подставляется менеджером квоты (src/quota.py) для каждой попытки.
+    Пауза выполняется в вызывающем потоке, поэтому запросы пользователей ждут не дольше
+    RETRY_INTERACTIVE_MAX_DELAY; фоновые задачи (предзагрузка, уведомления) — до RETRY_AFTER_MAX.
+    """
+    breaker = get_breaker(endpoint)
+    max_delay = RETRY_INTERACTIVE_MAX_DELAY if current_priority() <= PRIORITY_INTERACTIVE else RETRY_AFTER_MAX
     for attempt in range(1, max_retries + 1):
+        if not breaker.allow():
+            print(f"API {endpoint} временно недоступен, запрос пропущен")
+            return None
+        api_key = quota.acquire(endpoint)
+        if api_key is None:
+            print(f"Квота запросов к API исчерпана ({endpoint}), запрос пропущен")
+            return None
         try:
-            response = requests.get(url, timeout=10)
-            # 429 или временные ошибки 5xx — пытаемся повторить
-            if response.status_code == 429 or 500 <= response.status_code < 600:
-                print(f"Временная ошибка ({response.status_code}), попытка {attempt} из {max_retries}")
-                if attempt < max_retries:
-                    time.sleep(backoff)
-                    backoff *= 2
-                    continue
-            return response
+            response = http_get(f"{url}&appid={api_key}", timeout=10)
         except requests.RequestException as e:
+            breaker.record_failure()
             print(f"Сетевая ошибка: {e}, попытка {attempt} из {max_retries}")
-            if attempt < max_retries:
-                time.sleep(backoff)
-                backoff *= 2
-                continue
-            return None
+            delay = retry_delay(attempt, max_retries, max_delay=max_delay)
+            if delay is None:
+                return None
+            time.sleep(delay)
+            continue
+
+        # 429 или временные ошибки 5xx — пытаемся повторить
+        if is_retryable_status(response.status_code):
+            breaker.record_failure()
+            print(f"Временная ошибка ({response.status_code}), попытка {attempt} из {max_retries}")
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if response.status_code == 429:
+                quota.report_throttled(api_key, retry_after)
+            delay = retry_delay(attempt, max_retries, retry_after, max_delay)
+            if delay is None:
+                return response
+            time.sleep(delay)
+            continue
+
+        breaker.record_success()
+        return response
     return None
 
 
+def get_coalescing_stats() -> Dict[str, int]:
+    """Статистика объединения одинаковых запросов."""
+    return _flights.stats()
+
+
 def get_coordinates(city: str, limit: int = 1) -> Optional[List[Dict[str, Any]]]:
     """Получить до `limit` вариантов города (одноимённые города в разных регионах)."""
     if not API_KEY:
         print("Ошибка: переменная окружения API_KEY не установлена.")
         return None
 
-    url = f"https://api.openweathermap.org/geo/1.0/direct?q={city}&limit={limit}&appid={API_KEY}"
-    response = request_with_retries(url)
+    # Проверяем кэш геокодинга
+    cached = load_geocode_cache(city, limit)
+    if cached:
+        return cached
+
+    # Локальный справочник городов (если настроен GAZETTEER_PATH): сразу отвечаем только точным совпадением
+    local = lookup_city(city, limit)
+    if local:
+        return local
+
+    locations = _flights.do(("geo", normalize_city_name(city), limit), lambda: _fetch_coordinates(city, limit))
+    if locations:
+        return locations
+    # API города не нашёл или недоступен — пробуем похожие названия из справочника (опечатки)
+    return lookup_city(city, limit, fuzzy=True)
+
+
+def _fetch_coordinates(city: str, limit: int) -> Optional[List[Dict[str, Any]]]:
+    """Запрос к API геокодинга (без кэша)."""
+    url = f"https://api.openweathermap.org/geo/1.0/direct?q={city}&limit={limit}"
+    response = request_with_retries(url, "geo")
     if response is None:
         print("Не удалось выполнить запрос для получения координат.")
         return None
@@ -63,115 +157,265 @@ def get_coordinates(city: str, limit: int = 1) -> Optional[List[Dict[str, Any]]]
                     "lon": item["lon"],
                 }
             )
+        save_geocode_cache(city, limit, locations)
         return locations
 
     print(f"Не удалось получить координаты города: {response.status_code}")
     return None
 
 
-def get_weather_by_coordinates(latitude: float, longitude: float) -> Optional[Dict[str, Any]]:
-    """Получить погоду по координатам с API кэшированием (10 минут)."""
+# URL и название данных для сообщений об ошибках по endpoint API кэша
+_ENDPOINTS = {
+    "weather": (
+        "https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&units=metric&lang=ru",
+        "погоды",
+    ),
+    "forecast": (
+        "https://api.openweathermap.org/data/2.5/forecast?lat={lat}&lon={lon}&units=metric&lang=ru",
+        "почасового прогноза",
+    ),
+    "air_pollution": (
+        "http://api.openweathermap.org/data/2.5/air_pollution?lat={lat}&lon={lon}",
+        "данных о загрязнении воздуха",
+    ),
+}
+
+
+def _fetch_with_cache(latitude: float, longitude: float, endpoint: str,
+                      refresh: bool = False) -> Optional[Dict[str, Any]]:
+    """Запрос к endpoint с API кэшированием (10 минут).
+
+    Одновременные запросы одних и тех же данных объединяются: в сеть уходит
+    только первый, остальные ждут его результат. Если запись истекла, но ещё
+    не старше допустимого (API_CACHE_MAX_STALE_BY_ENDPOINT), она сразу
+    возвращается с отметкой об устаревании, а обновление идёт в фоне.
+    С `refresh=True` кэш не читается, а данные запрашиваются заново (для предзагрузки).
+    """
     if not API_KEY:
         print("Ошибка: переменная окружения API_KEY не установлена.")
         return None
 
-    # Проверяем API кэш
-    cached = load_api_cache(latitude, longitude, "weather")
-    if cached:
-        return cached
+    url_template, error_name = _ENDPOINTS[endpoint]
+    url = url_template.format(lat=latitude, lon=longitude)
+
+    if not refresh:
+        prefetcher.record(latitude, longitude, endpoint)
+        # Проверяем API кэш
+        cached = load_api_cache(latitude, longitude, endpoint)
+        if cached:
+            return cached
+        # Устаревшие данные отдаём сразу, свежие запрашиваем в фоне
+        stale = load_stale_api_cache(latitude, longitude, endpoint)
+        if stale:
+            _revalidate(latitude, longitude, endpoint)
+            return stale
+
+    def fetch() -> Optional[Dict[str, Any]]:
+        # Между проверкой кэша и стартом запроса данные мог сохранить другой поток
+        cached = None if refresh else load_api_cache(latitude, longitude, endpoint)
+        if cached:
+            return cached
+
+        # Те же данные может уже запрашивать другой процесс с общим кэшем — ждём его результат
+        token = acquire_api_fetch_lock(latitude, longitude, endpoint)
+        if token is None:
+            if refresh:
+                return None
+            cached = wait_for_api_cache(latitude, longitude, endpoint)
+            if cached:
+                return cached
+        try:
+            return request()
+        finally:
+            if token is not None:
+                release_api_fetch_lock(latitude, longitude, endpoint, token)
+
+    def request() -> Optional[Dict[str, Any]]:
+        response = request_with_retries(url, endpoint)
+        if response is None:
+            print(f"Не удалось выполнить запрос {error_name}.")
+            return None
 
-    url = (
-        "https://api.openweathermap.org/data/2.5/weather"
-        f"?lat={latitude}&lon={longitude}&appid={API_KEY}&units=metric&lang=ru"
-    )
-    response = request_with_retries(url)
-    if response is None:
-        print("Не удалось выполнить запрос погоды.")
+        if response.status_code == 200:
+            data = response.json()
+            # Сохраняем в API кэш
+            save_api_cache(latitude, longitude, endpoint, data)
+            return data
+
+        print(f"Ошибка при получении {error_name}: {response.status_code}")
         return None
 
-    if response.status_code == 200:
-        data = response.json()
-        # Сохраняем в API кэш
-        save_api_cache(latitude, longitude, "weather", data)
-        return data
+    return _flights.do(get_api_cache_key(latitude, longitude, endpoint), fetch)
 
-    print(f"Ошибка при получении погоды: {response.status_code}")
-    return None
+
+def refresh_api_cache(latitude: float, longitude: float, endpoint: str) -> Optional[Dict[str, Any]]:
+    """Заново запросить данные endpoint и обновить запись API кэша."""
+    return _fetch_with_cache(latitude, longitude, endpoint, refresh=True)
+
+
+def _revalidate(latitude: float, longitude: float, endpoint: str) -> None:
+    """Обновить истёкшую запись в фоне; одна и та же запись не обновляется дважды одновременно."""
+    global _revalidate_pool
+    key = get_api_cache_key(latitude, longitude, endpoint)
+    with _revalidate_lock:
+        if key in _revalidating:
+            return
+        _revalidating.add(key)
+        if _revalidate_pool is None:
+            _revalidate_pool = ThreadPoolExecutor(max_workers=REVALIDATE_WORKERS, thread_name_prefix="cache-revalidate")
+        pool = _revalidate_pool
+
+    def run() -> None:
+        try:
+            with request_priority(PRIORITY_BACKGROUND):
+                refresh_api_cache(latitude, longitude, endpoint)
+        except Exception as e:
+            print(f"Ошибка фонового обновления {endpoint}: {e}")
+        finally:
+            with _revalidate_lock:
+                _revalidating.discard(key)
+
+    pool.submit(run)
+
+
+# Предзагрузка популярных записей кэша (поток запускает бот)
+prefetcher = Prefetcher(refresh_api_cache)
+
+
+def get_weather_by_coordinates(latitude: float, longitude: float) -> Optional[Dict[str, Any]]:
+    """Получить погоду по координатам с API кэшированием (10 минут)."""
+    return _fetch_with_cache(latitude, longitude, "weather")
 
 
 def get_weather_with_cache(latitude: float, longitude: float) -> Optional[Dict[str, Any]]:
-    """Получить погоду с учётом кэша и предложения использовать старые данные при ошибке сети."""
+    """Получить погоду с учётом кэша; при ошибке сети — последние сохранённые данные.
+
+    Резервные данные (не старше 3 часов) возвращаются без вопросов пользователю,
+    для того же места и с отметкой об устаревании, как и в API кэше.
+    """
     weather = get_weather_by_coordinates(latitude, longitude)
     if weather is None:
-        cache = load_cache()
-        if cache and is_cache_fresh(cache):
-            choice = input("Не удалось получить свежие данные. Использовать данные из кэша (меньше 3 часов)? (y/n): ").strip().lower()
-            if choice == "y":
-                return cache.get("weather")
-        return None
+        return _load_fallback_weather(latitude, longitude)
 
-    cache_weather(weather.get("name"), latitude, longitude, weather)
+    if get_stale_age(weather) is None:
+        cache_weather(weather.get("name"), latitude, longitude, weather)
     return weather
 
 
-def get_hourly_weather(latitude: float, longitude: float) -> Optional[Dict[str, Any]]:
-    """Получить почасовой прогноз погоды на 5 дней с API кэшированием (10 минут)."""
-    if not API_KEY:
-        print("Ошибка: переменная окружения API_KEY не установлена.")
-        return None
-
-    # Проверяем API кэш
-    cached = load_api_cache(latitude, longitude, "forecast")
-    if cached:
-        return cached
-
-    url = (
-        "https://api.openweathermap.org/data/2.5/forecast"
-        f"?lat={latitude}&lon={longitude}&appid={API_KEY}&units=metric&lang=ru"
-    )
-    response = request_with_retries(url)
-    if response is None:
-        print("Не удалось выполнить запрос почасового прогноза.")
-        return None
+def _load_fallback_weather(latitude: float, longitude: float) -> Optional[Dict[str, Any]]:
+    weather = load_last_known_weather(latitude, longitude)
+    if weather is not None:
+        print("Не удалось получить свежие данные, используются сохранённые")
+    return weather
 
-    if response.status_code == 200:
-        data = response.json()
-        # Сохраняем в API кэш
-        save_api_cache(latitude, longitude, "forecast", data)
-        return data
 
-    print(f"Ошибка при получении почасового прогноза: {response.status_code}")
-    return None
+def get_hourly_weather(latitude: float, longitude: float) -> Optional[Dict[str, Any]]:
+    """Получить почасовой прогноз погоды на 5 дней с API кэшированием (10 минут)."""
+    return _fetch_with_cache(latitude, longitude, "forecast")
 
 
 def get_air_pollution(latitude: float, longitude: float) -> Optional[Dict[str, Any]]:
     """Получить данные о загрязнении воздуха с API кэшированием (10 минут)."""
-    if not API_KEY:
-        print("Ошибка: переменная окружения API_KEY не установлена.")
-        return None
-
-    # Проверяем API кэш
-    cached = load_api_cache(latitude, longitude, "air_pollution")
+    return _fetch_with_cache(latitude, longitude, "air_pollution")
+
+
+def _get_batch_pool() -> ThreadPoolExecutor:
+    global _batch_pool
+    with _batch_pool_lock:
+        if _batch_pool is None:
+            _batch_pool = ThreadPoolExecutor(max_workers=BATCH_MAX_WORKERS, thread_name_prefix="weather-batch")
+        return _batch_pool
+
+
+def _fetch_batch_target(target: BatchTarget) -> Dict[str, Any]:
+    item: Dict[str, Any] = {"target": target, "location": None, "weather": None, "error": None}
+    try:
+        if isinstance(target, str):
+            locations = get_coordinates(target)
+            if not locations:
+                item["error"] = "город не найден"
+                return item
+            location = locations[0]
+        elif isinstance(target, dict):
+            location = target
+        else:
+            location = {"lat": target[0], "lon": target[1]}
+        item["location"] = location
+
+        # При ошибке сети — последние сохранённые данные для этого места
+        weather = get_weather_with_cache(location["lat"], location["lon"])
+        if not weather:
+            item["error"] = "не удалось получить погоду"
+            return item
+        item["weather"] = weather
+    except Exception as e:
+        item["error"] = str(e)
+    return item
+
+
+def get_weather_batch(targets: Sequence[BatchTarget]) -> List[Dict[str, Any]]:
+    """Погода для нескольких городов или координат, запрошенная параллельно.
+
+    Возвращает по одному элементу на цель в том же порядке:
+    {"target", "location", "weather", "error"}. Ошибка одной цели не мешает
+    остальным — у неё заполнено поле "error", а "weather" равно None.
+    """
+    if not targets:
+        return []
+    if len(targets) == 1:
+        items = [_fetch_batch_target(targets[0])]
+    else:
+        items = list(_get_batch_pool().map(_fetch_batch_target, targets))
+
+    failed = [item for item in items if item["error"]]
+    if failed:
+        print(f"Не удалось получить погоду для {len(failed)} из {len(items)}: "
+              + ", ".join(f"{item['target']} ({item['error']})" for item in failed))
+    return items
+
+
+def get_extended_bundle(latitude: float, longitude: float,
+                        include_forecast: bool = False) -> Optional[Dict[str, Any]]:
+    """Текущая погода, качество воздуха и (по желанию) прогноз одним вызовом.
+
+    Части запрашиваются параллельно, а полный набор кэшируется одной составной
+    записью, так что повторный показ расширенных данных — одно чтение кэша.
+    Возвращает {"weather", "air_pollution"[, "forecast"]} или None без погоды.
+    """
+    endpoint = "extended_forecast" if include_forecast else "extended"
+    cached = load_api_cache(latitude, longitude, endpoint)
     if cached:
         return cached
 
-    url = (
-        "http://api.openweathermap.org/data/2.5/air_pollution"
-        f"?lat={latitude}&lon={longitude}&appid={API_KEY}"
-    )
-    response = request_with_retries(url)
-    if response is None:
-        print("Не удалось выполнить запрос данных о загрязнении воздуха.")
-        return None
+    def fetch() -> Optional[Dict[str, Any]]:
+        cached = load_api_cache(latitude, longitude, endpoint)
+        if cached:
+            return cached
 
-    if response.status_code == 200:
-        data = response.json()
-        # Сохраняем в API кэш
-        save_api_cache(latitude, longitude, "air_pollution", data)
-        return data
+        # Погода при ошибке сети берётся из последних сохранённых данных (такой набор не кэшируется)
+        parts = {"weather": get_weather_with_cache, "air_pollution": get_air_pollution}
+        if include_forecast:
+            parts["forecast"] = get_hourly_weather
+        pool = _get_batch_pool()
+        futures = {name: pool.submit(fn, latitude, longitude) for name, fn in parts.items()}
+        bundle = {name: future.result() for name, future in futures.items()}
 
-    print(f"Ошибка при получении данных о загрязнении воздуха: {response.status_code}")
-    return None
+        if not bundle["weather"]:
+            return None
+        # Неполный или устаревший набор не кэшируем: недостающая часть запросится в следующий раз
+        if all(part and get_stale_age(part) is None for part in bundle.values()):
+            save_extended_bundle(latitude, longitude, endpoint, bundle)
+        return bundle
+
+    return _flights.do(get_api_cache_key(latitude, longitude, endpoint), fetch)
+
+
+def save_extended_bundle(latitude: float, longitude: float, endpoint: str, bundle: Dict[str, Any]) -> None:
+    """Закэшировать набор расширенных данных со сроком самой ранней из его частей."""
+    # Составная запись истекает вместе с самой старой из частей, иначе она отдавала бы их как свежие
+    expires_at = get_parts_expiry(latitude, longitude, list(bundle))
+    if expires_at is not None and expires_at > time.time():
+        save_api_cache(latitude, longitude, endpoint, bundle, expires_at)
 
 
 def get_current_weather(city: str = None, latitude: float = None, longitude: float = None) -> Optional[Any]:
@@ -182,14 +426,12 @@ def get_current_weather(city: str = None, latitude: float = None, longitude: flo
             print("Не удалось получить координаты города")
             return None
 
-        weather_results: List[Dict[str, Any]] = []
-        for location in locations:
-            lat = location["lat"]
-            lon = location["lon"]
-            weather = get_weather_with_cache(lat, lon)
-            if weather:
-                weather_results.append({"location": location, "weather": weather})
-        return weather_results
+        # Все найденные варианты города запрашиваются параллельно
+        return [
+            {"location": item["location"], "weather": item["weather"]}
+            for item in get_weather_batch(locations)
+            if not item["error"]
+        ]
 
     if latitude is not None and longitude is not None:
         print(f"Получаем погоду для координат - {latitude}, {longitude}")
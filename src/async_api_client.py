@@ -0,0 +1,372 @@
+"""Асинхронный клиент OpenWeather API (aiohttp), повторяющий функции src.api_client."""
+
+import asyncio
+import os
+from typing import Optional, Dict, Any, List, Sequence, Tuple
+
+import aiohttp
+
+from src.api_client import API_KEY, BatchTarget, save_extended_bundle, prefetcher
+from src.gazetteer import lookup_city
+from src.quota import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, current_priority, quota, request_priority
+from src.retry import (
+    RETRY_AFTER_MAX,
+    RETRY_INTERACTIVE_MAX_DELAY,
+    get_breaker,
+    is_retryable_status,
+    parse_retry_after,
+    retry_delay,
+)
+from src.singleflight import AsyncSingleFlight
+from src.storage import (
+    API_CACHE_LOCK_POLL_SECONDS,
+    API_CACHE_LOCK_WAIT_SECONDS,
+    load_api_cache,
+    load_stale_api_cache,
+    save_api_cache,
+    get_stale_age,
+    cache_weather,
+    load_last_known_weather,
+    load_geocode_cache,
+    save_geocode_cache,
+    get_api_cache_key,
+    acquire_api_fetch_lock,
+    release_api_fetch_lock,
+)
+
+# Сколько запросов к API может выполняться одновременно
+MAX_CONCURRENCY = int(os.getenv("ASYNC_MAX_CONCURRENCY", "50"))
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=10)
+
+_session: Optional[aiohttp.ClientSession] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+# Объединение одновременных одинаковых запросов к API
+_flights = AsyncSingleFlight()
+# Фоновые обновления устаревших записей кэша (ссылки держим, чтобы задачи не собрал GC)
+_revalidate_tasks: Dict[str, asyncio.Task] = {}
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+    return _semaphore
+
+
+async def get_session() -> aiohttp.ClientSession:
+    """Общая aiohttp-сессия с пулом соединений (создаётся при первом запросе)."""
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(limit=MAX_CONCURRENCY, limit_per_host=MAX_CONCURRENCY)
+        _session = aiohttp.ClientSession(connector=connector, timeout=REQUEST_TIMEOUT)
+    return _session
+
+
+async def close_session() -> None:
+    """Закрыть общую сессию (вызывать при остановке event loop)."""
+    global _session, _semaphore
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+    _semaphore = None
+
+
+async def request_with_retries(url: str, endpoint: str = "default", max_retries: int = 3) -> Optional[Tuple[int, Any]]:
+    """HTTP-запрос с ретраями; пауза между попытками не блокирует event loop.
+
+    Политика повторов и учёт квоты те же, что у синхронного клиента (src/retry.py, src/quota.py);
+    квота сохраняется на диск, поэтому её вызовы выполняются в пуле потоков.
+    Возвращает пару (status, json) или None при сетевой ошибке.
+    """
+    breaker = get_breaker(endpoint)
+    # Обработчик пользователя не ждёт долгий Retry-After — как и в синхронном клиенте
+    max_delay = RETRY_INTERACTIVE_MAX_DELAY if current_priority() <= PRIORITY_INTERACTIVE else RETRY_AFTER_MAX
+    session = await get_session()
+    for attempt in range(1, max_retries + 1):
+        if not breaker.allow():
+            print(f"API {endpoint} временно недоступен, запрос пропущен")
+            return None
+        api_key = await asyncio.to_thread(quota.acquire, endpoint)
+        if api_key is None:
+            print(f"Квота запросов к API исчерпана ({endpoint}), запрос пропущен")
+            return None
+        try:
+            async with _get_semaphore():
+                async with session.get(f"{url}&appid={api_key}") as response:
+                    status = response.status
+                    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                    data = await response.json(content_type=None) if status == 200 else None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            breaker.record_failure()
+            print(f"Сетевая ошибка: {e}, попытка {attempt} из {max_retries}")
+            delay = retry_delay(attempt, max_retries, max_delay=max_delay)
+            if delay is None:
+                return None
+            await asyncio.sleep(delay)
+            continue
+
+        # 429 или временные ошибки 5xx — пытаемся повторить
+        if is_retryable_status(status):
+            breaker.record_failure()
+            print(f"Временная ошибка ({status}), попытка {attempt} из {max_retries}")
+            if status == 429:
+                await asyncio.to_thread(quota.report_throttled, api_key, retry_after)
+            delay = retry_delay(attempt, max_retries, retry_after, max_delay)
+            if delay is None:
+                return status, data
+            await asyncio.sleep(delay)
+            continue
+
+        breaker.record_success()
+        return status, data
+    return None
+
+
+async def get_coordinates(city: str, limit: int = 1) -> Optional[List[Dict[str, Any]]]:
+    """Получить до `limit` вариантов города (одноимённые города в разных регионах)."""
+    if not API_KEY:
+        print("Ошибка: переменная окружения API_KEY не установлена.")
+        return None
+
+    # Кэш и справочник читаются с диска (SQLite, файлы, Redis) — не в event loop
+    cached = await asyncio.to_thread(load_geocode_cache, city, limit)
+    if cached:
+        return cached
+
+    # Локальный справочник городов (если настроен GAZETTEER_PATH): сразу отвечаем только точным совпадением
+    local = await asyncio.to_thread(lookup_city, city, limit)
+    if local:
+        return local
+
+    locations = await _fetch_coordinates(city, limit)
+    if locations:
+        return locations
+    # API города не нашёл или недоступен — пробуем похожие названия из справочника (опечатки)
+    return await asyncio.to_thread(lookup_city, city, limit, True)
+
+
+async def _fetch_coordinates(city: str, limit: int) -> Optional[List[Dict[str, Any]]]:
+    """Запрос к API геокодинга (без кэша)."""
+    url = f"https://api.openweathermap.org/geo/1.0/direct?q={city}&limit={limit}"
+    result = await request_with_retries(url, "geo")
+    if result is None:
+        print("Не удалось выполнить запрос для получения координат.")
+        return None
+
+    status, data = result
+    if status == 200:
+        if not data:
+            print("Город не найден.")
+            return None
+
+        locations = [
+            {
+                "name": item.get("name"),
+                "state": item.get("state"),
+                "country": item.get("country"),
+                "lat": item["lat"],
+                "lon": item["lon"],
+            }
+            for item in data[:limit]
+        ]
+        await asyncio.to_thread(save_geocode_cache, city, limit, locations)
+        return locations
+
+    print(f"Не удалось получить координаты города: {status}")
+    return None
+
+
+async def _get_cached_endpoint(latitude: float, longitude: float, endpoint: str,
+                               url: str, error_name: str) -> Optional[Dict[str, Any]]:
+    """Общая логика запроса с API кэшированием (10 минут).
+
+    Истёкшая, но ещё допустимая запись возвращается сразу, а обновление
+    запускается фоновой задачей (stale-while-revalidate). Обращения к хранилищу
+    кэша выполняются в пуле потоков, чтобы не блокировать event loop.
+    """
+    if not API_KEY:
+        print("Ошибка: переменная окружения API_KEY не установлена.")
+        return None
+
+    prefetcher.record(latitude, longitude, endpoint)
+    cached = await asyncio.to_thread(load_api_cache, latitude, longitude, endpoint)
+    if cached:
+        return cached
+
+    async def fetch() -> Optional[Dict[str, Any]]:
+        # Те же данные может уже запрашивать другой процесс с общим кэшем — ждём его результат
+        token = await asyncio.to_thread(acquire_api_fetch_lock, latitude, longitude, endpoint)
+        if token is None:
+            cached = await _wait_for_api_cache(latitude, longitude, endpoint)
+            if cached:
+                return cached
+        try:
+            return await request()
+        finally:
+            if token is not None:
+                await asyncio.to_thread(release_api_fetch_lock, latitude, longitude, endpoint, token)
+
+    async def request() -> Optional[Dict[str, Any]]:
+        result = await request_with_retries(url, endpoint)
+        if result is None:
+            print(f"Не удалось выполнить запрос {error_name}.")
+            return None
+
+        status, data = result
+        if status == 200:
+            await asyncio.to_thread(save_api_cache, latitude, longitude, endpoint, data)
+            return data
+
+        print(f"Ошибка при получении {error_name}: {status}")
+        return None
+
+    cache_key = get_api_cache_key(latitude, longitude, endpoint)
+    stale = await asyncio.to_thread(load_stale_api_cache, latitude, longitude, endpoint)
+    if stale:
+        if cache_key not in _revalidate_tasks:
+            # Задача копирует контекст при создании — и вместе с ним фоновый приоритет квоты
+            with request_priority(PRIORITY_BACKGROUND):
+                task = asyncio.ensure_future(_flights.do(cache_key, fetch))
+            _revalidate_tasks[cache_key] = task
+            task.add_done_callback(lambda _: _revalidate_tasks.pop(cache_key, None))
+        return stale
+
+    return await _flights.do(cache_key, fetch)
+
+
+async def _wait_for_api_cache(latitude: float, longitude: float, endpoint: str) -> Optional[Dict[str, Any]]:
+    """Асинхронный аналог storage.wait_for_api_cache."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + API_CACHE_LOCK_WAIT_SECONDS
+    while loop.time() < deadline:
+        await asyncio.sleep(API_CACHE_LOCK_POLL_SECONDS)
+        cached = await asyncio.to_thread(load_api_cache, latitude, longitude, endpoint)
+        if cached:
+            return cached
+    return None
+
+
+async def get_weather_by_coordinates(latitude: float, longitude: float) -> Optional[Dict[str, Any]]:
+    """Получить погоду по координатам с API кэшированием (10 минут)."""
+    url = (
+        "https://api.openweathermap.org/data/2.5/weather"
+        f"?lat={latitude}&lon={longitude}&units=metric&lang=ru"
+    )
+    return await _get_cached_endpoint(latitude, longitude, "weather", url, "погоды")
+
+
+async def get_weather_with_cache(latitude: float, longitude: float) -> Optional[Dict[str, Any]]:
+    """Асинхронный аналог api_client.get_weather_with_cache: при ошибке сети — последние сохранённые данные."""
+    weather = await get_weather_by_coordinates(latitude, longitude)
+    if weather is None:
+        weather = await asyncio.to_thread(load_last_known_weather, latitude, longitude)
+        if weather is not None:
+            print("Не удалось получить свежие данные, используются сохранённые")
+        return weather
+
+    if get_stale_age(weather) is None:
+        await asyncio.to_thread(cache_weather, weather.get("name"), latitude, longitude, weather)
+    return weather
+
+
+async def get_hourly_weather(latitude: float, longitude: float) -> Optional[Dict[str, Any]]:
+    """Получить почасовой прогноз погоды на 5 дней с API кэшированием (10 минут)."""
+    url = (
+        "https://api.openweathermap.org/data/2.5/forecast"
+        f"?lat={latitude}&lon={longitude}&units=metric&lang=ru"
+    )
+    return await _get_cached_endpoint(latitude, longitude, "forecast", url, "почасового прогноза")
+
+
+async def get_air_pollution(latitude: float, longitude: float) -> Optional[Dict[str, Any]]:
+    """Получить данные о загрязнении воздуха с API кэшированием (10 минут)."""
+    url = (
+        "http://api.openweathermap.org/data/2.5/air_pollution"
+        f"?lat={latitude}&lon={longitude}"
+    )
+    return await _get_cached_endpoint(latitude, longitude, "air_pollution", url, "данных о загрязнении воздуха")
+
+
+async def get_extended_bundle(latitude: float, longitude: float,
+                              include_forecast: bool = False) -> Optional[Dict[str, Any]]:
+    """Асинхронный аналог api_client.get_extended_bundle."""
+    endpoint = "extended_forecast" if include_forecast else "extended"
+    cached = await asyncio.to_thread(load_api_cache, latitude, longitude, endpoint)
+    if cached:
+        return cached
+
+    async def fetch() -> Optional[Dict[str, Any]]:
+        # Погода при ошибке сети берётся из последних сохранённых данных (такой набор не кэшируется)
+        parts = {"weather": get_weather_with_cache, "air_pollution": get_air_pollution}
+        if include_forecast:
+            parts["forecast"] = get_hourly_weather
+        results = await asyncio.gather(*(fn(latitude, longitude) for fn in parts.values()))
+        bundle = dict(zip(parts, results))
+
+        if not bundle["weather"]:
+            return None
+        if all(part and get_stale_age(part) is None for part in bundle.values()):
+            await asyncio.to_thread(save_extended_bundle, latitude, longitude, endpoint, bundle)
+        return bundle
+
+    return await _flights.do(get_api_cache_key(latitude, longitude, endpoint), fetch)
+
+
+async def _fetch_batch_target(target: BatchTarget) -> Dict[str, Any]:
+    item: Dict[str, Any] = {"target": target, "location": None, "weather": None, "error": None}
+    try:
+        if isinstance(target, str):
+            locations = await get_coordinates(target)
+            if not locations:
+                item["error"] = "город не найден"
+                return item
+            location = locations[0]
+        elif isinstance(target, dict):
+            location = target
+        else:
+            location = {"lat": target[0], "lon": target[1]}
+        item["location"] = location
+
+        # При ошибке сети — последние сохранённые данные для этого места
+        weather = await get_weather_with_cache(location["lat"], location["lon"])
+        if not weather:
+            item["error"] = "не удалось получить погоду"
+            return item
+        item["weather"] = weather
+    except Exception as e:
+        item["error"] = str(e)
+    return item
+
+
+async def get_weather_batch(targets: Sequence[BatchTarget]) -> List[Dict[str, Any]]:
+    """Асинхронный аналог api_client.get_weather_batch.
+
+    Параллельность ограничена общим семафором запросов (ASYNC_MAX_CONCURRENCY).
+    """
+    items = list(await asyncio.gather(*(_fetch_batch_target(target) for target in targets)))
+    failed = [item for item in items if item["error"]]
+    if failed:
+        print(f"Не удалось получить погоду для {len(failed)} из {len(items)}: "
+              + ", ".join(f"{item['target']} ({item['error']})" for item in failed))
+    return items
+
+
+async def get_current_weather(city: str = None, latitude: float = None, longitude: float = None) -> Optional[Any]:
+    """Асинхронный аналог api_client.get_current_weather."""
+    if city:
+        locations = await get_coordinates(city)
+        if not locations:
+            print("Не удалось получить координаты города")
+            return None
+
+        return [
+            {"location": item["location"], "weather": item["weather"]}
+            for item in await get_weather_batch(locations)
+            if not item["error"]
+        ]
+
+    if latitude is not None and longitude is not None:
+        return await get_weather_with_cache(latitude, longitude)
+
+    print("Необходимо указать либо город, либо координаты.")
+    return None
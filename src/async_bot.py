@@ -0,0 +1,615 @@
+"""Асинхронный режим Telegram-бота (AsyncTeleBot + aiohttp-клиент OpenWeather).
+
+Обработчики не блокируют друг друга на HTTP-запросах: медленный ответ OpenWeather
+задерживает только своего пользователя. Уведомления проверяются в том же event loop.
+"""
+
+import asyncio
+import functools
+import os
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from dotenv import load_dotenv
+from telebot.async_telebot import AsyncTeleBot
+
+from src.api_client import prefetcher
+from src.async_api_client import (
+    close_session,
+    get_coordinates,
+    get_current_weather,
+    get_extended_bundle,
+    get_hourly_weather,
+    get_weather_batch,
+    get_weather_by_coordinates,
+)
+from src.bot_views import (
+    WELCOME_TEXT,
+    CITY_NOT_FOUND_HINT,
+    get_main_keyboard,
+    get_location_keyboard,
+    format_current_weather,
+    current_weather_texts,
+    build_forecast_days_view,
+    build_day_details_view,
+    build_notifications_menu,
+    parse_compare_input,
+    format_batch_failures,
+    format_comparison,
+    build_extended_menu,
+    format_extended_data,
+    build_inline_not_found,
+    build_inline_error,
+    build_inline_results,
+)
+from src.forecast import ParsedForecast, get_cached_forecast, parse_forecast
+from src.inline import AsyncInlineEngine
+from src.notifications import run_notifications_async
+from src.outbound import OutboundQueue, PRIORITY_BROADCAST
+from src.storage import load_bot_users
+from src.subscribers import SubscriberIndex
+from src.write_behind import WriteBehindWriter
+
+load_dotenv()
+BOT_TOKEN = os.getenv("BOT_TOKEN")
+if not BOT_TOKEN:
+    print("Ошибка: BOT_TOKEN не установлен.")
+    raise SystemExit(1)
+
+# Сколько обработчиков может выполняться одновременно
+BOT_MAX_CONCURRENT_HANDLERS = int(os.getenv("BOT_MAX_CONCURRENT_HANDLERS", "100"))
+# Интервал проверки погоды для уведомлений
+NOTIFICATION_INTERVAL_SECONDS = 2 * 60 * 60
+
+bot = AsyncTeleBot(BOT_TOKEN)
+# Исходящие сообщения: общие лимиты Telegram, приоритет ответов над рассылкой, пауза при 429
+outbound = OutboundQueue()
+
+# Хранилище данных пользователей
+user_data = load_bot_users()
+# Изменения пользователей записываются на диск пакетами в фоне
+user_writer = WriteBehindWriter(user_data)
+# Подписчики уведомлений по ячейкам прогноза
+subscribers = SubscriberIndex(user_data)
+# Inline-режим: кэш результатов, подсказки по префиксу, отмена устаревших запросов
+inline_engine = AsyncInlineEngine(lambda city: get_current_weather(city=city))
+
+# Ожидаемый следующий шаг диалога: chat_id -> обработчик следующего текстового сообщения
+next_steps: Dict[int, Callable[[Any], Awaitable[None]]] = {}
+
+_handler_slots: Optional[asyncio.Semaphore] = None
+
+
+def limited(handler: Callable[..., Awaitable[None]]) -> Callable[..., Awaitable[None]]:
+    """Ограничить число одновременно выполняющихся обработчиков."""
+    @functools.wraps(handler)
+    async def wrapper(*args, **kwargs):
+        global _handler_slots
+        if _handler_slots is None:
+            _handler_slots = asyncio.Semaphore(BOT_MAX_CONCURRENT_HANDLERS)
+        async with _handler_slots:
+            await handler(*args, **kwargs)
+    return wrapper
+
+
+async def send_message(chat_id, text, **kwargs):
+    """Отправить сообщение через очередь (ответы пользователю идут вне очереди рассылок)."""
+    return await outbound.call_async(chat_id, bot.send_message, chat_id, text, **kwargs)
+
+
+async def edit_message_text(text, chat_id, message_id, **kwargs):
+    """Изменить сообщение через очередь (учитывается в лимите чата)."""
+    return await outbound.call_async(chat_id, bot.edit_message_text, text, chat_id, message_id, **kwargs)
+
+
+async def mark_dirty(user_id: str) -> None:
+    """Отметить пользователя изменённым; при BOT_USERS_FSYNC=always запись идёт сразу, поэтому вне event loop."""
+    await asyncio.to_thread(user_writer.mark_dirty, user_id)
+
+
+async def send_main_menu(chat_id, text: str = "Выберите действие:"):
+    """Показать главное меню."""
+    await send_message(chat_id, text, reply_markup=get_main_keyboard())
+
+
+async def ask_next_step(chat_id, text: str, step: Callable[[Any], Awaitable[None]], **kwargs):
+    """Задать вопрос и передать следующий ответ пользователя в `step`."""
+    await send_message(chat_id, text, **kwargs)
+    next_steps[chat_id] = step
+
+
+async def get_parsed_forecast(latitude: float, longitude: float) -> Optional[ParsedForecast]:
+    """Получить прогноз асинхронным клиентом и вернуть его в разобранном виде."""
+    parsed = get_cached_forecast(latitude, longitude)
+    if parsed is not None:
+        return parsed
+    forecast = await get_hourly_weather(latitude, longitude)
+    # Срок записи для разобранного прогноза читается из хранилища кэша — не в event loop
+    return await asyncio.to_thread(parse_forecast, latitude, longitude, forecast)
+
+
+# ============================================================================
+# ГЛАВНОЕ МЕНЮ
+# ============================================================================
+
+@bot.message_handler(commands=['start', 'help', 'menu'])
+@limited
+async def send_welcome(message):
+    """Обработчик команд /start, /help и /menu."""
+    next_steps.pop(message.chat.id, None)
+    user_id = str(message.from_user.id)
+    if user_id not in user_data:
+        user_data[user_id] = {
+            "location": None,
+            "notifications": False,
+            "last_weather": None
+        }
+        await mark_dirty(user_id)
+
+    await send_message(
+        message.chat.id,
+        WELCOME_TEXT,
+        parse_mode="Markdown",
+        reply_markup=get_main_keyboard()
+    )
+
+
+@bot.message_handler(func=lambda message: message.chat.id in next_steps, content_types=['text'])
+@limited
+async def handle_next_step(message):
+    """Передать ответ пользователя ожидающему шагу диалога."""
+    step = next_steps.pop(message.chat.id)
+    await step(message)
+
+
+@bot.callback_query_handler(func=lambda call: call.data == "menu_weather")
+@limited
+async def request_current_weather_callback(call):
+    """Запрос текущей погоды через callback."""
+    await bot.answer_callback_query(call.id)
+    await ask_next_step(call.message.chat.id, "Введите название города:", show_current_weather)
+
+
+# ============================================================================
+# 1. ТЕКУЩАЯ ПОГОДА ПО ГОРОДУ
+# ============================================================================
+
+async def show_current_weather(message):
+    """Показать текущую погоду."""
+    city = message.text.strip()
+
+    if not city:
+        await send_message(
+            message.chat.id,
+            "❌ Название города не может быть пустым. Попробуйте еще раз."
+        )
+        await send_main_menu(message.chat.id)
+        return
+
+    await send_message(message.chat.id, "⏳ Получаю данные...")
+
+    weather = await get_current_weather(city=city)
+
+    if not weather:
+        await send_message(
+            message.chat.id,
+            f"❌ Город '{city}' не найден.\n\n{CITY_NOT_FOUND_HINT}"
+        )
+        await send_main_menu(message.chat.id)
+        return
+
+    for text in current_weather_texts(weather):
+        await send_message(message.chat.id, text, parse_mode="Markdown")
+
+    await send_main_menu(message.chat.id)
+
+
+# ============================================================================
+# 2. ПРОГНОЗ НА 5 ДНЕЙ С INLINE-КЛАВИАТУРОЙ
+# ============================================================================
+
+@bot.callback_query_handler(func=lambda call: call.data == "menu_forecast")
+@limited
+async def request_forecast_callback(call):
+    """Запрос прогноза на 5 дней через callback."""
+    await bot.answer_callback_query(call.id)
+    chat_id = call.message.chat.id
+    user_id = str(chat_id)
+
+    if user_id not in user_data or not user_data[user_id].get("location"):
+        await send_message(
+            chat_id,
+            "❌ Сначала отправьте ваше местоположение.\n\n"
+            "Нажмите кнопку '📍 Отправить местоположение' в меню ниже."
+        )
+        await send_main_menu(chat_id)
+        return
+
+    location = user_data[user_id]["location"]
+    await send_message(chat_id, "⏳ Получаю прогноз...")
+
+    forecast = await get_parsed_forecast(location["lat"], location["lon"])
+    if not forecast:
+        await send_message(chat_id, "❌ Не удалось получить прогноз погоды.")
+        return
+
+    await show_forecast_days(chat_id, forecast)
+
+
+async def show_forecast_days(chat_id: int, forecast: ParsedForecast, message_id: int = None):
+    """Показать дни прогноза."""
+    view = build_forecast_days_view(forecast)
+    if view is None:
+        await send_message(chat_id, "❌ Нет данных прогноза")
+        return
+
+    text, keyboard = view
+    if message_id:
+        await edit_message_text(text, chat_id, message_id, parse_mode="Markdown", reply_markup=keyboard)
+    else:
+        await send_message(chat_id, text, parse_mode="Markdown", reply_markup=keyboard)
+
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith("day_"))
+@limited
+async def show_day_details(call):
+    """Показать детали дня."""
+    date = call.data.split("_")[1]
+    user_id = str(call.from_user.id)
+
+    if user_id not in user_data or not user_data[user_id].get("location"):
+        await bot.answer_callback_query(call.id, "❌ Местоположение не сохранено")
+        return
+
+    location = user_data[user_id]["location"]
+    forecast = await get_parsed_forecast(location["lat"], location["lon"])
+
+    if not forecast:
+        await bot.answer_callback_query(call.id, "❌ Ошибка получения данных")
+        return
+
+    view = build_day_details_view(forecast, date)
+    if view is None:
+        await bot.answer_callback_query(call.id, "❌ Нет данных")
+        return
+
+    text, keyboard = view
+    await edit_message_text(
+        text,
+        call.message.chat.id,
+        call.message.message_id,
+        parse_mode="Markdown",
+        reply_markup=keyboard
+    )
+    await bot.answer_callback_query(call.id)
+
+
+@bot.callback_query_handler(func=lambda call: call.data == "back_to_days")
+@limited
+async def back_to_days(call):
+    """Вернуться к списку дней."""
+    user_id = str(call.from_user.id)
+
+    if user_id not in user_data or not user_data[user_id].get("location"):
+        await bot.answer_callback_query(call.id, "❌ Местоположение не сохранено")
+        return
+
+    location = user_data[user_id]["location"]
+    forecast = await get_parsed_forecast(location["lat"], location["lon"])
+
+    if forecast:
+        await show_forecast_days(call.message.chat.id, forecast, call.message.message_id)
+
+    await bot.answer_callback_query(call.id)
+
+
+@bot.callback_query_handler(func=lambda call: call.data == "close")
+@limited
+async def close_inline(call):
+    """Закрыть inline-сообщение."""
+    await bot.delete_message(call.message.chat.id, call.message.message_id)
+    await bot.answer_callback_query(call.id)
+
+
+# ============================================================================
+# 3. ПОИСК ПО ГЕОЛОКАЦИИ
+# ============================================================================
+
+@bot.callback_query_handler(func=lambda call: call.data == "menu_location")
+@limited
+async def request_location_callback(call):
+    """Запрос отправки местоположения."""
+    await bot.answer_callback_query(call.id)
+    await send_message(
+        call.message.chat.id,
+        "Нажмите кнопку ниже, чтобы отправить ваше местоположение:",
+        reply_markup=get_location_keyboard()
+    )
+
+
+@bot.message_handler(content_types=['location'])
+@limited
+async def handle_location(message):
+    """Обработка геолокации."""
+    user_id = str(message.from_user.id)
+
+    latitude = message.location.latitude
+    longitude = message.location.longitude
+
+    # Проверяем, для чего отправлена геолокация
+    if user_id in user_data and user_data[user_id].get("waiting_for_extended"):
+        user_data[user_id]["waiting_for_extended"] = False
+        await mark_dirty(user_id)
+
+        await send_message(message.chat.id, "⏳ Получаю данные...")
+        await show_extended_data(message.chat.id, latitude, longitude)
+        return
+
+    # Сохраняем координаты
+    if user_id not in user_data:
+        user_data[user_id] = {}
+
+    previous = user_data[user_id].get("location")
+    user_data[user_id]["location"] = {
+        "lat": latitude,
+        "lon": longitude
+    }
+    await mark_dirty(user_id)
+    subscribers.update(user_id, user_data[user_id])
+    # Предзагрузка держит свежим только текущее местоположение пользователя
+    if previous:
+        prefetcher.unpin(previous["lat"], previous["lon"])
+    prefetcher.pin(latitude, longitude)
+
+    await send_message(
+        message.chat.id,
+        f"✅ Местоположение сохранено!\n📍 Координаты: {latitude:.4f}, {longitude:.4f}\n\n⏳ Получаю погоду..."
+    )
+
+    weather = await get_weather_by_coordinates(latitude, longitude)
+
+    if weather:
+        await send_message(message.chat.id, format_current_weather(weather), parse_mode="Markdown")
+    else:
+        await send_message(message.chat.id, "❌ Не удалось получить погоду")
+
+    await send_main_menu(
+        message.chat.id,
+        "Теперь вы можете использовать 'Прогноз на 5 дней'! 📅\n\nВыберите действие:"
+    )
+
+
+# ============================================================================
+# 4. ПОГОДНЫЕ УВЕДОМЛЕНИЯ
+# ============================================================================
+
+@bot.callback_query_handler(func=lambda call: call.data == "menu_notifications")
+@limited
+async def notifications_menu_callback(call):
+    """Меню уведомлений через callback."""
+    await bot.answer_callback_query(call.id)
+    chat_id = call.message.chat.id
+    user_id = str(chat_id)
+
+    if user_id not in user_data:
+        user_data[user_id] = {"notifications": False, "location": None}
+        await mark_dirty(user_id)
+
+    text, keyboard = build_notifications_menu(bool(user_data[user_id].get("notifications")))
+    await send_message(chat_id, text, parse_mode="Markdown", reply_markup=keyboard)
+
+
+@bot.callback_query_handler(func=lambda call: call.data == "toggle_notifications")
+@limited
+async def toggle_notifications(call):
+    """Переключить уведомления."""
+    user_id = str(call.from_user.id)
+
+    if user_id not in user_data:
+        user_data[user_id] = {"notifications": False, "location": None}
+
+    if not user_data[user_id].get("location"):
+        await bot.answer_callback_query(call.id, "❌ Сначала отправьте местоположение!", show_alert=True)
+        return
+
+    user_data[user_id]["notifications"] = not user_data[user_id].get("notifications", False)
+    await mark_dirty(user_id)
+    subscribers.update(user_id, user_data[user_id])
+
+    status = "включены" if user_data[user_id]["notifications"] else "выключены"
+
+    await bot.answer_callback_query(call.id, f"✅ Уведомления {status}")
+    await bot.delete_message(call.message.chat.id, call.message.message_id)
+    await send_main_menu(call.message.chat.id, f"🔔 Уведомления {status}!\n\nВыберите действие:")
+
+
+async def check_weather_notifications():
+    """Проверка погоды для уведомлений: все ячейки параллельно, рассылка через очередь исходящих."""
+    await run_notifications_async(
+        subscribers.groups(),
+        get_parsed_forecast,
+        get_weather_by_coordinates,
+        lambda chat_id, text: outbound.submit_async(
+            chat_id, bot.send_message, chat_id, text,
+            priority=PRIORITY_BROADCAST, parse_mode="Markdown"
+        ),
+    )
+
+
+async def run_scheduler():
+    """Планировщик уведомлений внутри event loop."""
+    while True:
+        await asyncio.sleep(NOTIFICATION_INTERVAL_SECONDS)
+        try:
+            await check_weather_notifications()
+        except Exception as e:
+            print(f"Ошибка проверки уведомлений: {e}")
+
+
+# ============================================================================
+# 5. СРАВНЕНИЕ ГОРОДОВ
+# ============================================================================
+
+@bot.callback_query_handler(func=lambda call: call.data == "menu_compare")
+@limited
+async def request_compare_cities_callback(call):
+    """Запрос сравнения городов через callback."""
+    await bot.answer_callback_query(call.id)
+    await ask_next_step(
+        call.message.chat.id,
+        "Введите два города через запятую\nНапример: *Москва, Санкт-Петербург*",
+        compare_cities,
+        parse_mode="Markdown"
+    )
+
+
+async def compare_cities(message):
+    """Сравнить погоду в двух городах (оба города запрашиваются одновременно)."""
+    cities, error = parse_compare_input(message.text.strip())
+
+    if error:
+        await send_message(message.chat.id, error)
+        await send_main_menu(message.chat.id)
+        return
+
+    await send_message(message.chat.id, "⏳ Получаю данные...")
+
+    first, second = await get_weather_batch(cities)
+
+    failures = format_batch_failures([first, second])
+    if failures:
+        await send_message(message.chat.id, failures)
+        return
+
+    text = format_comparison(cities[0], first["weather"], cities[1], second["weather"])
+    await send_message(message.chat.id, text, parse_mode="Markdown")
+    await send_main_menu(message.chat.id)
+
+
+# ============================================================================
+# 6. РАСШИРЕННЫЕ ДАННЫЕ
+# ============================================================================
+
+@bot.callback_query_handler(func=lambda call: call.data == "menu_extended")
+@limited
+async def request_extended_data_callback(call):
+    """Запрос расширенных данных через callback."""
+    await bot.answer_callback_query(call.id)
+    await send_message(call.message.chat.id, "Выберите способ поиска:", reply_markup=build_extended_menu())
+
+
+@bot.callback_query_handler(func=lambda call: call.data == "extended_city")
+@limited
+async def request_extended_city(call):
+    """Запрос города для расширенных данных."""
+    await bot.answer_callback_query(call.id)
+    await ask_next_step(call.message.chat.id, "Введите название города:", show_extended_by_city)
+
+
+@bot.callback_query_handler(func=lambda call: call.data == "extended_location")
+@limited
+async def request_extended_location(call):
+    """Запрос местоположения для расширенных данных."""
+    await bot.answer_callback_query(call.id)
+    user_id = str(call.from_user.id)
+
+    if user_id not in user_data:
+        user_data[user_id] = {}
+    user_data[user_id]["waiting_for_extended"] = True
+    await mark_dirty(user_id)
+
+    await send_message(
+        call.message.chat.id,
+        "Нажмите кнопку ниже, чтобы отправить ваше местоположение:",
+        reply_markup=get_location_keyboard()
+    )
+
+
+async def show_extended_by_city(message):
+    """Показать расширенные данные по городу."""
+    city = message.text.strip()
+
+    await send_message(message.chat.id, "⏳ Получаю данные...")
+
+    locations = await get_coordinates(city)
+    if not locations:
+        await send_message(message.chat.id, "❌ Город не найден")
+        await send_main_menu(message.chat.id)
+        return
+
+    location = locations[0]
+    await show_extended_data(message.chat.id, location["lat"], location["lon"], city)
+
+
+async def show_extended_data(chat_id: int, lat: float, lon: float, city_name: str = None):
+    """Показать все расширенные данные (погода и воздух запрашиваются одновременно)."""
+    bundle = await get_extended_bundle(lat, lon)
+
+    if not bundle:
+        await send_message(chat_id, "❌ Не удалось получить данные о погоде")
+        return
+
+    text = format_extended_data(bundle["weather"], bundle["air_pollution"], lat, lon, city_name)
+    await send_message(chat_id, text, parse_mode="Markdown")
+    await send_main_menu(chat_id)
+
+
+# ============================================================================
+# INLINE-РЕЖИМ
+# ============================================================================
+
+@bot.inline_handler(lambda query: len(query.query) > 0)
+@limited
+async def inline_query_handler(query):
+    """Обработчик inline-запросов."""
+    city = query.query.strip()
+
+    if not city:
+        return
+
+    try:
+        # Ответ из кэша или после запроса к API; устаревшие запросы пользователя не отвечаются
+        answer = await inline_engine.resolve(query.from_user.id, city)
+        if answer is None:
+            return
+
+        weather, exact = answer
+        if not weather:
+            # Город не найден
+            await bot.answer_inline_query(query.id, [build_inline_not_found(city)], cache_time=60)
+            return
+
+        # Подсказки по префиксу не кэшируем в Telegram: точный ответ придёт на следующий запрос
+        await bot.answer_inline_query(query.id, build_inline_results(city, weather), cache_time=600 if exact else 0)
+    except Exception as e:
+        print(f"Ошибка в inline-режиме: {e}")
+        await bot.answer_inline_query(query.id, [build_inline_error()], cache_time=60)
+
+
+# ============================================================================
+# ЗАПУСК БОТА
+# ============================================================================
+
+async def run_bot():
+    """Запуск polling и планировщика уведомлений в одном event loop."""
+    scheduler = asyncio.create_task(run_scheduler())
+    # Предзагрузка работает в отдельном потоке через синхронный клиент и общий кэш
+    prefetcher.pin_locations(data["location"] for data in user_data.values() if data.get("location"))
+    prefetcher.start()
+    try:
+        await bot.infinity_polling()
+    finally:
+        scheduler.cancel()
+        prefetcher.stop()
+        await close_session()
+        user_writer.stop()
+
+
+def main():
+    """Главная функция запуска бота в асинхронном режиме."""
+    print("🤖 Бот запущен (асинхронный режим)!")
+    print("📍 Inline-режим активен")
+    asyncio.run(run_bot())
+
+
+if __name__ == "__main__":
+    main()
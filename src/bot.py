@@ -3,19 +3,42 @@ import os
 import schedule
 import time
 import threading
-from datetime import datetime
-from typing import Dict, Any, Optional
 from dotenv import load_dotenv
-from telebot import types
 
 from src.api_client import (
     get_coordinates,
     get_weather_by_coordinates,
-    get_hourly_weather,
-    get_air_pollution,
-    get_current_weather
+    get_current_weather,
+    get_extended_bundle,
+    get_weather_batch,
+    prefetcher,
 )
-from src.storage import load_bot_users, save_bot_users
+from src.bot_views import (
+    WELCOME_TEXT,
+    CITY_NOT_FOUND_HINT,
+    get_main_keyboard,
+    get_location_keyboard,
+    format_current_weather,
+    current_weather_texts,
+    build_forecast_days_view,
+    build_day_details_view,
+    build_notifications_menu,
+    parse_compare_input,
+    format_batch_failures,
+    format_comparison,
+    build_extended_menu,
+    format_extended_data,
+    build_inline_not_found,
+    build_inline_error,
+    build_inline_results,
+)
+from src.forecast import ParsedForecast, get_parsed_forecast
+from src.inline import InlineEngine
+from src.notifications import run_notifications
+from src.outbound import OutboundQueue, PRIORITY_BROADCAST
+from src.storage import load_bot_users
+from src.subscribers import SubscriberIndex
+from src.write_behind import WriteBehindWriter
 
 load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
@@ -25,34 +48,41 @@ if not BOT_TOKEN:
 
 bot = telebot.TeleBot(BOT_TOKEN)
 
+# Очередь исходящих сообщений с ограничением скорости
+outbound = OutboundQueue()
+
 # Хранилище данных пользователей
 user_data = load_bot_users()
+# Изменения пользователей записываются на диск пакетами в фоне
+user_writer = WriteBehindWriter(user_data)
+# Подписчики уведомлений по ячейкам прогноза
+subscribers = SubscriberIndex(user_data)
+# Inline-режим: кэш результатов, подсказки по префиксу, отмена устаревших запросов
+inline_engine = InlineEngine(lambda city: get_current_weather(city=city))
 
 
 # ============================================================================
-# ГЛАВНОЕ МЕНЮ
+# ОТПРАВКА СООБЩЕНИЙ
 # ============================================================================
 
-def get_main_keyboard():
-    """Главная inline-клавиатура с фиксированной шириной кнопок."""
-    # Используем неразрывные пробелы (U+00A0) для выравнивания ширины кнопок
-    nbsp = '\u00A0'  # Неразрывный пробел
-    
-    keyboard = types.InlineKeyboardMarkup()
-    keyboard.row(
-        types.InlineKeyboardButton(f"☀️ Текущая погода{nbsp * 6}", callback_data="menu_weather"),
-        types.InlineKeyboardButton(f"📅 Прогноз на 5 дней{nbsp * 3}", callback_data="menu_forecast")
-    )
-    keyboard.row(
-        types.InlineKeyboardButton("📍 Отправить местоположение", callback_data="menu_location"),
-        types.InlineKeyboardButton(f"🔔 Уведомления{nbsp * 9}", callback_data="menu_notifications")
-    )
-    keyboard.row(
-        types.InlineKeyboardButton(f"⚖️ Сравнить города{nbsp * 5}", callback_data="menu_compare"),
-        types.InlineKeyboardButton(f"📊 Расширенные данные{nbsp * 2}", callback_data="menu_extended")
-    )
-    return keyboard
+def send_message(chat_id, text, **kwargs):
+    """Отправить сообщение через очередь (ответы пользователю идут вне очереди рассылок)."""
+    return outbound.call(chat_id, bot.send_message, chat_id, text, **kwargs)
+
+
+def edit_message_text(text, chat_id, message_id, **kwargs):
+    """Изменить сообщение через очередь исходящих сообщений."""
+    return outbound.call(chat_id, bot.edit_message_text, text, chat_id, message_id, **kwargs)
+
 
+def send_main_menu(chat_id, text: str = "Выберите действие:"):
+    """Показать главное меню."""
+    send_message(chat_id, text, reply_markup=get_main_keyboard())
+
+
+# ============================================================================
+# ГЛАВНОЕ МЕНЮ
+# ============================================================================
 
 @bot.message_handler(commands=['start', 'help', 'menu'])
 def send_welcome(message):
@@ -64,23 +94,11 @@ def send_welcome(message):
             "notifications": False,
             "last_weather": None
         }
-        save_bot_users(user_data)
-    
-    welcome_text = (
-        "☀️ *Добро пожаловать в WeatherBot!*\n\n"
-        "Я помогу вам получить актуальную информацию о погоде:\n\n"
-        "🌡 Текущая погода в любом городе\n"
-        "📅 Прогноз на 5 дней вперед\n"
-        "📍 Погода по вашему местоположению\n"
-        "🔔 Погодные уведомления\n"
-        "⚖️ Сравнение погоды в разных городах\n"
-        "📊 Расширенная информация о погоде\n\n"
-        "Выберите действие:"
-    )
-    
-    bot.send_message(
+        user_writer.mark_dirty(user_id)
+
+    send_message(
         message.chat.id,
-        welcome_text,
+        WELCOME_TEXT,
         parse_mode="Markdown",
         reply_markup=get_main_keyboard()
     )
@@ -94,7 +112,7 @@ def send_welcome(message):
 def request_current_weather_callback(call):
     """Запрос текущей погоды через callback."""
     bot.answer_callback_query(call.id)
-    msg = bot.send_message(
+    msg = send_message(
         call.message.chat.id,
         "Введите название города:"
     )
@@ -109,88 +127,34 @@ def request_current_weather_callback(call):
 def show_current_weather(message):
     """Показать текущую погоду."""
     city = message.text.strip()
-    
+
     # Проверка на пустой ввод
     if not city:
-        bot.send_message(
+        send_message(
             message.chat.id,
             "❌ Название города не может быть пустым. Попробуйте еще раз."
         )
-        bot.send_message(
-            message.chat.id,
-            "Выберите действие:",
-            reply_markup=get_main_keyboard()
-        )
+        send_main_menu(message.chat.id)
         return
-    
-    bot.send_message(message.chat.id, "⏳ Получаю данные...")
-    
+
+    send_message(message.chat.id, "⏳ Получаю данные...")
+
     weather = get_current_weather(city=city)
-    
+
     if not weather:
-        bot.send_message(
-            message.chat.id,
-            f"❌ Город '{city}' не найден.\n\n"
-            f"Попробуйте:\n"
-            f"• Проверить правильность написания\n"
-            f"• Использовать английское название\n"
-            f"• Отправить местоположение вместо названия"
-        )
-        bot.send_message(
+        send_message(
             message.chat.id,
-            "Выберите действие:",
-            reply_markup=get_main_keyboard()
+            f"❌ Город '{city}' не найден.\n\n{CITY_NOT_FOUND_HINT}"
         )
+        send_main_menu(message.chat.id)
         return
-    
-    if isinstance(weather, list):
-        # Несколько вариантов городов
-        for entry in weather:
-            location = entry.get("location", {})
-            weather_data = entry.get("weather")
-            if weather_data:
-                text = format_current_weather(weather_data, location)
-                bot.send_message(message.chat.id, text, parse_mode="Markdown")
-    else:
-        text = format_current_weather(weather)
-        bot.send_message(message.chat.id, text, parse_mode="Markdown")
-    
-    # Показываем меню снова
-    bot.send_message(
-        message.chat.id,
-        "Выберите действие:",
-        reply_markup=get_main_keyboard()
-    )
 
+    # Несколько вариантов городов — по сообщению на каждый
+    for text in current_weather_texts(weather):
+        send_message(message.chat.id, text, parse_mode="Markdown")
 
-def format_current_weather(weather: Dict, location: Optional[Dict] = None) -> str:
-    """Форматировать данные текущей погоды."""
-    try:
-        # Используем только название города без региона
-        city_name = weather.get("name", "Неизвестный город")
-        if location and location.get("name"):
-            city_name = location.get("name")
-        
-        temp = weather["main"]["temp"]
-        feels_like = weather["main"]["feels_like"]
-        description = weather["weather"][0]["description"].capitalize()
-        humidity = weather["main"]["humidity"]
-        wind_speed = weather["wind"]["speed"]
-        pressure = weather["main"]["pressure"]
-        
-        text = (
-            f"🌤 *Погода в городе {city_name}*\n\n"
-            f"🌡 Температура: *{temp}°C*\n"
-            f"🤔 Ощущается как: *{feels_like}°C*\n"
-            f"📝 Описание: {description}\n"
-            f"💧 Влажность: {humidity}%\n"
-            f"💨 Ветер: {wind_speed} м/с\n"
-            f"🔽 Давление: {pressure} гПа\n"
-        )
-        
-        return text
-    except (KeyError, TypeError) as e:
-        return f"❌ Ошибка обработки данных: {e}"
+    # Показываем меню снова
+    send_main_menu(message.chat.id)
 
 
 # ============================================================================
@@ -208,81 +172,45 @@ def request_forecast(message, chat_id=None):
     """Запрос прогноза на 5 дней."""
     if chat_id is None:
         chat_id = message.chat.id
-    
+
     user_id = str(chat_id)
-    
+
     if user_id not in user_data or not user_data[user_id].get("location"):
-        bot.send_message(
+        send_message(
             chat_id,
             "❌ Сначала отправьте ваше местоположение.\n\n"
             "Нажмите кнопку '📍 Отправить местоположение' в меню ниже."
         )
-        bot.send_message(
-            chat_id,
-            "Выберите действие:",
-            reply_markup=get_main_keyboard()
-        )
+        send_main_menu(chat_id)
         return
-    
+
     location = user_data[user_id]["location"]
     lat, lon = location["lat"], location["lon"]
-    
-    bot.send_message(chat_id, "⏳ Получаю прогноз...")
-    
-    forecast = get_hourly_weather(lat, lon)
-    
+
+    send_message(chat_id, "⏳ Получаю прогноз...")
+
+    forecast = get_parsed_forecast(lat, lon)
+
     if not forecast:
-        bot.send_message(
+        send_message(
             chat_id,
             "❌ Не удалось получить прогноз погоды."
         )
         return
-    
+
     show_forecast_days(chat_id, forecast)
 
 
-def show_forecast_days(chat_id: int, forecast: Dict, message_id: Optional[int] = None):
+def show_forecast_days(chat_id: int, forecast: ParsedForecast, message_id: int = None):
     """Показать дни прогноза."""
-    forecast_list = forecast.get("list", [])
-    if not forecast_list:
-        bot.send_message(chat_id, "❌ Нет данных прогноза")
+    view = build_forecast_days_view(forecast)
+    if view is None:
+        send_message(chat_id, "❌ Нет данных прогноза")
         return
-    
-    # Группируем по дням
-    days = {}
-    for item in forecast_list:
-        date = item["dt_txt"].split()[0]
-        if date not in days:
-            days[date] = []
-        days[date].append(item)
-    
-    # Создаем inline-клавиатуру
-    keyboard = types.InlineKeyboardMarkup(row_width=2)
-    buttons = []
-    
-    for date in sorted(days.keys())[:5]:
-        # Получаем средние значения за день
-        temps = [item["main"]["temp"] for item in days[date]]
-        avg_temp = sum(temps) / len(temps)
-        
-        # Форматируем дату
-        date_obj = datetime.strptime(date, "%Y-%m-%d")
-        date_str = date_obj.strftime("%d.%m")
-        
-        button_text = f"{date_str} ({avg_temp:.1f}°C)"
-        buttons.append(types.InlineKeyboardButton(
-            button_text,
-            callback_data=f"day_{date}"
-        ))
-    
-    keyboard.add(*buttons)
-    keyboard.add(types.InlineKeyboardButton("🔙 Закрыть", callback_data="close"))
-    
-    city_name = forecast.get("city", {}).get("name", "Ваше местоположение")
-    text = f"📅 *Прогноз на 5 дней для {city_name}*\n\nВыберите день:"
-    
+
+    text, keyboard = view
     if message_id:
-        bot.edit_message_text(
+        edit_message_text(
             text,
             chat_id,
             message_id,
@@ -290,7 +218,7 @@ def show_forecast_days(chat_id: int, forecast: Dict, message_id: Optional[int] =
             reply_markup=keyboard
         )
     else:
-        bot.send_message(
+        send_message(
             chat_id,
             text,
             parse_mode="Markdown",
@@ -303,49 +231,25 @@ def show_day_details(call):
     """Показать детали дня."""
     date = call.data.split("_")[1]
     user_id = str(call.from_user.id)
-    
+
     if user_id not in user_data or not user_data[user_id].get("location"):
         bot.answer_callback_query(call.id, "❌ Местоположение не сохранено")
         return
-    
+
     location = user_data[user_id]["location"]
-    forecast = get_hourly_weather(location["lat"], location["lon"])
-    
+    forecast = get_parsed_forecast(location["lat"], location["lon"])
+
     if not forecast:
         bot.answer_callback_query(call.id, "❌ Ошибка получения данных")
         return
-    
-    # Фильтруем данные по дню
-    forecast_list = forecast.get("list", [])
-    day_data = [item for item in forecast_list if item["dt_txt"].startswith(date)]
-    
-    if not day_data:
+
+    view = build_day_details_view(forecast, date)
+    if view is None:
         bot.answer_callback_query(call.id, "❌ Нет данных")
         return
-    
-    # Форматируем детали
-    date_obj = datetime.strptime(date, "%Y-%m-%d")
-    date_str = date_obj.strftime("%d %B %Y")
-    
-    text = f"📅 *{date_str}*\n\n"
-    
-    for item in day_data:
-        time_str = item["dt_txt"].split()[1][:5]
-        temp = item["main"]["temp"]
-        description = item["weather"][0]["description"]
-        humidity = item["main"]["humidity"]
-        wind = item["wind"]["speed"]
-        
-        text += (
-            f"🕐 *{time_str}*\n"
-            f"🌡 {temp}°C, {description}\n"
-            f"💧 {humidity}%, 💨 {wind} м/с\n\n"
-        )
-    
-    keyboard = types.InlineKeyboardMarkup()
-    keyboard.add(types.InlineKeyboardButton("🔙 Назад", callback_data="back_to_days"))
-    
-    bot.edit_message_text(
+
+    text, keyboard = view
+    edit_message_text(
         text,
         call.message.chat.id,
         call.message.message_id,
@@ -359,21 +263,21 @@ def show_day_details(call):
 def back_to_days(call):
     """Вернуться к списку дней."""
     user_id = str(call.from_user.id)
-    
+
     if user_id not in user_data or not user_data[user_id].get("location"):
         bot.answer_callback_query(call.id, "❌ Местоположение не сохранено")
         return
-    
+
     location = user_data[user_id]["location"]
-    forecast = get_hourly_weather(location["lat"], location["lon"])
-    
+    forecast = get_parsed_forecast(location["lat"], location["lon"])
+
     if forecast:
         show_forecast_days(
             call.message.chat.id,
             forecast,
             call.message.message_id
         )
-    
+
     bot.answer_callback_query(call.id)
 
 
@@ -392,12 +296,10 @@ def close_inline(call):
 def request_location_callback(call):
     """Запрос отправки местоположения."""
     bot.answer_callback_query(call.id)
-    keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-    keyboard.add(types.KeyboardButton("📍 Отправить местоположение", request_location=True))
-    bot.send_message(
+    send_message(
         call.message.chat.id,
         "Нажмите кнопку ниже, чтобы отправить ваше местоположение:",
-        reply_markup=keyboard
+        reply_markup=get_location_keyboard()
     )
 
 
@@ -405,48 +307,53 @@ def request_location_callback(call):
 def handle_location(message):
     """Обработка геолокации."""
     user_id = str(message.from_user.id)
-    
+
     latitude = message.location.latitude
     longitude = message.location.longitude
-    
+
     # Проверяем, для чего отправлена геолокация
     if user_id in user_data and user_data[user_id].get("waiting_for_extended"):
         # Расширенные данные
         user_data[user_id]["waiting_for_extended"] = False
-        save_bot_users(user_data)
-        
-        bot.send_message(message.chat.id, "⏳ Получаю данные...")
+        user_writer.mark_dirty(user_id)
+
+        send_message(message.chat.id, "⏳ Получаю данные...")
         show_extended_data(message.chat.id, latitude, longitude)
         return
-    
+
     # Сохраняем координаты
     if user_id not in user_data:
         user_data[user_id] = {}
-    
+
+    previous = user_data[user_id].get("location")
     user_data[user_id]["location"] = {
         "lat": latitude,
         "lon": longitude
     }
-    save_bot_users(user_data)
-    
-    bot.send_message(
+    user_writer.mark_dirty(user_id)
+    subscribers.update(user_id, user_data[user_id])
+    # Предзагрузка держит свежим только текущее местоположение пользователя
+    if previous:
+        prefetcher.unpin(previous["lat"], previous["lon"])
+    prefetcher.pin(latitude, longitude)
+
+    send_message(
         message.chat.id,
         f"✅ Местоположение сохранено!\n📍 Координаты: {latitude:.4f}, {longitude:.4f}\n\n⏳ Получаю погоду..."
     )
-    
+
     # Показываем погоду
     weather = get_weather_by_coordinates(latitude, longitude)
-    
+
     if weather:
         text = format_current_weather(weather)
-        bot.send_message(message.chat.id, text, parse_mode="Markdown")
+        send_message(message.chat.id, text, parse_mode="Markdown")
     else:
-        bot.send_message(message.chat.id, "❌ Не удалось получить погоду")
-    
-    bot.send_message(
+        send_message(message.chat.id, "❌ Не удалось получить погоду")
+
+    send_main_menu(
         message.chat.id,
-        "Теперь вы можете использовать 'Прогноз на 5 дней'! 📅\n\nВыберите действие:",
-        reply_markup=get_main_keyboard()
+        "Теперь вы можете использовать 'Прогноз на 5 дней'! 📅\n\nВыберите действие:"
     )
 
 
@@ -465,32 +372,16 @@ def notifications_menu(message, chat_id=None):
     """Меню уведомлений."""
     if chat_id is None:
         chat_id = message.chat.id
-    
+
     user_id = str(chat_id)
-    
+
     if user_id not in user_data:
         user_data[user_id] = {"notifications": False, "location": None}
-        save_bot_users(user_data)
-    
-    status = "✅ Включены" if user_data[user_id].get("notifications") else "❌ Выключены"
-    
-    keyboard = types.InlineKeyboardMarkup()
-    keyboard.add(
-        types.InlineKeyboardButton(
-            "✅ Включить" if not user_data[user_id].get("notifications") else "❌ Выключить",
-            callback_data="toggle_notifications"
-        )
-    )
-    
-    text = (
-        f"🔔 *Погодные уведомления*\n\n"
-        f"Статус: {status}\n\n"
-        f"При включении вы будете получать уведомления каждые 2 часа, "
-        f"если ожидаются изменения погоды.\n\n"
-        f"⚠️ Для уведомлений необходимо сохранить местоположение!"
-    )
-    
-    bot.send_message(
+        user_writer.mark_dirty(user_id)
+
+    text, keyboard = build_notifications_menu(bool(user_data[user_id].get("notifications")))
+
+    send_message(
         chat_id,
         text,
         parse_mode="Markdown",
@@ -502,10 +393,10 @@ def notifications_menu(message, chat_id=None):
 def toggle_notifications(call):
     """Переключить уведомления."""
     user_id = str(call.from_user.id)
-    
+
     if user_id not in user_data:
         user_data[user_id] = {"notifications": False, "location": None}
-    
+
     if not user_data[user_id].get("location"):
         bot.answer_callback_query(
             call.id,
@@ -513,71 +404,37 @@ def toggle_notifications(call):
             show_alert=True
         )
         return
-    
+
     # Переключаем
     user_data[user_id]["notifications"] = not user_data[user_id].get("notifications", False)
-    save_bot_users(user_data)
-    
+    user_writer.mark_dirty(user_id)
+    subscribers.update(user_id, user_data[user_id])
+
     status = "включены" if user_data[user_id]["notifications"] else "выключены"
-    
+
     bot.answer_callback_query(call.id, f"✅ Уведомления {status}")
     bot.delete_message(call.message.chat.id, call.message.message_id)
-    bot.send_message(
+    send_main_menu(
         call.message.chat.id,
-        f"🔔 Уведомления {status}!\n\nВыберите действие:",
-        reply_markup=get_main_keyboard()
+        f"🔔 Уведомления {status}!\n\nВыберите действие:"
     )
 
 
 def check_weather_notifications():
     """Проверка погоды для уведомлений (каждые 2 часа)."""
-    for user_id, data in user_data.items():
-        if not data.get("notifications") or not data.get("location"):
-            continue
-        
-        try:
-            location = data["location"]
-            weather = get_weather_by_coordinates(location["lat"], location["lon"])
-            
-            if not weather:
-                continue
-            
-            # Получаем прогноз
-            forecast = get_hourly_weather(location["lat"], location["lon"])
-            
-            if forecast and forecast.get("list"):
-                # Проверяем ближайшие часы на дождь/снег
-                next_hours = forecast["list"][:4]  # 12 часов вперед
-                
-                has_rain = any("rain" in item.get("weather", [{}])[0].get("main", "").lower() 
-                              for item in next_hours)
-                has_snow = any("snow" in item.get("weather", [{}])[0].get("main", "").lower() 
-                              for item in next_hours)
-                
-                message = None
-                
-                if has_rain:
-                    message = "🌧 *Внимание!*\nВ ближайшие 12 часов ожидается дождь. Возьмите зонт!"
-                elif has_snow:
-                    message = "❄️ *Внимание!*\nВ ближайшие 12 часов ожидается снег. Одевайтесь теплее!"
-                
-                if message:
-                    temp = weather["main"]["temp"]
-                    message += f"\n\n🌡 Текущая температура: {temp}°C"
-                    
-                    bot.send_message(
-                        int(user_id),
-                        message,
-                        parse_mode="Markdown"
-                    )
-        except Exception as e:
-            print(f"Ошибка отправки уведомления пользователю {user_id}: {e}")
+    run_notifications(
+        subscribers.groups(),
+        lambda chat_id, text: outbound.submit(
+            chat_id, bot.send_message, chat_id, text,
+            priority=PRIORITY_BROADCAST, parse_mode="Markdown"
+        ),
+    )
 
 
 def run_scheduler():
     """Запуск планировщика."""
     schedule.every(2).hours.do(check_weather_notifications)
-    
+
     while True:
         schedule.run_pending()
         time.sleep(60)
@@ -591,7 +448,7 @@ def run_scheduler():
 def request_compare_cities_callback(call):
     """Запрос сравнения городов через callback."""
     bot.answer_callback_query(call.id)
-    msg = bot.send_message(
+    msg = send_message(
         call.message.chat.id,
         "Введите два города через запятую\nНапример: *Москва, Санкт-Петербург*",
         parse_mode="Markdown"
@@ -601,93 +458,32 @@ def request_compare_cities_callback(call):
 
 def compare_cities(message):
     """Сравнить погоду в двух городах."""
-    text = message.text.strip()
-    
-    # Проверка на пустой ввод
-    if not text or "," not in text:
-        bot.send_message(
-            message.chat.id,
-            "❌ Неверный формат!\n\n"
-            "Введите два города через запятую.\n"
-            "Например: Москва, Санкт-Петербург"
-        )
-        bot.send_message(
-            message.chat.id,
-            "Выберите действие:",
-            reply_markup=get_main_keyboard()
-        )
-        return
-    
-    cities = [city.strip() for city in text.split(",")]
-    
-    if len(cities) != 2 or not cities[0] or not cities[1]:
-        bot.send_message(
-            message.chat.id,
-            "❌ Необходимо ввести ровно два города через запятую!\n\n"
-            "Пример: Москва, Санкт-Петербург"
-        )
-        bot.send_message(
-            message.chat.id,
-            "Выберите действие:",
-            reply_markup=get_main_keyboard()
-        )
+    cities, error = parse_compare_input(message.text.strip())
+
+    if error:
+        send_message(message.chat.id, error)
+        send_main_menu(message.chat.id)
         return
-    
-    bot.send_message(message.chat.id, "⏳ Получаю данные...")
-    
-    weather1 = get_current_weather(city=cities[0])
-    weather2 = get_current_weather(city=cities[1])
-    
-    if not weather1 or not weather2:
-        bot.send_message(
-            message.chat.id,
-            "❌ Не удалось получить данные. Проверьте названия городов."
-        )
+
+    send_message(message.chat.id, "⏳ Получаю данные...")
+
+    # Оба города запрашиваются одновременно
+    first, second = get_weather_batch(cities)
+
+    failures = format_batch_failures([first, second])
+    if failures:
+        send_message(message.chat.id, failures)
         return
-    
-    # Берем первый вариант если список
-    w1 = weather1[0]["weather"] if isinstance(weather1, list) else weather1
-    w2 = weather2[0]["weather"] if isinstance(weather2, list) else weather2
-    
-    text = format_comparison(cities[0], w1, cities[1], w2)
-    
-    bot.send_message(
+
+    text = format_comparison(cities[0], first["weather"], cities[1], second["weather"])
+
+    send_message(
         message.chat.id,
         text,
         parse_mode="Markdown"
     )
-    
-    bot.send_message(
-        message.chat.id,
-        "Выберите действие:",
-        reply_markup=get_main_keyboard()
-    )
 
-
-def format_comparison(city1: str, w1: Dict, city2: str, w2: Dict) -> str:
-    """Форматировать сравнение городов."""
-    try:
-        temp1 = w1["main"]["temp"]
-        temp2 = w2["main"]["temp"]
-        
-        text = f"⚖️ *Сравнение погоды*\n\n"
-        text += f"```\n"
-        text += f"{'Параметр':<20} {city1[:10]:<12} {city2[:10]:<12}\n"
-        text += f"{'-'*44}\n"
-        text += f"{'Температура':<20} {temp1:>6.1f}°C    {temp2:>6.1f}°C\n"
-        text += f"{'Ощущается':<20} {w1['main']['feels_like']:>6.1f}°C    {w2['main']['feels_like']:>6.1f}°C\n"
-        text += f"{'Влажность':<20} {w1['main']['humidity']:>6}%      {w2['main']['humidity']:>6}%\n"
-        text += f"{'Ветер':<20} {w1['wind']['speed']:>6.1f} м/с  {w2['wind']['speed']:>6.1f} м/с\n"
-        text += f"{'Давление':<20} {w1['main']['pressure']:>6} гПа  {w2['main']['pressure']:>6} гПа\n"
-        text += f"```\n"
-        
-        diff = abs(temp1 - temp2)
-        warmer = city1 if temp1 > temp2 else city2
-        text += f"\n🌡 В городе *{warmer}* теплее на *{diff:.1f}°C*"
-        
-        return text
-    except (KeyError, TypeError) as e:
-        return f"❌ Ошибка обработки данных: {e}"
+    send_main_menu(message.chat.id)
 
 
 # ============================================================================
@@ -698,16 +494,10 @@ def format_comparison(city1: str, w1: Dict, city2: str, w2: Dict) -> str:
 def request_extended_data_callback(call):
     """Запрос расширенных данных через callback."""
     bot.answer_callback_query(call.id)
-    keyboard = types.InlineKeyboardMarkup()
-    keyboard.add(
-        types.InlineKeyboardButton("По городу", callback_data="extended_city"),
-        types.InlineKeyboardButton("По геолокации", callback_data="extended_location")
-    )
-    
-    bot.send_message(
+    send_message(
         call.message.chat.id,
         "Выберите способ поиска:",
-        reply_markup=keyboard
+        reply_markup=build_extended_menu()
     )
 
 
@@ -715,7 +505,7 @@ def request_extended_data_callback(call):
 def request_extended_city(call):
     """Запрос города для расширенных данных."""
     bot.answer_callback_query(call.id)
-    msg = bot.send_message(
+    msg = send_message(
         call.message.chat.id,
         "Введите название города:"
     )
@@ -727,97 +517,51 @@ def request_extended_location(call):
     """Запрос местоположения для расширенных данных."""
     bot.answer_callback_query(call.id)
     user_id = str(call.from_user.id)
-    
+
     # Устанавливаем флаг, что ждем геолокацию для расширенных данных
     if user_id not in user_data:
         user_data[user_id] = {}
     user_data[user_id]["waiting_for_extended"] = True
-    save_bot_users(user_data)
-    
-    keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-    keyboard.add(types.KeyboardButton("📍 Отправить местоположение", request_location=True))
-    bot.send_message(
+    user_writer.mark_dirty(user_id)
+
+    send_message(
         call.message.chat.id,
         "Нажмите кнопку ниже, чтобы отправить ваше местоположение:",
-        reply_markup=keyboard
+        reply_markup=get_location_keyboard()
     )
 
 
 def show_extended_by_city(message):
     """Показать расширенные данные по городу."""
     city = message.text.strip()
-    
-    bot.send_message(message.chat.id, "⏳ Получаю данные...")
-    
+
+    send_message(message.chat.id, "⏳ Получаю данные...")
+
     locations = get_coordinates(city)
     if not locations:
-        bot.send_message(
+        send_message(
             message.chat.id,
             "❌ Город не найден"
         )
-        bot.send_message(
-            message.chat.id,
-            "Выберите действие:",
-            reply_markup=get_main_keyboard()
-        )
+        send_main_menu(message.chat.id)
         return
-    
+
     location = locations[0]
     show_extended_data(message.chat.id, location["lat"], location["lon"], city)
 
 
 def show_extended_data(chat_id: int, lat: float, lon: float, city_name: str = None):
-    """Показать все расширенные данные."""
-    weather = get_weather_by_coordinates(lat, lon)
-    pollution = get_air_pollution(lat, lon)
-    
-    if not weather:
-        bot.send_message(chat_id, "❌ Не удалось получить данные о погоде")
+    """Показать все расширенные данные (погода и воздух запрашиваются одновременно)."""
+    bundle = get_extended_bundle(lat, lon)
+
+    if not bundle:
+        send_message(chat_id, "❌ Не удалось получить данные о погоде")
         return
-    
-    text = f"📊 *Расширенные данные*\n"
-    if city_name:
-        text += f"📍 {city_name}\n"
-    text += f"🗺 {lat:.4f}, {lon:.4f}\n\n"
-    
-    # Основная погода
-    text += f"🌤 *ПОГОДА*\n"
-    text += f"🌡 Температура: {weather['main']['temp']}°C\n"
-    text += f"🤔 Ощущается: {weather['main']['feels_like']}°C\n"
-    text += f"📝 {weather['weather'][0]['description'].capitalize()}\n"
-    text += f"💧 Влажность: {weather['main']['humidity']}%\n"
-    text += f"💨 Ветер: {weather['wind']['speed']} м/с\n"
-    text += f"🔽 Давление: {weather['main']['pressure']} гПа\n"
-    text += f"☁️ Облачность: {weather['clouds']['all']}%\n"
-    text += f"👁 Видимость: {weather.get('visibility', 'N/A')} м\n"
-    
-    # Восход/закат
-    if 'sys' in weather:
-        sunrise = datetime.fromtimestamp(weather['sys']['sunrise']).strftime('%H:%M')
-        sunset = datetime.fromtimestamp(weather['sys']['sunset']).strftime('%H:%M')
-        text += f"🌅 Восход: {sunrise}\n"
-        text += f"🌇 Закат: {sunset}\n"
-    
-    # Качество воздуха
-    if pollution and pollution.get("list"):
-        text += f"\n🌫 *КАЧЕСТВО ВОЗДУХА*\n"
-        aqi = pollution["list"][0]["main"]["aqi"]
-        aqi_names = {1: "Отличное", 2: "Хорошее", 3: "Умеренное", 4: "Плохое", 5: "Очень плохое"}
-        text += f"📊 AQI: {aqi} - {aqi_names.get(aqi, 'N/A')}\n"
-        
-        components = pollution["list"][0]["components"]
-        text += f"CO: {components.get('co', 'N/A')} мкг/м³\n"
-        text += f"NO₂: {components.get('no2', 'N/A')} мкг/м³\n"
-        text += f"O₃: {components.get('o3', 'N/A')} мкг/м³\n"
-        text += f"PM2.5: {components.get('pm2_5', 'N/A')} мкг/м³\n"
-        text += f"PM10: {components.get('pm10', 'N/A')} мкг/м³\n"
-    
-    bot.send_message(chat_id, text, parse_mode="Markdown")
-    bot.send_message(
-        chat_id,
-        "Выберите действие:",
-        reply_markup=get_main_keyboard()
-    )
+
+    text = format_extended_data(bundle["weather"], bundle["air_pollution"], lat, lon, city_name)
+
+    send_message(chat_id, text, parse_mode="Markdown")
+    send_main_menu(chat_id)
 
 
 # ============================================================================
@@ -828,104 +572,28 @@ def show_extended_data(chat_id: int, lat: float, lon: float, city_name: str = No
 def inline_query_handler(query):
     """Обработчик inline-запросов."""
     city = query.query.strip()
-    
+
     if not city:
         return
-    
+
     try:
-        # Получаем погоду
-        weather = get_current_weather(city=city)
-        
+        # Ответ из кэша или после запроса к API; устаревшие запросы пользователя не отвечаются
+        answer = inline_engine.resolve(query.from_user.id, city)
+        if answer is None:
+            return
+
+        weather, exact = answer
         if not weather:
             # Город не найден
-            result = types.InlineQueryResultArticle(
-                id='1',
-                title=f'Город "{city}" не найден',
-                description='Проверьте правильность написания',
-                input_message_content=types.InputTextMessageContent(
-                    message_text=f"❌ Город '{city}' не найден"
-                )
-            )
-            bot.answer_inline_query(query.id, [result], cache_time=60)
+            bot.answer_inline_query(query.id, [build_inline_not_found(city)], cache_time=60)
             return
-        
-        results = []
-        
-        if isinstance(weather, list):
-            # Несколько вариантов городов
-            for idx, entry in enumerate(weather[:5]):  # Максимум 5 результатов
-                location = entry.get("location", {})
-                weather_data = entry.get("weather")
-                
-                if not weather_data:
-                    continue
-                
-                city_name = location.get("name", "Неизвестный город")
-                temp = weather_data["main"]["temp"]
-                description = weather_data["weather"][0]["description"]
-                humidity = weather_data["main"]["humidity"]
-                wind = weather_data["wind"]["speed"]
-                
-                message_text = (
-                    f"🌤 *{city_name}*\n\n"
-                    f"🌡 Температура: *{temp}°C*\n"
-                    f"📝 {description.capitalize()}\n"
-                    f"💧 Влажность: {humidity}%\n"
-                    f"💨 Ветер: {wind} м/с"
-                )
-                
-                result = types.InlineQueryResultArticle(
-                    id=str(idx),
-                    title=f'{city_name}: {temp}°C',
-                    description=f'{description.capitalize()}, влажность {humidity}%',
-                    thumbnail_url='https://openweathermap.org/img/wn/01d@2x.png',
-                    input_message_content=types.InputTextMessageContent(
-                        message_text=message_text,
-                        parse_mode='Markdown'
-                    )
-                )
-                results.append(result)
-        else:
-            # Один результат
-            city_name = weather.get("name", city)
-            temp = weather["main"]["temp"]
-            description = weather["weather"][0]["description"]
-            humidity = weather["main"]["humidity"]
-            wind = weather["wind"]["speed"]
-            
-            message_text = (
-                f"🌤 *{city_name}*\n\n"
-                f"🌡 Температура: *{temp}°C*\n"
-                f"📝 {description.capitalize()}\n"
-                f"💧 Влажность: {humidity}%\n"
-                f"💨 Ветер: {wind} м/с"
-            )
-            
-            result = types.InlineQueryResultArticle(
-                id='1',
-                title=f'{city_name}: {temp}°C',
-                description=f'{description.capitalize()}, влажность {humidity}%',
-                thumbnail_url='https://openweathermap.org/img/wn/01d@2x.png',
-                input_message_content=types.InputTextMessageContent(
-                    message_text=message_text,
-                    parse_mode='Markdown'
-                )
-            )
-            results.append(result)
-        
-        bot.answer_inline_query(query.id, results, cache_time=600)
-    
+
+        # Подсказки по префиксу не кэшируем в Telegram: точный ответ придёт на следующий запрос
+        bot.answer_inline_query(query.id, build_inline_results(city, weather), cache_time=600 if exact else 0)
+
     except Exception as e:
         print(f"Ошибка в inline-режиме: {e}")
-        result = types.InlineQueryResultArticle(
-            id='1',
-            title='Ошибка',
-            description='Не удалось получить данные о погоде',
-            input_message_content=types.InputTextMessageContent(
-                message_text="❌ Не удалось получить данные о погоде"
-            )
-        )
-        bot.answer_inline_query(query.id, [result], cache_time=60)
+        bot.answer_inline_query(query.id, [build_inline_error()], cache_time=60)
 
 
 # ============================================================================
@@ -936,14 +604,22 @@ def main():
     """Главная функция запуска бота."""
     print("🤖 Бот запущен!")
     print("📍 Inline-режим активен")
-    
+
     # Запускаем планировщик в отдельном потоке
     scheduler_thread = threading.Thread(target=run_scheduler, daemon=True)
     scheduler_thread.start()
-    
+
+    # Данные для сохранённых местоположений обновляются заранее, до истечения кэша
+    prefetcher.pin_locations(data["location"] for data in user_data.values() if data.get("location"))
+    prefetcher.start()
+
     # Запускаем бота
-    bot.infinity_polling()
+    try:
+        bot.infinity_polling()
+    finally:
+        prefetcher.stop()
+        user_writer.stop()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,337 @@
+"""Тексты и клавиатуры Telegram-бота, общие для синхронного и асинхронного режимов."""
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from telebot import types
+
+from src.forecast import ParsedForecast
+from src.storage import get_stale_age
+
+WELCOME_TEXT = (
+    "☀️ *Добро пожаловать в WeatherBot!*\n\n"
+    "Я помогу вам получить актуальную информацию о погоде:\n\n"
+    "🌡 Текущая погода в любом городе\n"
+    "📅 Прогноз на 5 дней вперед\n"
+    "📍 Погода по вашему местоположению\n"
+    "🔔 Погодные уведомления\n"
+    "⚖️ Сравнение погоды в разных городах\n"
+    "📊 Расширенная информация о погоде\n\n"
+    "Выберите действие:"
+)
+
+CITY_NOT_FOUND_HINT = (
+    "Попробуйте:\n"
+    "• Проверить правильность написания\n"
+    "• Использовать английское название\n"
+    "• Отправить местоположение вместо названия"
+)
+
+AQI_NAMES = {1: "Отличное", 2: "Хорошее", 3: "Умеренное", 4: "Плохое", 5: "Очень плохое"}
+
+
+def get_main_keyboard():
+    """Главная inline-клавиатура с фиксированной шириной кнопок."""
+    # Используем неразрывные пробелы (U+00A0) для выравнивания ширины кнопок
+    nbsp = '\u00A0'  # Неразрывный пробел
+
+    keyboard = types.InlineKeyboardMarkup()
+    keyboard.row(
+        types.InlineKeyboardButton(f"☀️ Текущая погода{nbsp * 6}", callback_data="menu_weather"),
+        types.InlineKeyboardButton(f"📅 Прогноз на 5 дней{nbsp * 3}", callback_data="menu_forecast")
+    )
+    keyboard.row(
+        types.InlineKeyboardButton("📍 Отправить местоположение", callback_data="menu_location"),
+        types.InlineKeyboardButton(f"🔔 Уведомления{nbsp * 9}", callback_data="menu_notifications")
+    )
+    keyboard.row(
+        types.InlineKeyboardButton(f"⚖️ Сравнить города{nbsp * 5}", callback_data="menu_compare"),
+        types.InlineKeyboardButton(f"📊 Расширенные данные{nbsp * 2}", callback_data="menu_extended")
+    )
+    return keyboard
+
+
+def get_location_keyboard():
+    """Reply-клавиатура с кнопкой отправки местоположения."""
+    keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
+    keyboard.add(types.KeyboardButton("📍 Отправить местоположение", request_location=True))
+    return keyboard
+
+
+def format_stale_note(data: Optional[Dict]) -> str:
+    """Пометка для данных, отданных из кэша устаревшими (пустая строка для свежих)."""
+    age = get_stale_age(data)
+    if age is None:
+        return ""
+    return f"\n⏳ _Данные получены {max(age // 60, 1)} мин назад, обновляются_\n"
+
+
+def format_current_weather(weather: Dict, location: Optional[Dict] = None) -> str:
+    """Форматировать данные текущей погоды."""
+    try:
+        # Используем только название города без региона
+        city_name = weather.get("name", "Неизвестный город")
+        if location and location.get("name"):
+            city_name = location.get("name")
+
+        temp = weather["main"]["temp"]
+        feels_like = weather["main"]["feels_like"]
+        description = weather["weather"][0]["description"].capitalize()
+        humidity = weather["main"]["humidity"]
+        wind_speed = weather["wind"]["speed"]
+        pressure = weather["main"]["pressure"]
+
+        text = (
+            f"🌤 *Погода в городе {city_name}*\n\n"
+            f"🌡 Температура: *{temp}°C*\n"
+            f"🤔 Ощущается как: *{feels_like}°C*\n"
+            f"📝 Описание: {description}\n"
+            f"💧 Влажность: {humidity}%\n"
+            f"💨 Ветер: {wind_speed} м/с\n"
+            f"🔽 Давление: {pressure} гПа\n"
+        )
+
+        return text + format_stale_note(weather)
+    except (KeyError, TypeError) as e:
+        return f"❌ Ошибка обработки данных: {e}"
+
+
+def current_weather_texts(weather: Any) -> List[str]:
+    """Тексты текущей погоды: по одному на каждый найденный вариант города."""
+    if isinstance(weather, list):
+        return [
+            format_current_weather(entry["weather"], entry.get("location", {}))
+            for entry in weather
+            if entry.get("weather")
+        ]
+    return [format_current_weather(weather)]
+
+
+def build_forecast_days_view(forecast: ParsedForecast) -> Optional[Tuple[str, Any]]:
+    """Текст и клавиатура со списком дней прогноза (None, если данных нет)."""
+    if not forecast.dates:
+        return None
+
+    # Создаем inline-клавиатуру
+    keyboard = types.InlineKeyboardMarkup(row_width=2)
+    buttons = [
+        types.InlineKeyboardButton(forecast.days[date].button_text, callback_data=f"day_{date}")
+        for date in forecast.dates[:5]
+    ]
+
+    keyboard.add(*buttons)
+    keyboard.add(types.InlineKeyboardButton("🔙 Закрыть", callback_data="close"))
+
+    text = f"📅 *Прогноз на 5 дней для {forecast.city_name or 'Ваше местоположение'}*\n\nВыберите день:"
+    return text, keyboard
+
+
+def build_day_details_view(forecast: ParsedForecast, date: str) -> Optional[Tuple[str, Any]]:
+    """Текст и клавиатура с почасовым прогнозом на день (None, если данных нет)."""
+    day = forecast.days.get(date)
+    if day is None:
+        return None
+
+    keyboard = types.InlineKeyboardMarkup()
+    keyboard.add(types.InlineKeyboardButton("🔙 Назад", callback_data="back_to_days"))
+    return day.details_text, keyboard
+
+
+def build_notifications_menu(enabled: bool) -> Tuple[str, Any]:
+    """Текст и клавиатура меню уведомлений."""
+    status = "✅ Включены" if enabled else "❌ Выключены"
+
+    keyboard = types.InlineKeyboardMarkup()
+    keyboard.add(
+        types.InlineKeyboardButton(
+            "✅ Включить" if not enabled else "❌ Выключить",
+            callback_data="toggle_notifications"
+        )
+    )
+
+    text = (
+        f"🔔 *Погодные уведомления*\n\n"
+        f"Статус: {status}\n\n"
+        f"При включении вы будете получать уведомления каждые 2 часа, "
+        f"если ожидаются изменения погоды.\n\n"
+        f"⚠️ Для уведомлений необходимо сохранить местоположение!"
+    )
+    return text, keyboard
+
+
+def parse_compare_input(text: str) -> Tuple[Optional[List[str]], Optional[str]]:
+    """Разобрать ввод «город1, город2». Возвращает (города, None) или (None, текст ошибки)."""
+    if not text or "," not in text:
+        return None, (
+            "❌ Неверный формат!\n\n"
+            "Введите два города через запятую.\n"
+            "Например: Москва, Санкт-Петербург"
+        )
+
+    cities = [city.strip() for city in text.split(",")]
+
+    if len(cities) != 2 or not cities[0] or not cities[1]:
+        return None, (
+            "❌ Необходимо ввести ровно два города через запятую!\n\n"
+            "Пример: Москва, Санкт-Петербург"
+        )
+    return cities, None
+
+
+def format_batch_failures(items: List[Dict[str, Any]]) -> Optional[str]:
+    """Сообщение о городах, для которых не удалось получить погоду (None, если ошибок нет)."""
+    failed = [str(item["target"]) for item in items if item["error"]]
+    if not failed:
+        return None
+    return f"❌ Не удалось получить данные для: {', '.join(failed)}. Проверьте названия городов."
+
+
+def format_comparison(city1: str, w1: Dict, city2: str, w2: Dict) -> str:
+    """Форматировать сравнение городов."""
+    try:
+        temp1 = w1["main"]["temp"]
+        temp2 = w2["main"]["temp"]
+
+        text = f"⚖️ *Сравнение погоды*\n\n"
+        text += f"```\n"
+        text += f"{'Параметр':<20} {city1[:10]:<12} {city2[:10]:<12}\n"
+        text += f"{'-'*44}\n"
+        text += f"{'Температура':<20} {temp1:>6.1f}°C    {temp2:>6.1f}°C\n"
+        text += f"{'Ощущается':<20} {w1['main']['feels_like']:>6.1f}°C    {w2['main']['feels_like']:>6.1f}°C\n"
+        text += f"{'Влажность':<20} {w1['main']['humidity']:>6}%      {w2['main']['humidity']:>6}%\n"
+        text += f"{'Ветер':<20} {w1['wind']['speed']:>6.1f} м/с  {w2['wind']['speed']:>6.1f} м/с\n"
+        text += f"{'Давление':<20} {w1['main']['pressure']:>6} гПа  {w2['main']['pressure']:>6} гПа\n"
+        text += f"```\n"
+
+        diff = abs(temp1 - temp2)
+        warmer = city1 if temp1 > temp2 else city2
+        text += f"\n🌡 В городе *{warmer}* теплее на *{diff:.1f}°C*"
+
+        return text
+    except (KeyError, TypeError) as e:
+        return f"❌ Ошибка обработки данных: {e}"
+
+
+def build_extended_menu():
+    """Клавиатура выбора способа поиска для расширенных данных."""
+    keyboard = types.InlineKeyboardMarkup()
+    keyboard.add(
+        types.InlineKeyboardButton("По городу", callback_data="extended_city"),
+        types.InlineKeyboardButton("По геолокации", callback_data="extended_location")
+    )
+    return keyboard
+
+
+def format_extended_data(weather: Dict, pollution: Optional[Dict], lat: float, lon: float,
+                         city_name: str = None) -> str:
+    """Форматировать расширенные данные: погода, восход/закат и качество воздуха."""
+    text = f"📊 *Расширенные данные*\n"
+    if city_name:
+        text += f"📍 {city_name}\n"
+    text += f"🗺 {lat:.4f}, {lon:.4f}\n\n"
+
+    # Основная погода
+    text += f"🌤 *ПОГОДА*\n"
+    text += f"🌡 Температура: {weather['main']['temp']}°C\n"
+    text += f"🤔 Ощущается: {weather['main']['feels_like']}°C\n"
+    text += f"📝 {weather['weather'][0]['description'].capitalize()}\n"
+    text += f"💧 Влажность: {weather['main']['humidity']}%\n"
+    text += f"💨 Ветер: {weather['wind']['speed']} м/с\n"
+    text += f"🔽 Давление: {weather['main']['pressure']} гПа\n"
+    text += f"☁️ Облачность: {weather['clouds']['all']}%\n"
+    text += f"👁 Видимость: {weather.get('visibility', 'N/A')} м\n"
+
+    # Восход/закат
+    if 'sys' in weather:
+        sunrise = datetime.fromtimestamp(weather['sys']['sunrise']).strftime('%H:%M')
+        sunset = datetime.fromtimestamp(weather['sys']['sunset']).strftime('%H:%M')
+        text += f"🌅 Восход: {sunrise}\n"
+        text += f"🌇 Закат: {sunset}\n"
+
+    # Качество воздуха
+    if pollution and pollution.get("list"):
+        text += f"\n🌫 *КАЧЕСТВО ВОЗДУХА*\n"
+        aqi = pollution["list"][0]["main"]["aqi"]
+        text += f"📊 AQI: {aqi} - {AQI_NAMES.get(aqi, 'N/A')}\n"
+
+        components = pollution["list"][0]["components"]
+        text += f"CO: {components.get('co', 'N/A')} мкг/м³\n"
+        text += f"NO₂: {components.get('no2', 'N/A')} мкг/м³\n"
+        text += f"O₃: {components.get('o3', 'N/A')} мкг/м³\n"
+        text += f"PM2.5: {components.get('pm2_5', 'N/A')} мкг/м³\n"
+        text += f"PM10: {components.get('pm10', 'N/A')} мкг/м³\n"
+
+    return text + format_stale_note(weather)
+
+
+def _inline_weather_result(result_id: str, city_name: str, weather_data: Dict):
+    temp = weather_data["main"]["temp"]
+    description = weather_data["weather"][0]["description"]
+    humidity = weather_data["main"]["humidity"]
+    wind = weather_data["wind"]["speed"]
+
+    message_text = (
+        f"🌤 *{city_name}*\n\n"
+        f"🌡 Температура: *{temp}°C*\n"
+        f"📝 {description.capitalize()}\n"
+        f"💧 Влажность: {humidity}%\n"
+        f"💨 Ветер: {wind} м/с"
+    )
+
+    return types.InlineQueryResultArticle(
+        id=result_id,
+        title=f'{city_name}: {temp}°C',
+        description=f'{description.capitalize()}, влажность {humidity}%',
+        thumbnail_url='https://openweathermap.org/img/wn/01d@2x.png',
+        input_message_content=types.InputTextMessageContent(
+            message_text=message_text,
+            parse_mode='Markdown'
+        )
+    )
+
+
+def build_inline_not_found(city: str):
+    """Inline-результат «город не найден»."""
+    return types.InlineQueryResultArticle(
+        id='1',
+        title=f'Город "{city}" не найден',
+        description='Проверьте правильность написания',
+        input_message_content=types.InputTextMessageContent(
+            message_text=f"❌ Город '{city}' не найден"
+        )
+    )
+
+
+def build_inline_error():
+    """Inline-результат об ошибке получения данных."""
+    return types.InlineQueryResultArticle(
+        id='1',
+        title='Ошибка',
+        description='Не удалось получить данные о погоде',
+        input_message_content=types.InputTextMessageContent(
+            message_text="❌ Не удалось получить данные о погоде"
+        )
+    )
+
+
+def build_inline_results(city: str, weather: Any) -> list:
+    """Inline-результаты для погоды (несколько вариантов города или один)."""
+    results = []
+
+    if isinstance(weather, list):
+        # Несколько вариантов городов
+        for idx, entry in enumerate(weather[:5]):  # Максимум 5 результатов
+            location = entry.get("location", {})
+            weather_data = entry.get("weather")
+
+            if not weather_data:
+                continue
+
+            city_name = location.get("name", "Неизвестный город")
+            results.append(_inline_weather_result(str(idx), city_name, weather_data))
+    else:
+        # Один результат
+        city_name = weather.get("name", city)
+        results.append(_inline_weather_result('1', city_name, weather))
+
+    return results
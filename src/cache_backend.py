@@ -0,0 +1,507 @@
+"""
+Хранилища записей API кэша, общие для нескольких процессов (бот, CLI, копии бота).
+
+- sqlite — один файл SQLite (WAL), по умолчанию;
+- file — по файлу на запись с атомарной заменой и блокировками fcntl;
+- redis — сервер с протоколом Redis (RESP), например Redis, Valkey или KeyDB.
+
+Кроме чтения и записи каждое хранилище умеет ставить короткую блокировку на
+ключ: пока один процесс запрашивает данные у API, остальные ждут его результат.
+Блокировка помечается уникальным токеном и снимается только им, поэтому процесс,
+чья блокировка истекла, не снимет чужую.
+"""
+
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Iterator, List, NamedTuple, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+try:
+    import fcntl
+except ImportError:  # Windows: замена файла остаётся атомарной, но без блокировок
+    fcntl = None
+
+
+class CacheBackendError(Exception):
+    """Хранилище кэша недоступно или ответило ошибкой."""
+
+
+class CacheRecord(NamedTuple):
+    response: str
+    cached_at: float
+    expires_at: float
+    # До какого времени запись можно отдавать устаревшей
+    stale_until: float
+    cell: Optional[str] = None
+
+
+class CacheBackend:
+    """Интерфейс хранилища записей API кэша.
+
+    Ответ хранится уже сериализованным в JSON (`CacheRecord.response`), сроки —
+    в секундах Unix. Ошибки хранилища выбрасываются как CacheBackendError.
+    """
+
+    name = "base"
+
+    def get(self, key: str) -> Optional[CacheRecord]:
+        raise NotImplementedError
+
+    def metadata(self, key: str) -> Optional[CacheRecord]:
+        """Запись без ответа (response пустой), если хранилище умеет читать её дешевле."""
+        return self.get(key)
+
+    def set(self, key: str, endpoint: str, record: CacheRecord) -> None:
+        raise NotImplementedError
+
+    def purge(self, now: float) -> int:
+        """Удалить записи с истёкшим stale_until. Возвращает число удалённых."""
+        return 0
+
+    def lock(self, key: str, ttl: float) -> Optional[str]:
+        """Занять ключ на `ttl` секунд. Возвращает токен блокировки или None, если ключ уже занят."""
+        raise NotImplementedError
+
+    def unlock(self, key: str, token: str) -> None:
+        """Снять блокировку, если она всё ещё занята этим токеном."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+# ============================================================================
+# SQLITE
+# ============================================================================
+
+class SQLiteCacheBackend(CacheBackend):
+    """Записи в одной таблице SQLite; WAL позволяет нескольким процессам читать и писать один файл."""
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS api_cache (
+                    key TEXT PRIMARY KEY,
+                    endpoint TEXT NOT NULL,
+                    cached_at REAL NOT NULL,
+                    expires_at REAL NOT NULL,
+                    response TEXT NOT NULL,
+                    cell TEXT,
+                    stale_until REAL
+                )
+                """
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(api_cache)")}
+            if "cell" not in columns:
+                conn.execute("ALTER TABLE api_cache ADD COLUMN cell TEXT")
+            if "stale_until" not in columns:
+                conn.execute("ALTER TABLE api_cache ADD COLUMN stale_until REAL")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_api_cache_expires ON api_cache (expires_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_api_cache_stale_until ON api_cache (stale_until)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS api_cache_locks (key TEXT PRIMARY KEY, expires_at REAL NOT NULL, token TEXT)"
+            )
+            if "token" not in {row[1] for row in conn.execute("PRAGMA table_info(api_cache_locks)")}:
+                conn.execute("ALTER TABLE api_cache_locks ADD COLUMN token TEXT")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[CacheRecord]:
+        return self._select(key, "response")
+
+    def metadata(self, key: str) -> Optional[CacheRecord]:
+        return self._select(key, "''")
+
+    def _select(self, key: str, response_column: str) -> Optional[CacheRecord]:
+        try:
+            row = self._conn().execute(
+                f"SELECT {response_column}, cached_at, expires_at, COALESCE(stale_until, expires_at), cell "
+                "FROM api_cache WHERE key = ?",
+                (key,),
+            ).fetchone()
+        except sqlite3.Error as e:
+            raise CacheBackendError(str(e)) from e
+        return CacheRecord(*row) if row else None
+
+    def set(self, key: str, endpoint: str, record: CacheRecord) -> None:
+        try:
+            conn = self._conn()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO api_cache "
+                    "(key, endpoint, cached_at, expires_at, response, cell, stale_until) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, endpoint, record.cached_at, record.expires_at, record.response,
+                     record.cell, record.stale_until),
+                )
+        except sqlite3.Error as e:
+            raise CacheBackendError(str(e)) from e
+
+    def purge(self, now: float) -> int:
+        try:
+            conn = self._conn()
+            with conn:
+                cursor = conn.execute("DELETE FROM api_cache WHERE COALESCE(stale_until, expires_at) <= ?", (now,))
+                conn.execute("DELETE FROM api_cache_locks WHERE expires_at <= ?", (now,))
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            raise CacheBackendError(str(e)) from e
+
+    def lock(self, key: str, ttl: float) -> Optional[str]:
+        now = time.time()
+        token = uuid.uuid4().hex
+        try:
+            conn = self._conn()
+            with conn:
+                conn.execute("DELETE FROM api_cache_locks WHERE key = ? AND expires_at <= ?", (key, now))
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO api_cache_locks (key, expires_at, token) VALUES (?, ?, ?)",
+                    (key, now + ttl, token),
+                )
+            return token if cursor.rowcount == 1 else None
+        except sqlite3.Error as e:
+            raise CacheBackendError(str(e)) from e
+
+    def unlock(self, key: str, token: str) -> None:
+        try:
+            conn = self._conn()
+            with conn:
+                conn.execute("DELETE FROM api_cache_locks WHERE key = ? AND token = ?", (key, token))
+        except sqlite3.Error as e:
+            raise CacheBackendError(str(e)) from e
+
+
+# ============================================================================
+# ФАЙЛЫ
+# ============================================================================
+
+class FileCacheBackend(CacheBackend):
+    """По JSON-файлу на запись в каталоге `directory`.
+
+    Запись пишется во временный файл и атомарно заменяет старую (os.replace),
+    поэтому читатели никогда не видят половину файла. Запись и удаление одного
+    ключа разными процессами разделяются блокировкой fcntl на одном из
+    LOCK_STRIPES файлов блокировок (их число не растёт вместе с числом записей).
+    """
+
+    name = "file"
+    LOCK_STRIPES = 64
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._locks_dir = os.path.join(directory, "locks")
+        os.makedirs(self._locks_dir, exist_ok=True)
+
+    def _path(self, key: str, suffix: str = ".json") -> str:
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest + suffix)
+
+    def _stripe(self, path: str):
+        name = os.path.basename(path).split(".")[0]
+        return _FileLock(os.path.join(self._locks_dir, f"{int(name[:4], 16) % self.LOCK_STRIPES:02d}.lock"))
+
+    def get(self, key: str) -> Optional[CacheRecord]:
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, json.JSONDecodeError) as e:
+            raise CacheBackendError(str(e)) from e
+        if data.get("key") != key:
+            return None
+        return CacheRecord(data["response"], data["cached_at"], data["expires_at"],
+                           data["stale_until"], data.get("cell"))
+
+    def set(self, key: str, endpoint: str, record: CacheRecord) -> None:
+        path = self._path(key)
+        data = {"key": key, "endpoint": endpoint, **record._asdict()}
+        tmp_file = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            with self._stripe(path):
+                os.replace(tmp_file, path)
+        except OSError as e:
+            try:
+                os.remove(tmp_file)
+            except OSError:
+                pass
+            raise CacheBackendError(str(e)) from e
+
+    def _entries(self) -> Iterator[str]:
+        try:
+            names = os.listdir(self.directory)
+        except OSError as e:
+            raise CacheBackendError(str(e)) from e
+        for name in names:
+            if name.endswith(".json"):
+                yield os.path.join(self.directory, name)
+
+    def purge(self, now: float) -> int:
+        removed = 0
+        for path in self._entries():
+            with self._stripe(path):
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        stale_until = json.load(f).get("stale_until", 0)
+                    if stale_until <= now:
+                        os.remove(path)
+                        removed += 1
+                except (OSError, json.JSONDecodeError):
+                    continue
+        return removed
+
+    def lock(self, key: str, ttl: float) -> Optional[str]:
+        path = self._path(key, ".fetch")
+        token = uuid.uuid4().hex
+        # Проверка, снятие просроченной и создание блокировки — под блокировкой полосы,
+        # чтобы unlock другого процесса не удалил уже новую блокировку
+        try:
+            with self._stripe(path):
+                held = self._read_lock(path)
+                if held is not None:
+                    # Блокировку мог оставить завершившийся процесс — снимаем её по истечении срока
+                    if held[1] > time.time():
+                        return None
+                    os.remove(path)
+                # O_EXCL — на случай платформ без fcntl, где полоса блокирует только потоки
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(f"{token} {time.time() + ttl}")
+        except FileExistsError:
+            return None
+        except OSError as e:
+            raise CacheBackendError(str(e)) from e
+        return token
+
+    def unlock(self, key: str, token: str) -> None:
+        path = self._path(key, ".fetch")
+        try:
+            with self._stripe(path):
+                held = self._read_lock(path)
+                if held is not None and held[0] == token:
+                    os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            raise CacheBackendError(str(e)) from e
+
+    @staticmethod
+    def _read_lock(path: str) -> Optional[Tuple[str, float]]:
+        """Токен и срок блокировки из файла; None, если блокировки нет."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                token, _, expires_at = f.read().partition(" ")
+        except FileNotFoundError:
+            return None
+        try:
+            return token, float(expires_at)
+        except ValueError:
+            # Файл старого формата (пустой) — считаем блокировку истёкшей
+            return token, 0.0
+
+
+class _FileLock:
+    """Эксклюзивная блокировка fcntl.flock на время блока with (внутри процесса — threading.Lock)."""
+
+    _thread_locks: dict = {}
+    _thread_locks_guard = threading.Lock()
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._thread_locks_guard:
+            self._thread_lock = self._thread_locks.setdefault(path, threading.Lock())
+        self._fd: Optional[int] = None
+
+    def __enter__(self) -> "_FileLock":
+        self._thread_lock.acquire()
+        if fcntl is not None:
+            try:
+                self._fd = os.open(self.path, os.O_CREAT | os.O_RDWR)
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            except OSError:
+                if self._fd is not None:
+                    os.close(self._fd)
+                    self._fd = None
+                self._thread_lock.release()
+                raise
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._thread_lock.release()
+
+
+# ============================================================================
+# REDIS (RESP)
+# ============================================================================
+
+class _RespConnection:
+    """Минимальный клиент протокола RESP2: команды массивом bulk-строк, разбор ответов."""
+
+    def __init__(self, host: str, port: int, timeout: float):
+        self._sock = socket.create_connection((host, port), timeout=timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._reader = self._sock.makefile("rb")
+
+    def command(self, *args: Any) -> Any:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            value = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(value), value))
+        self._sock.sendall(b"".join(parts))
+        return self._read_reply()
+
+    def _read_line(self) -> bytes:
+        line = self._reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("соединение с сервером кэша закрыто")
+        return line[:-2]
+
+    def _read_reply(self) -> Any:
+        line = self._read_line()
+        kind, payload = line[:1], line[1:]
+        if kind == b"+":
+            return payload.decode("utf-8")
+        if kind == b"-":
+            raise CacheBackendError(payload.decode("utf-8", "replace"))
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            if len(data) != length + 2:
+                raise ConnectionError("соединение с сервером кэша закрыто")
+            return data[:-2]
+        if kind == b"*":
+            count = int(payload)
+            return None if count < 0 else [self._read_reply() for _ in range(count)]
+        raise CacheBackendError(f"неизвестный ответ сервера кэша: {line[:20]!r}")
+
+    def close(self) -> None:
+        try:
+            self._reader.close()
+            self._sock.close()
+        except OSError:
+            pass
+
+
+# Снять блокировку, только если в ней всё ещё наш токен (атомарно на сервере)
+_UNLOCK_SCRIPT = (
+    'if redis.call("GET", KEYS[1]) == ARGV[1] then return redis.call("DEL", KEYS[1]) else return 0 end'
+)
+
+
+class RedisCacheBackend(CacheBackend):
+    """Записи в сервере с протоколом Redis: срок хранения задаёт сам сервер (SET ... PX).
+
+    URL вида redis://[:пароль@]хост:порт/номер_базы. Соединение своё у каждого
+    потока. После ошибки соединения новые попытки не делаются RECONNECT_DELAY
+    секунд, чтобы недоступный сервер не замедлял каждый запрос.
+    """
+
+    name = "redis"
+    RECONNECT_DELAY = 5.0
+
+    def __init__(self, url: str, prefix: str = "weather:", timeout: float = 2.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.prefix = prefix
+        self.timeout = timeout
+        self._local = threading.local()
+        self._down_until = 0.0
+
+    def _conn(self) -> _RespConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+        if time.monotonic() < self._down_until:
+            raise CacheBackendError(f"сервер кэша {self.host}:{self.port} недоступен")
+        try:
+            conn = _RespConnection(self.host, self.port, self.timeout)
+            if self.password:
+                conn.command("AUTH", self.password)
+            if self.db:
+                conn.command("SELECT", self.db)
+        except (OSError, CacheBackendError) as e:
+            self._down_until = time.monotonic() + self.RECONNECT_DELAY
+            raise CacheBackendError(f"сервер кэша {self.host}:{self.port}: {e}") from e
+        self._local.conn = conn
+        return conn
+
+    def _command(self, *args: Any) -> Any:
+        conn = self._conn()
+        try:
+            return conn.command(*args)
+        except (OSError, ValueError) as e:
+            # Соединение в неизвестном состоянии — закрываем, следующий вызов откроет новое
+            conn.close()
+            self._local.conn = None
+            raise CacheBackendError(str(e)) from e
+
+    def get(self, key: str) -> Optional[CacheRecord]:
+        raw = self._command("GET", self.prefix + key)
+        if raw is None:
+            return None
+        try:
+            data: List[Any] = json.loads(raw)
+            return CacheRecord(*data)
+        except (json.JSONDecodeError, TypeError) as e:
+            raise CacheBackendError(str(e)) from e
+
+    def set(self, key: str, endpoint: str, record: CacheRecord) -> None:
+        ttl_ms = int((record.stale_until - time.time()) * 1000)
+        if ttl_ms <= 0:
+            return
+        self._command("SET", self.prefix + key, json.dumps(list(record), ensure_ascii=False), "PX", ttl_ms)
+
+    def lock(self, key: str, ttl: float) -> Optional[str]:
+        token = uuid.uuid4().hex
+        reply = self._command("SET", f"{self.prefix}lock:{key}", token, "NX", "PX", max(int(ttl * 1000), 1))
+        return token if reply == "OK" else None
+
+    def unlock(self, key: str, token: str) -> None:
+        self._command("EVAL", _UNLOCK_SCRIPT, 1, f"{self.prefix}lock:{key}", token)
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def create_cache_backend(name: str, sqlite_path: str, directory: str, url: str) -> CacheBackend:
+    """Хранилище по названию (sqlite, file, redis); неизвестное название — sqlite."""
+    if name == "file":
+        return FileCacheBackend(directory)
+    if name == "redis":
+        return RedisCacheBackend(url)
+    if name != "sqlite":
+        print(f"Неизвестное хранилище кэша {name!r}, используется sqlite")
+    return SQLiteCacheBackend(sqlite_path)
@@ -0,0 +1,174 @@
+from array import array
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.api_client import get_hourly_weather, prefetcher
+from src.memory_cache import MemoryCache
+from src.storage import get_api_cache_key, get_api_cache_metadata, get_stale_age
+
+# Разобранные прогнозы держим в памяти столько же, сколько живёт запись API кэша.
+# Это и есть кэш прогнозов в памяти: сырые ответы /forecast в общий кэш в памяти не попадают
+# (storage.API_MEMORY_CACHE_SKIP_ENDPOINTS)
+_parsed_cache = MemoryCache(max_entries=1024)
+
+# Коды погодных условий OpenWeather: 5xx — дождь, 6xx — снег
+RAIN_CODES = range(500, 600)
+SNOW_CODES = range(600, 700)
+
+
+class ForecastDay:
+    """Один день прогноза: диапазон записей в колонках и агрегаты.
+
+    Дата разбирается один раз при построении, а тексты кнопки и подробностей
+    собираются при первом показе и запоминаются до следующего получения прогноза.
+    """
+
+    __slots__ = ("forecast", "date", "day", "start", "end", "avg_temp", "min_temp", "max_temp",
+                 "has_rain", "has_snow", "_button_text", "_details_text")
+
+    def __init__(self, forecast: "ParsedForecast", date: str, start: int, end: int):
+        self.forecast = forecast
+        self.date = date
+        self.day = datetime.fromtimestamp(forecast.dt[start], timezone.utc).date()
+        self.start = start
+        self.end = end
+
+        temps = forecast.temp[start:end]
+        self.avg_temp = sum(temps) / len(temps)
+        self.min_temp = min(temps)
+        self.max_temp = max(temps)
+        self.has_rain = forecast.any_weather(RAIN_CODES, start, end)
+        self.has_snow = forecast.any_weather(SNOW_CODES, start, end)
+        self._button_text: Optional[str] = None
+        self._details_text: Optional[str] = None
+
+    @property
+    def button_text(self) -> str:
+        if self._button_text is None:
+            self._button_text = f"{self.day.strftime('%d.%m')} ({self.avg_temp:.1f}°C)"
+        return self._button_text
+
+    @property
+    def details_text(self) -> str:
+        if self._details_text is None:
+            forecast = self.forecast
+            parts = [f"📅 *{self.day.strftime('%d %B %Y')}*\n\n"]
+            parts.extend(
+                f"🕐 *{forecast.time_text(i)[11:16]}*\n"
+                f"🌡 {forecast.temp[i]}°C, {forecast.description(i)}\n"
+                f"💧 {forecast.humidity[i]}%, 💨 {forecast.wind[i]} м/с\n\n"
+                for i in range(self.start, self.end)
+            )
+            self._details_text = "".join(parts)
+        return self._details_text
+
+
+class ParsedForecast:
+    """Прогноз на 5 дней в колоночном виде, разобранный один раз на каждое получение данных от API.
+
+    Вместо списка вложенных словарей хранятся компактные массивы: время (unix),
+    температура, влажность, ветер и код погоды. Описания погоды повторяются,
+    поэтому хранятся один раз, а в колонке — только их индексы.
+    """
+
+    __slots__ = ("city_name", "dt", "temp", "humidity", "wind", "weather_id",
+                 "description_index", "descriptions", "days", "dates")
+
+    def __init__(self, forecast: Dict[str, Any]):
+        self.city_name: Optional[str] = forecast.get("city", {}).get("name")
+        self.dt = array("q")
+        self.temp = array("d")
+        self.humidity = array("B")
+        self.wind = array("d")
+        self.weather_id = array("H")
+        self.description_index = array("H")
+
+        descriptions: Dict[str, int] = {}
+        for item in forecast.get("list", []):
+            weather = item.get("weather", [{}])[0]
+            description = weather.get("description", "N/A")
+            self.dt.append(item["dt"])
+            self.temp.append(item["main"]["temp"])
+            self.humidity.append(int(item["main"].get("humidity", 0)))
+            self.wind.append(item.get("wind", {}).get("speed", 0.0))
+            self.weather_id.append(weather.get("id", 0))
+            self.description_index.append(descriptions.setdefault(description, len(descriptions)))
+        self.descriptions: Tuple[str, ...] = tuple(descriptions)
+
+        # Группируем по дням (записи в ответе уже отсортированы по времени)
+        self.days: Dict[str, ForecastDay] = {}
+        for date, start, end in self._day_ranges():
+            self.days[date] = ForecastDay(self, date, start, end)
+        self.dates: List[str] = sorted(self.days)
+
+    def __len__(self) -> int:
+        return len(self.dt)
+
+    def time_text(self, index: int) -> str:
+        """Время записи в формате dt_txt ответа API (UTC)."""
+        return datetime.fromtimestamp(self.dt[index], timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+    def description(self, index: int) -> str:
+        return self.descriptions[self.description_index[index]]
+
+    def _day_ranges(self) -> List[Tuple[str, int, int]]:
+        ranges: List[Tuple[str, int, int]] = []
+        day_seconds = 86400
+        start = 0
+        for i in range(1, len(self.dt) + 1):
+            if i == len(self.dt) or self.dt[i] // day_seconds != self.dt[start] // day_seconds:
+                ranges.append((self.time_text(start)[:10], start, i))
+                start = i
+        return ranges
+
+    def any_weather(self, codes: range, start: int = 0, end: Optional[int] = None) -> bool:
+        """Есть ли среди записей [start, end) погодный код из диапазона codes."""
+        return any(code in codes for code in self.weather_id[start:end])
+
+    def daily_means(self) -> Dict[str, float]:
+        """Средняя температура по дням."""
+        return {date: self.days[date].avg_temp for date in self.dates}
+
+    def upcoming_precipitation(self, steps: int) -> Optional[str]:
+        """Ожидаемые осадки в ближайшие `steps` записей (по 3 часа): "rain", "snow" или None."""
+        if self.any_weather(RAIN_CODES, 0, steps):
+            return "rain"
+        if self.any_weather(SNOW_CODES, 0, steps):
+            return "snow"
+        return None
+
+
+def get_cached_forecast(latitude: float, longitude: float) -> Optional[ParsedForecast]:
+    """Разобранный прогноз из памяти без обращения к хранилищу кэша и API."""
+    parsed = _parsed_cache.get(get_api_cache_key(latitude, longitude, "forecast"))
+    if parsed is not None:
+        prefetcher.record(latitude, longitude, "forecast")
+    return parsed
+
+
+def parse_forecast(latitude: float, longitude: float, forecast: Optional[Dict[str, Any]]) -> Optional[ParsedForecast]:
+    """Разобрать ответ API и запомнить результат до истечения записи API кэша."""
+    if not forecast:
+        return None
+
+    try:
+        parsed = ParsedForecast(forecast)
+    except (KeyError, TypeError, IndexError, ValueError, OverflowError) as e:
+        print(f"Ошибка при разборе прогноза: {e}")
+        return None
+
+    # Устаревший прогноз не запоминаем: его скоро заменит фоновое обновление.
+    # Срок записи читается из хранилища только здесь — при промахе, когда прогноз и так загружался оттуда
+    if get_stale_age(forecast) is None:
+        meta = get_api_cache_metadata(latitude, longitude, "forecast")
+        if meta:
+            _parsed_cache.set(meta["key"], parsed, meta["expires_at"])
+    return parsed
+
+
+def get_parsed_forecast(latitude: float, longitude: float) -> Optional[ParsedForecast]:
+    """Получить прогноз (с API кэшированием) в разобранном виде."""
+    parsed = get_cached_forecast(latitude, longitude)
+    if parsed is not None:
+        return parsed
+    return parse_forecast(latitude, longitude, get_hourly_weather(latitude, longitude))
@@ -0,0 +1,296 @@
+"""
+Локальный справочник городов (gazetteer) для геокодинга без запросов к API.
+
+Индекс собирается один раз из выгрузки GeoNames (например, cities15000.txt)
+и открывается через mmap, поэтому загрузка при старте почти мгновенная:
+
+    python -m src.gazetteer cities15000.txt database/gazetteer.idx [admin1CodesASCII.txt]
+
+Путь к готовому индексу задаётся переменной окружения GAZETTEER_PATH.
+"""
+
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import unicodedata
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from src.storage import normalize_city_name
+
+GAZETTEER_PATH = os.getenv("GAZETTEER_PATH", "")
+
+_MAGIC = b"GZT1"
+# magic, число городов, число ключей
+_HEADER = struct.Struct("<4sII")
+# lat, lon, население, смещение названия, смещение региона, код страны
+_RECORD = struct.Struct("<ddIII2s")
+# смещение ключа, номер города
+_KEY = struct.Struct("<II")
+_LENGTH = struct.Struct("<H")
+_NO_REGION = 0xFFFFFFFF
+
+# Сколько ключей с общим началом просматривать при нечётком поиске
+FUZZY_SCAN_LIMIT = 5000
+
+_TRANSLIT = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ж": "zh", "з": "z",
+    "и": "i", "й": "y", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o", "п": "p",
+    "р": "r", "с": "s", "т": "t", "у": "u", "ф": "f", "х": "kh", "ц": "ts", "ч": "ch",
+    "ш": "sh", "щ": "shch", "ъ": "", "ы": "y", "ь": "", "э": "e", "ю": "yu", "я": "ya",
+    "і": "i", "ї": "yi", "є": "ye", "ґ": "g", "ў": "u",
+}
+_KEY_RE = re.compile(r"^[a-z0-9 .\-]+$")
+
+
+def make_key(name: str) -> str:
+    """Ключ поиска: нормализованное название латиницей без диакритики."""
+    normalized = normalize_city_name(name).replace("'", "").replace("’", "")
+    latin = "".join(_TRANSLIT.get(char, char) for char in normalized)
+    decomposed = unicodedata.normalize("NFKD", latin)
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def _max_distance(key: str) -> int:
+    if len(key) <= 3:
+        return 0
+    return 1 if len(key) <= 6 else 2
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """Расстояние Левенштейна с отсечением: результат > limit означает «слишком далеко»."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class Gazetteer:
+    """Индекс городов в файле, открытом через mmap.
+
+    Ключи (название, ascii-название и альтернативные названия в транслитерации)
+    отсортированы, поэтому точный поиск — бинарный, а нечёткий просматривает
+    только ключи с теми же первыми буквами.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.record_count, self.key_count = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC:
+            self._mm.close()
+            raise ValueError(f"{path}: не является индексом gazetteer")
+        self._records_base = _HEADER.size
+        self._keys_base = self._records_base + self.record_count * _RECORD.size
+        self._strings_base = self._keys_base + self.key_count * _KEY.size
+
+    def close(self) -> None:
+        self._mm.close()
+
+    def _string(self, offset: int) -> str:
+        start = self._strings_base + offset
+        (length,) = _LENGTH.unpack_from(self._mm, start)
+        return self._mm[start + _LENGTH.size:start + _LENGTH.size + length].decode("utf-8")
+
+    def _key_at(self, index: int) -> Tuple[str, int]:
+        offset, record = _KEY.unpack_from(self._mm, self._keys_base + index * _KEY.size)
+        return self._string(offset), record
+
+    def _record(self, index: int) -> Tuple[int, Dict[str, Any]]:
+        lat, lon, population, name_offset, region_offset, country = _RECORD.unpack_from(
+            self._mm, self._records_base + index * _RECORD.size
+        )
+        location = {
+            "name": self._string(name_offset),
+            "state": self._string(region_offset) if region_offset != _NO_REGION else None,
+            "country": country.decode("ascii"),
+            "lat": lat,
+            "lon": lon,
+        }
+        return population, location
+
+    def _lower_bound(self, key: str) -> int:
+        lo, hi = 0, self.key_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key_at(mid)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _exact(self, key: str) -> List[int]:
+        records = []
+        index = self._lower_bound(key)
+        while index < self.key_count:
+            candidate, record = self._key_at(index)
+            if candidate != key:
+                break
+            records.append(record)
+            index += 1
+        return records
+
+    def _fuzzy(self, key: str) -> List[int]:
+        limit = _max_distance(key)
+        if not limit:
+            return []
+        prefix = key[:2]
+        best: Dict[int, int] = {}
+        index = self._lower_bound(prefix)
+        end = min(self.key_count, index + FUZZY_SCAN_LIMIT)
+        while index < end:
+            candidate, record = self._key_at(index)
+            if not candidate.startswith(prefix):
+                break
+            distance = _edit_distance(key, candidate, limit)
+            if distance <= limit and distance < best.get(record, limit + 1):
+                best[record] = distance
+            index += 1
+        if not best:
+            return []
+        closest = min(best.values())
+        return [record for record, distance in best.items() if distance == closest]
+
+    def lookup(self, city: str, limit: int = 1, fuzzy: bool = False) -> List[Dict[str, Any]]:
+        """До `limit` городов по названию на кириллице или латинице, крупнейшие первыми.
+
+        Без `fuzzy` ищутся только точные совпадения (с учётом транслитерации):
+        похожее название может быть другим городом ("Lyons" — не "Lyon").
+        """
+        key = make_key(city)
+        if not key:
+            return []
+        records = self._exact(key) or (self._fuzzy(key) if fuzzy else [])
+        found = [self._record(record) for record in dict.fromkeys(records)]
+        found.sort(key=lambda item: item[0], reverse=True)
+        return [location for _, location in found[:limit]]
+
+
+_gazetteer: Optional[Gazetteer] = None
+_gazetteer_loaded = False
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer() -> Optional[Gazetteer]:
+    """Индекс из GAZETTEER_PATH или None, если он не настроен или не открывается."""
+    global _gazetteer, _gazetteer_loaded
+    if _gazetteer_loaded:
+        return _gazetteer
+    with _gazetteer_lock:
+        if not _gazetteer_loaded:
+            if GAZETTEER_PATH and os.path.exists(GAZETTEER_PATH):
+                try:
+                    _gazetteer = Gazetteer(GAZETTEER_PATH)
+                except (OSError, ValueError, struct.error) as e:
+                    print(f"Не удалось открыть gazetteer: {e}")
+            _gazetteer_loaded = True
+    return _gazetteer
+
+
+def lookup_city(city: str, limit: int = 1, fuzzy: bool = False) -> Optional[List[Dict[str, Any]]]:
+    """Найти город в локальном справочнике; None, если справочника нет или город не найден.
+
+    Нечёткие совпадения (`fuzzy=True`) — только запасной вариант, когда API геокодинга города не нашёл.
+    """
+    gazetteer = get_gazetteer()
+    if gazetteer is None:
+        return None
+    return gazetteer.lookup(city, limit, fuzzy) or None
+
+
+# ============================================================================
+# СБОРКА ИНДЕКСА
+# ============================================================================
+
+def _read_admin1(path: Optional[str]) -> Dict[str, str]:
+    """Названия регионов из admin1CodesASCII.txt: "RU.48" -> "Moscow"."""
+    if not path:
+        return {}
+    regions = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            parts = line.rstrip("\n").split("\t")
+            if len(parts) >= 2:
+                regions[parts[0]] = parts[1]
+    return regions
+
+
+def _read_geonames(path: str, regions: Dict[str, str]) -> Iterable[Tuple[Dict[str, Any], List[str]]]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            parts = line.rstrip("\n").split("\t")
+            # Формат GeoNames: только населённые пункты (feature class P)
+            if len(parts) < 15 or parts[6] != "P":
+                continue
+            country = parts[8]
+            city = {
+                "name": parts[1],
+                "state": regions.get(f"{country}.{parts[10]}"),
+                "country": country[:2],
+                "lat": float(parts[4]),
+                "lon": float(parts[5]),
+                "population": int(parts[14] or 0),
+            }
+            names = [parts[1], parts[2]] + [name for name in parts[3].split(",") if name]
+            yield city, names
+
+
+def build_gazetteer(dump_path: str, out_path: str, admin1_path: Optional[str] = None) -> Tuple[int, int]:
+    """Собрать индекс из выгрузки GeoNames. Возвращает (число городов, число ключей)."""
+    regions = _read_admin1(admin1_path)
+    strings = bytearray()
+    string_offsets: Dict[str, int] = {}
+
+    def intern(value: str) -> int:
+        offset = string_offsets.get(value)
+        if offset is None:
+            encoded = value.encode("utf-8")[:0xFFFF]
+            offset = len(strings)
+            strings.extend(_LENGTH.pack(len(encoded)))
+            strings.extend(encoded)
+            string_offsets[value] = offset
+        return offset
+
+    records = bytearray()
+    keys: List[Tuple[str, int]] = []
+    for index, (city, names) in enumerate(_read_geonames(dump_path, regions)):
+        records.extend(_RECORD.pack(
+            city["lat"], city["lon"], min(city["population"], 0xFFFFFFFF),
+            intern(city["name"]),
+            intern(city["state"]) if city["state"] else _NO_REGION,
+            city["country"].encode("ascii", "replace").ljust(2)[:2],
+        ))
+        # Только ключи латиницей: названия на других алфавитах пользователи бота не вводят
+        for key in {make_key(name) for name in names}:
+            if key and _KEY_RE.match(key):
+                keys.append((key, index))
+
+    keys.sort()
+    record_count = len(records) // _RECORD.size
+    tmp_path = f"{out_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, record_count, len(keys)))
+        f.write(records)
+        for key, record in keys:
+            f.write(_KEY.pack(intern(key), record))
+        f.write(strings)
+    os.replace(tmp_path, out_path)
+    return record_count, len(keys)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (3, 4):
+        print("Использование: python -m src.gazetteer <cities.txt> <out.idx> [admin1CodesASCII.txt]")
+        raise SystemExit(1)
+    cities, key_total = build_gazetteer(sys.argv[1], sys.argv[2], sys.argv[3] if len(sys.argv) == 4 else None)
+    print(f"Готово: {cities} городов, {key_total} ключей -> {sys.argv[2]}")
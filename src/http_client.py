@@ -0,0 +1,126 @@
+import os
+import socket
+import threading
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# ============================================================================
+# НАСТРОЙКИ ПУЛА СОЕДИНЕНИЙ
+# ============================================================================
+
+# Сколько пулов (по одному на хост) держать открытыми
+POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "4"))
+# Максимум соединений в пуле одного хоста
+POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "16"))
+# Ждать свободное соединение вместо открытия лишнего сверх POOL_MAXSIZE
+POOL_BLOCK = os.getenv("HTTP_POOL_BLOCK", "0") == "1"
+
+# TCP keep-alive, чтобы простаивающие соединения не обрывались по пути
+KEEPALIVE_SOCKET_OPTIONS = HTTPConnection.default_socket_options + [
+    (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+]
+
+
+class PoolStats:
+    """Счётчики переиспользования соединений (hit — взято из пула, miss — открыто новое)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.misses = 0
+
+    def record_get(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def record_miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            hits = max(self.requests - self.misses, 0)
+            reuse_rate = hits / self.requests if self.requests else 0.0
+            return {
+                "requests": self.requests,
+                "hits": hits,
+                "misses": self.misses,
+                "reuse_rate": round(reuse_rate, 3),
+            }
+
+
+pool_stats = PoolStats()
+
+
+class _CountingPoolMixin:
+    """Считает выдачу соединений из пула и открытие новых."""
+
+    def _get_conn(self, timeout=None):
+        pool_stats.record_get()
+        return super()._get_conn(timeout)
+
+    def _new_conn(self):
+        pool_stats.record_miss()
+        return super()._new_conn()
+
+
+class _CountingHTTPConnectionPool(_CountingPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class _CountingHTTPSConnectionPool(_CountingPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter с keep-alive сокетами и подсчётом переиспользования соединений."""
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        pool_kwargs.setdefault("socket_options", KEEPALIVE_SOCKET_OPTIONS)
+        super().init_poolmanager(connections, maxsize, block=block, **pool_kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CountingHTTPConnectionPool,
+            "https": _CountingHTTPSConnectionPool,
+        }
+
+
+# Один адаптер (и его пул urllib3, потокобезопасный) на весь процесс
+_adapter = PooledHTTPAdapter(
+    pool_connections=POOL_CONNECTIONS,
+    pool_maxsize=POOL_MAXSIZE,
+    pool_block=POOL_BLOCK,
+)
+# Session не гарантирует потокобезопасность, поэтому у каждого потока своя,
+# но все они смонтированы на общий адаптер и делят соединения
+_local = threading.local()
+
+
+def get_session() -> requests.Session:
+    """Сессия текущего потока, использующая общий пул соединений."""
+    session: Optional[requests.Session] = getattr(_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        session.headers["Connection"] = "keep-alive"
+        session.mount("http://", _adapter)
+        session.mount("https://", _adapter)
+        _local.session = session
+    return session
+
+
+def http_get(url: str, timeout: float = 10) -> requests.Response:
+    """GET-запрос через общий пул соединений."""
+    return get_session().get(url, timeout=timeout)
+
+
+def get_pool_stats() -> Dict[str, float]:
+    """Статистика переиспользования соединений."""
+    return pool_stats.snapshot()
+
+
+def close_pool() -> None:
+    """Закрыть все соединения пула."""
+    _adapter.close()
@@ -0,0 +1,302 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from src.memory_cache import MemoryCache
+from src.singleflight import AsyncSingleFlight, SingleFlight
+from src.storage import get_stale_age, normalize_city_name
+
+# Пауза перед запросом к API: если пользователь успел напечатать дальше, запрос не выполняется
+INLINE_DEBOUNCE_MS = int(os.getenv("INLINE_DEBOUNCE_MS", "300"))
+# Сколько ждать ответа API до ответа Telegram подсказками из кэша
+INLINE_DEADLINE_SECONDS = float(os.getenv("INLINE_DEADLINE_SECONDS", "3"))
+# Время жизни результатов inline-запроса (найденных и «не найдено»)
+INLINE_RESULT_TTL = int(os.getenv("INLINE_RESULT_TTL", "600"))
+INLINE_NOT_FOUND_TTL = 60
+INLINE_MAX_RESULTS = 5
+INLINE_WORKERS = int(os.getenv("INLINE_WORKERS", "4"))
+
+# Результат ответа: (варианты {"location", "weather"}, точное совпадение или подсказки по префиксу)
+InlineAnswer = Tuple[List[Dict[str, Any]], bool]
+
+
+class _TrieNode:
+    __slots__ = ("children", "keys")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.keys: Set[str] = set()
+
+
+class InlineIndex:
+    """Кэш результатов inline-запросов и префиксное дерево уже найденных городов.
+
+    Результаты хранятся по нормализованному запросу. В дерево попадают сам запрос
+    и названия найденных городов, так что по началу названия можно сразу
+    предложить города, которые уже искали.
+    """
+
+    def __init__(self, max_entries: int = 4096):
+        self._results = MemoryCache(max_entries=max_entries)
+        self._root = _TrieNode()
+        # Запрос -> названия, под которыми он записан в дерево (чтобы удалить его только по этим путям)
+        self._names: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        """Закэшированные результаты для нормализованного запроса."""
+        return self._results.get(key)
+
+    def store(self, key: str, results: List[Dict[str, Any]]) -> None:
+        # Результаты с устаревшей погодой храним недолго: в кэше API она скоро обновится
+        stale = any(get_stale_age(entry.get("weather")) is not None for entry in results)
+        ttl = INLINE_RESULT_TTL if results and not stale else INLINE_NOT_FOUND_TTL
+        self._results.set(key, results, time.time() + ttl)
+        if not results:
+            return
+        names = {key}
+        for entry in results:
+            name = (entry.get("location") or {}).get("name")
+            if name:
+                names.add(normalize_city_name(name))
+        names.discard("")
+        with self._lock:
+            for name in names:
+                self._insert(name, key)
+            self._names.setdefault(key, set()).update(names)
+
+    def suggest(self, prefix: str, limit: int = INLINE_MAX_RESULTS) -> List[Dict[str, Any]]:
+        """Ранее найденные города, название которых начинается с `prefix`."""
+        with self._lock:
+            node = self._root
+            for char in prefix:
+                node = node.children.get(char)
+                if node is None:
+                    return []
+            keys = self._collect(node, limit)
+
+        suggestions: List[Dict[str, Any]] = []
+        seen = set()
+        for key in keys:
+            results = self._results.get(key)
+            if results is None:
+                # Результат устарел — убираем его из дерева
+                self._discard(key)
+                continue
+            for entry in results:
+                location = entry.get("location") or {}
+                ident = (location.get("lat"), location.get("lon"))
+                if ident in seen:
+                    continue
+                seen.add(ident)
+                suggestions.append(entry)
+                if len(suggestions) >= limit:
+                    return suggestions
+        return suggestions
+
+    def _insert(self, name: str, key: str) -> None:
+        node = self._root
+        for char in name:
+            node = node.children.setdefault(char, _TrieNode())
+        node.keys.add(key)
+
+    def _collect(self, node: _TrieNode, limit: int) -> List[str]:
+        # Обход в ширину: сначала более короткие (точнее совпадающие) названия
+        keys: List[str] = []
+        level = [node]
+        while level and len(keys) < limit:
+            next_level = []
+            for current in level:
+                for key in sorted(current.keys):
+                    if key not in keys:
+                        keys.append(key)
+                next_level.extend(current.children.values())
+            level = next_level
+        return keys
+
+    def _discard(self, key: str) -> None:
+        with self._lock:
+            for name in self._names.pop(key, ()):
+                # Спускаемся по пути названия и убираем опустевшие узлы снизу вверх
+                path = [self._root]
+                for char in name:
+                    node = path[-1].children.get(char)
+                    if node is None:
+                        break
+                    path.append(node)
+                else:
+                    path[-1].keys.discard(key)
+                    for depth in range(len(name), 0, -1):
+                        node = path[depth]
+                        if node.keys or node.children:
+                            break
+                        del path[depth - 1].children[name[depth - 1]]
+
+
+class InlineEngine:
+    """Обработка inline-запросов для синхронного бота.
+
+    Повторные и уже найденные запросы отвечаются из кэша. Новый запрос выполняется
+    в пуле потоков после короткой паузы (debounce); более новый запрос того же
+    пользователя отменяет предыдущий. Если API не ответил к сроку, пользователь
+    получает подсказки по префиксу, а результат попадёт в кэш для следующего запроса.
+    """
+
+    def __init__(self, fetch: Callable[[str], Optional[List[Dict[str, Any]]]],
+                 debounce_ms: int = INLINE_DEBOUNCE_MS, deadline: float = INLINE_DEADLINE_SECONDS,
+                 workers: int = INLINE_WORKERS):
+        self.index = InlineIndex()
+        self._fetch = fetch
+        self._debounce = debounce_ms / 1000
+        self._deadline = deadline
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="inline")
+        self._flights = SingleFlight()
+        self._lock = threading.Lock()
+        self._latest: Dict[str, int] = {}
+        self._pending: Dict[str, Future] = {}
+        self._seq = 0
+        self.superseded = 0
+
+    def resolve(self, user_id: Any, query: str) -> Optional[InlineAnswer]:
+        """Ответ на запрос или None, если отвечать не нужно (запрос устарел или нет данных к сроку)."""
+        key = normalize_city_name(query)
+        if not key:
+            return None
+
+        user_id = str(user_id)
+        token = self._begin(user_id)
+        cached = self.index.get(key)
+        if cached is not None:
+            self._finish(user_id, token)
+            return cached, True
+
+        future = self._pool.submit(self._run, user_id, token, query, key)
+        with self._lock:
+            self._pending[user_id] = future
+        timed_out = False
+        current = False
+        try:
+            results = future.result(timeout=self._deadline)
+        except CancelledError:
+            return None
+        except FutureTimeoutError:
+            timed_out = True
+            suggestions = self.index.suggest(key)
+            return (suggestions, False) if suggestions else None
+        finally:
+            with self._lock:
+                if self._pending.get(user_id) is future:
+                    del self._pending[user_id]
+            if timed_out:
+                # Загрузка продолжается и заполнит кэш — запрос завершится вместе с ней
+                future.add_done_callback(lambda _: self._finish(user_id, token))
+            else:
+                current = self._finish(user_id, token)
+
+        if results is None or not current:
+            return None
+        return results, True
+
+    def _begin(self, user_id: str) -> int:
+        with self._lock:
+            self._seq += 1
+            token = self._seq
+            self._latest[user_id] = token
+            previous = self._pending.pop(user_id, None)
+        if previous is not None and not previous.done():
+            previous.cancel()
+            self.superseded += 1
+        return token
+
+    def _is_current(self, user_id: str, token: int) -> bool:
+        with self._lock:
+            return self._latest.get(user_id) == token
+
+    def _finish(self, user_id: str, token: int) -> bool:
+        """Завершить запрос: убрать пользователя из _latest, если запрос всё ещё последний."""
+        with self._lock:
+            if self._latest.get(user_id) != token:
+                return False
+            del self._latest[user_id]
+            return True
+
+    def _run(self, user_id: str, token: int, query: str, key: str) -> Optional[List[Dict[str, Any]]]:
+        if self._debounce:
+            time.sleep(self._debounce)
+        if not self._is_current(user_id, token):
+            return None
+        return self._flights.do(key, lambda: self._load(query, key))
+
+    def _load(self, query: str, key: str) -> List[Dict[str, Any]]:
+        results = self.index.get(key)
+        if results is None:
+            results = self._fetch(query) or []
+            self.index.store(key, results)
+        return results
+
+
+class AsyncInlineEngine:
+    """Асинхронный вариант InlineEngine: устаревшие запросы пользователя отменяются как задачи."""
+
+    def __init__(self, fetch: Callable[[str], Awaitable[Optional[List[Dict[str, Any]]]]],
+                 debounce_ms: int = INLINE_DEBOUNCE_MS, deadline: float = INLINE_DEADLINE_SECONDS):
+        self.index = InlineIndex()
+        self._fetch = fetch
+        self._debounce = debounce_ms / 1000
+        self._deadline = deadline
+        self._flights = AsyncSingleFlight()
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.superseded = 0
+
+    async def resolve(self, user_id: Any, query: str) -> Optional[InlineAnswer]:
+        key = normalize_city_name(query)
+        if not key:
+            return None
+
+        user_id = str(user_id)
+        previous = self._tasks.pop(user_id, None)
+        if previous is not None and not previous.done():
+            previous.cancel()
+            self.superseded += 1
+
+        cached = self.index.get(key)
+        if cached is not None:
+            return cached, True
+
+        task = asyncio.ensure_future(self._run(query, key))
+        self._tasks[user_id] = task
+        try:
+            # shield: по истечении срока загрузка продолжается и заполнит кэш
+            results = await asyncio.wait_for(asyncio.shield(task), self._deadline)
+        except asyncio.TimeoutError:
+            suggestions = self.index.suggest(key)
+            return (suggestions, False) if suggestions else None
+        except asyncio.CancelledError:
+            if task.cancelled():
+                return None
+            raise
+        finally:
+            if task.done():
+                self._forget(user_id, task)
+            else:
+                task.add_done_callback(lambda _: self._forget(user_id, task))
+        return results, True
+
+    def _forget(self, user_id: str, task: asyncio.Task) -> None:
+        if self._tasks.get(user_id) is task:
+            del self._tasks[user_id]
+
+    async def _run(self, query: str, key: str) -> List[Dict[str, Any]]:
+        if self._debounce:
+            await asyncio.sleep(self._debounce)
+        return await self._flights.do(key, lambda: self._load(query, key))
+
+    async def _load(self, query: str, key: str) -> List[Dict[str, Any]]:
+        results = self.index.get(key)
+        if results is None:
+            results = await self._fetch(query) or []
+            self.index.store(key, results)
+        return results
@@ -0,0 +1,166 @@
+import asyncio
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from src.api_client import get_weather_by_coordinates
+from src.forecast import ParsedForecast, get_parsed_forecast
+from src.quota import PRIORITY_BACKGROUND, request_priority
+from src.subscribers import CellGroup
+
+# Сколько прогнозов запрашивать одновременно
+NOTIFICATION_FETCH_WORKERS = int(os.getenv("NOTIFICATION_FETCH_WORKERS", "8"))
+
+# Сколько шагов прогноза (по 3 часа) проверять на осадки
+FORECAST_STEPS = 4  # 12 часов вперед
+
+
+def build_precipitation_message(forecast: Optional[ParsedForecast]) -> Optional[str]:
+    """Текст предупреждения, если в ближайшие 12 часов ожидается дождь или снег."""
+    if not forecast:
+        return None
+
+    precipitation = forecast.upcoming_precipitation(FORECAST_STEPS)
+    if precipitation == "rain":
+        return "🌧 *Внимание!*\nВ ближайшие 12 часов ожидается дождь. Возьмите зонт!"
+    if precipitation == "snow":
+        return "❄️ *Внимание!*\nВ ближайшие 12 часов ожидается снег. Одевайтесь теплее!"
+    return None
+
+
+def build_notification(message: Optional[str], weather: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Итоговый текст уведомления: предупреждение и текущая температура (без погоды не отправляем)."""
+    if not message or not weather:
+        return None
+    return message + f"\n\n🌡 Текущая температура: {weather['main']['temp']}°C"
+
+
+def _evaluate_cell(group: CellGroup) -> Optional[str]:
+    """Получить прогноз ячейки один раз и собрать текст уведомления для всей группы."""
+    location = group[0][1]
+    # Рассылка — фоновая задача: при нехватке квоты API она уступает запросам пользователей
+    with request_priority(PRIORITY_BACKGROUND):
+        message = build_precipitation_message(get_parsed_forecast(location["lat"], location["lon"]))
+        if not message:
+            return None
+        return build_notification(message, get_weather_by_coordinates(location["lat"], location["lon"]))
+
+
+async def _evaluate_cell_async(group: CellGroup, get_forecast: Callable[[float, float], Awaitable[Any]],
+                               get_weather: Callable[[float, float], Awaitable[Any]]) -> Optional[str]:
+    """Асинхронный вариант _evaluate_cell с функциями получения данных асинхронного клиента."""
+    location = group[0][1]
+    with request_priority(PRIORITY_BACKGROUND):
+        message = build_precipitation_message(await get_forecast(location["lat"], location["lon"]))
+        if not message:
+            return None
+        return build_notification(message, await get_weather(location["lat"], location["lon"]))
+
+
+def _collect_outgoing(groups: Dict[str, CellGroup], messages: Dict[str, Optional[str]]) -> List[Tuple[str, str]]:
+    return [
+        (user_id, messages[cell])
+        for cell, group in groups.items()
+        if messages.get(cell)
+        for user_id, _ in group
+    ]
+
+
+def _send_queued(outgoing: List[Tuple[str, str]], send: Callable[[int, str], Future]) -> int:
+    """Поставить все сообщения в очередь отправки и дождаться их доставки."""
+    pending: List[Tuple[str, Future]] = []
+    for user_id, text in outgoing:
+        try:
+            pending.append((user_id, send(int(user_id), text)))
+        except Exception as e:
+            print(f"Ошибка отправки уведомления пользователю {user_id}: {e}")
+
+    sent = 0
+    for user_id, future in pending:
+        try:
+            future.result()
+            sent += 1
+        except Exception as e:
+            print(f"Ошибка отправки уведомления пользователю {user_id}: {e}")
+    return sent
+
+
+def _report(groups: Dict[str, CellGroup], outgoing: List[Tuple[str, str]], sent: int,
+            started: float, fetched: float, finished: float) -> Dict[str, Any]:
+    report = {
+        "subscribers": sum(len(group) for group in groups.values()),
+        "cells": len(groups),
+        "to_send": len(outgoing),
+        "sent": sent,
+        "fetch_seconds": round(fetched - started, 3),
+        "send_seconds": round(finished - fetched, 3),
+        "total_seconds": round(finished - started, 3),
+    }
+    print(
+        f"Уведомления: {report['subscribers']} подписчиков в {report['cells']} ячейках, "
+        f"отправлено {report['sent']} из {report['to_send']} "
+        f"(прогнозы {report['fetch_seconds']} с, рассылка {report['send_seconds']} с, "
+        f"всего {report['total_seconds']} с)"
+    )
+    return report
+
+
+def run_notifications(groups: Dict[str, CellGroup], send: Callable[[int, str], Future]) -> Dict[str, Any]:
+    """Пакетная проверка погоды и рассылка уведомлений подписчикам, сгруппированным по ячейкам.
+
+    Прогноз для каждой ячейки запрашивается один раз (параллельно, ограниченным пулом),
+    правило дождя/снега вычисляется для всей группы. `send` ставит сообщение в очередь
+    исходящих (OutboundQueue, она же ограничивает скорость) и возвращает Future;
+    отправленными считаются сообщения, доставка которых завершилась успешно.
+    """
+    started = time.monotonic()
+    messages: Dict[str, Optional[str]] = {}
+    with ThreadPoolExecutor(max_workers=NOTIFICATION_FETCH_WORKERS) as pool:
+        futures = {cell: pool.submit(_evaluate_cell, group) for cell, group in groups.items()}
+        for cell, future in futures.items():
+            try:
+                messages[cell] = future.result()
+            except Exception as e:
+                print(f"Ошибка проверки погоды для ячейки {cell}: {e}")
+                messages[cell] = None
+    fetched = time.monotonic()
+
+    outgoing = _collect_outgoing(groups, messages)
+    sent = _send_queued(outgoing, send)
+    return _report(groups, outgoing, sent, started, fetched, time.monotonic())
+
+
+async def run_notifications_async(groups: Dict[str, CellGroup],
+                                  get_forecast: Callable[[float, float], Awaitable[Any]],
+                                  get_weather: Callable[[float, float], Awaitable[Any]],
+                                  send: Callable[[int, str], Awaitable[Any]]) -> Dict[str, Any]:
+    """Асинхронный аналог run_notifications с теми же правилами и отчётом.
+
+    Все ячейки проверяются одновременно (параллельность ограничивает асинхронный клиент),
+    `send` возвращает ожидаемый результат отправки через очередь исходящих.
+    """
+    started = time.monotonic()
+    cells = list(groups)
+    results = await asyncio.gather(
+        *(_evaluate_cell_async(groups[cell], get_forecast, get_weather) for cell in cells),
+        return_exceptions=True,
+    )
+    messages: Dict[str, Optional[str]] = {}
+    for cell, result in zip(cells, results):
+        if isinstance(result, Exception):
+            print(f"Ошибка проверки погоды для ячейки {cell}: {result}")
+            result = None
+        messages[cell] = result
+    fetched = time.monotonic()
+
+    outgoing = _collect_outgoing(groups, messages)
+    deliveries = await asyncio.gather(*(send(int(user_id), text) for user_id, text in outgoing),
+                                      return_exceptions=True)
+    sent = 0
+    for (user_id, _), result in zip(outgoing, deliveries):
+        if isinstance(result, Exception):
+            print(f"Ошибка отправки уведомления пользователю {user_id}: {result}")
+        else:
+            sent += 1
+    return _report(groups, outgoing, sent, started, fetched, time.monotonic())
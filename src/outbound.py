@@ -0,0 +1,223 @@
+import asyncio
+import concurrent.futures
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.rate_limit import TokenBucket
+
+# Очереди приоритетов: ответы пользователям идут раньше рассылок
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BROADCAST = 10
+_LANE_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BROADCAST: "broadcast"}
+
+# Лимиты Telegram: ~30 сообщений в секунду на бота и ~1 в секунду на чат (с небольшими всплесками)
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", "25"))
+OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))
+OUTBOUND_CHAT_BURST = float(os.getenv("OUTBOUND_CHAT_BURST", "5"))
+OUTBOUND_WORKERS = int(os.getenv("OUTBOUND_WORKERS", "4"))
+OUTBOUND_MAX_RETRIES = 3
+# Сколько поток отправки ждёт корутину AsyncTeleBot, прежде чем отменить её
+OUTBOUND_ASYNC_TIMEOUT = float(os.getenv("OUTBOUND_ASYNC_TIMEOUT", "60"))
+# Сколько чатов держать в памяти с их token bucket; дольше всех неактивные вытесняются
+_CHAT_BUCKETS_LIMIT = 10000
+
+
+class _Job:
+    __slots__ = ("priority", "chat_id", "fn", "args", "kwargs", "future", "enqueued_at", "retries")
+
+    def __init__(self, priority: int, chat_id: Any, fn: Callable, args: Tuple, kwargs: Dict[str, Any]):
+        self.priority = priority
+        self.chat_id = chat_id
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future: Future = Future()
+        self.enqueued_at = time.monotonic()
+        self.retries = 0
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Retry-After из ответа Telegram 429 (ApiTelegramException), иначе None."""
+    if getattr(error, "error_code", None) != 429:
+        return None
+    result_json = getattr(error, "result_json", None) or {}
+    return float(result_json.get("parameters", {}).get("retry_after", 1))
+
+
+class OutboundQueue:
+    """Очередь исходящих сообщений бота с ограничением скорости и приоритетами.
+
+    Глобальный token bucket и token bucket на каждый чат; задачи для чата,
+    исчерпавшего лимит, откладываются и не задерживают другие чаты.
+    При 429 отправка приостанавливается на Retry-After и задача повторяется.
+    """
+
+    def __init__(self, workers: int = OUTBOUND_WORKERS, global_rate: float = OUTBOUND_GLOBAL_RATE,
+                 chat_rate: float = OUTBOUND_CHAT_RATE, chat_burst: float = OUTBOUND_CHAT_BURST):
+        self._global_bucket = TokenBucket(global_rate)
+        self._chat_rate = chat_rate
+        self._chat_burst = chat_burst
+        self._chat_buckets: "OrderedDict[Any, TokenBucket]" = OrderedDict()
+        self._ready: List[Tuple[int, int, _Job]] = []
+        self._delayed: List[Tuple[float, int, _Job]] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._paused_until = 0.0
+        self._workers_count = workers
+        self._workers: List[threading.Thread] = []
+        self._metrics_lock = threading.Lock()
+        self._sent = {lane: 0 for lane in _LANE_NAMES.values()}
+        self._failed = 0
+        self._throttled = 0
+        self._latency_total = {lane: 0.0 for lane in _LANE_NAMES.values()}
+        self._latency_max = {lane: 0.0 for lane in _LANE_NAMES.values()}
+
+    def start(self) -> None:
+        """Запустить потоки отправки (повторный вызов ничего не делает)."""
+        if self._workers:
+            return
+        for index in range(self._workers_count):
+            worker = threading.Thread(target=self._run, name=f"outbound-{index}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, chat_id: Any, fn: Callable, *args, priority: int = PRIORITY_BROADCAST, **kwargs) -> Future:
+        """Поставить вызов `fn(*args, **kwargs)` в очередь; результат — во Future."""
+        self.start()
+        job = _Job(priority, chat_id, fn, args, kwargs)
+        with self._cond:
+            heapq.heappush(self._ready, (priority, next(self._seq), job))
+            self._cond.notify()
+        return job.future
+
+    def call(self, chat_id: Any, fn: Callable, *args, priority: int = PRIORITY_INTERACTIVE, **kwargs) -> Any:
+        """Поставить вызов в очередь и дождаться результата (исключение пробрасывается)."""
+        return self.submit(chat_id, fn, *args, priority=priority, **kwargs).result()
+
+    def submit_async(self, chat_id: Any, coro_fn: Callable, *args, priority: int = PRIORITY_BROADCAST,
+                     **kwargs) -> "asyncio.Future":
+        """Вариант submit для AsyncTeleBot: `coro_fn(*args, **kwargs)` выполняется в event loop вызывающего.
+
+        Очередь лишь решает, когда запустить корутину, поэтому лимиты, приоритеты
+        и пауза по 429 общие с синхронными отправками. Вызывать из event loop.
+        """
+        loop = asyncio.get_running_loop()
+
+        def run() -> Any:
+            future = asyncio.run_coroutine_threadsafe(coro_fn(*args, **kwargs), loop)
+            try:
+                return future.result(OUTBOUND_ASYNC_TIMEOUT)
+            except concurrent.futures.TimeoutError:
+                future.cancel()
+                raise
+
+        return asyncio.wrap_future(self.submit(chat_id, run, priority=priority), loop=loop)
+
+    async def call_async(self, chat_id: Any, coro_fn: Callable, *args, priority: int = PRIORITY_INTERACTIVE,
+                         **kwargs) -> Any:
+        """Асинхронный аналог call: поставить корутину в очередь и дождаться результата."""
+        return await self.submit_async(chat_id, coro_fn, *args, priority=priority, **kwargs)
+
+    def _chat_bucket(self, chat_id: Any) -> TokenBucket:
+        with self._cond:
+            bucket = self._chat_buckets.get(chat_id)
+            if bucket is not None:
+                self._chat_buckets.move_to_end(chat_id)
+                return bucket
+            if len(self._chat_buckets) >= _CHAT_BUCKETS_LIMIT:
+                self._chat_buckets.popitem(last=False)
+            bucket = TokenBucket(self._chat_rate, self._chat_burst)
+            self._chat_buckets[chat_id] = bucket
+            return bucket
+
+    def _delay(self, job: _Job, seconds: float) -> None:
+        with self._cond:
+            heapq.heappush(self._delayed, (time.monotonic() + seconds, next(self._seq), job))
+            self._cond.notify()
+
+    def _next_job(self) -> _Job:
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                while self._delayed and self._delayed[0][0] <= now:
+                    _, seq, job = heapq.heappop(self._delayed)
+                    heapq.heappush(self._ready, (job.priority, seq, job))
+                if self._ready and now >= self._paused_until:
+                    return heapq.heappop(self._ready)[2]
+
+                timeout = None
+                if self._delayed:
+                    timeout = self._delayed[0][0] - now
+                if self._ready:
+                    pause = self._paused_until - now
+                    timeout = pause if timeout is None else min(timeout, pause)
+                self._cond.wait(timeout)
+
+    def _run(self) -> None:
+        while True:
+            job = self._next_job()
+
+            chat_bucket = self._chat_bucket(job.chat_id)
+            if not chat_bucket.try_acquire():
+                with self._metrics_lock:
+                    self._throttled += 1
+                self._delay(job, chat_bucket.wait_time())
+                continue
+            self._global_bucket.acquire()
+
+            try:
+                result = job.fn(*job.args, **job.kwargs)
+            except Exception as e:
+                retry_after = _retry_after(e)
+                if retry_after is not None and job.retries < OUTBOUND_MAX_RETRIES:
+                    job.retries += 1
+                    print(f"Telegram 429: пауза {retry_after} с перед повтором")
+                    with self._cond:
+                        self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+                    self._delay(job, retry_after)
+                    continue
+                with self._metrics_lock:
+                    self._failed += 1
+                job.future.set_exception(e)
+                continue
+
+            self._record_sent(job)
+            job.future.set_result(result)
+
+    def _record_sent(self, job: _Job) -> None:
+        lane = _LANE_NAMES.get(job.priority, "broadcast")
+        latency = time.monotonic() - job.enqueued_at
+        with self._metrics_lock:
+            self._sent[lane] += 1
+            self._latency_total[lane] += latency
+            self._latency_max[lane] = max(self._latency_max[lane], latency)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Глубина очередей, число отправленных сообщений и задержка отправки по очередям."""
+        with self._cond:
+            depth = {lane: 0 for lane in _LANE_NAMES.values()}
+            for _, _, job in self._ready + self._delayed:
+                depth[_LANE_NAMES.get(job.priority, "broadcast")] += 1
+            paused_for = max(self._paused_until - time.monotonic(), 0.0)
+        with self._metrics_lock:
+            latency = {
+                lane: {
+                    "avg": round(self._latency_total[lane] / self._sent[lane], 3) if self._sent[lane] else 0.0,
+                    "max": round(self._latency_max[lane], 3),
+                }
+                for lane in self._sent
+            }
+            return {
+                "depth": depth,
+                "sent": dict(self._sent),
+                "failed": self._failed,
+                "throttled": self._throttled,
+                "paused_for": round(paused_for, 3),
+                "latency": latency,
+            }
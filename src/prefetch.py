@@ -0,0 +1,170 @@
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from src.quota import PRIORITY_BACKGROUND, request_priority
+from src.rate_limit import TokenBucket
+from src.storage import get_api_cache_key, get_api_cache_metadata
+
+# Сколько самых популярных записей кэша поддерживать свежими
+PREFETCH_TOP_N = int(os.getenv("PREFETCH_TOP_N", "50"))
+# За сколько секунд до истечения записи обновлять её заранее
+PREFETCH_LEAD_SECONDS = int(os.getenv("PREFETCH_LEAD_SECONDS", "90"))
+# Как часто проверять популярные записи
+PREFETCH_INTERVAL_SECONDS = int(os.getenv("PREFETCH_INTERVAL_SECONDS", "30"))
+# Бюджет запросов к API на предзагрузку
+PREFETCH_CALLS_PER_MINUTE = int(os.getenv("PREFETCH_CALLS_PER_MINUTE", "20"))
+# Популярность обращений убывает вдвое за это время
+PREFETCH_HALF_LIFE_SECONDS = 60 * 60
+PREFETCH_MAX_TRACKED = 5000
+# Сохранённые местоположения пользователей считаются популярными всегда
+PREFETCH_PINNED_SCORE = 5.0
+PREFETCH_PINNED_ENDPOINTS = ("weather", "forecast")
+
+
+class _Entry:
+    __slots__ = ("lat", "lon", "endpoint", "score", "updated", "pinned")
+
+    def __init__(self, lat: float, lon: float, endpoint: str):
+        self.lat = lat
+        self.lon = lon
+        self.endpoint = endpoint
+        self.score = 0.0
+        self.updated = time.time()
+        # Сколько сохранённых местоположений пользователей указывают на эту запись
+        self.pinned = 0
+
+    def current_score(self, now: float) -> float:
+        decayed = self.score * 0.5 ** ((now - self.updated) / PREFETCH_HALF_LIFE_SECONDS)
+        return decayed + (PREFETCH_PINNED_SCORE if self.pinned else 0.0)
+
+
+class Prefetcher:
+    """Обновление популярных записей API кэша незадолго до истечения (refresh-ahead).
+
+    Каждое обращение к кэшу увеличивает популярность записи (с затуханием со
+    временем). Фоновый поток раз в PREFETCH_INTERVAL_SECONDS берёт top-N записей
+    и заново запрашивает те, что истекают в ближайшие PREFETCH_LEAD_SECONDS, не
+    превышая бюджет PREFETCH_CALLS_PER_MINUTE. Запросы идут с фоновым приоритетом квоты.
+    """
+
+    def __init__(self, refresh: Callable[[float, float, str], Any], top_n: int = PREFETCH_TOP_N,
+                 lead_seconds: int = PREFETCH_LEAD_SECONDS, interval: int = PREFETCH_INTERVAL_SECONDS,
+                 calls_per_minute: int = PREFETCH_CALLS_PER_MINUTE):
+        self._refresh = refresh
+        self.top_n = top_n
+        self.lead_seconds = lead_seconds
+        self.interval = interval
+        self._budget = TokenBucket(calls_per_minute / 60, calls_per_minute)
+        self._entries: Dict[str, _Entry] = {}
+        # Сколько записей закреплено (они не вытесняются и не входят в PREFETCH_MAX_TRACKED)
+        self._pinned_entries = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.refreshed = 0
+        self.skipped_budget = 0
+
+    def record(self, lat: float, lon: float, endpoint: str) -> None:
+        """Учесть обращение к записи кэша."""
+        key = get_api_cache_key(lat, lon, endpoint)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                if len(self._entries) - self._pinned_entries >= PREFETCH_MAX_TRACKED * 1.1:
+                    self._trim(now)
+                entry = self._entries[key] = _Entry(lat, lon, endpoint)
+            entry.score = entry.score * 0.5 ** ((now - entry.updated) / PREFETCH_HALF_LIFE_SECONDS) + 1
+            entry.updated = now
+            entry.lat, entry.lon = lat, lon
+
+    def pin(self, lat: float, lon: float, endpoints: Iterable[str] = PREFETCH_PINNED_ENDPOINTS) -> None:
+        """Держать свежими данные для сохранённого местоположения."""
+        with self._lock:
+            for endpoint in endpoints:
+                key = get_api_cache_key(lat, lon, endpoint)
+                entry = self._entries.get(key)
+                if entry is None:
+                    entry = self._entries[key] = _Entry(lat, lon, endpoint)
+                if not entry.pinned:
+                    self._pinned_entries += 1
+                entry.pinned += 1
+
+    def unpin(self, lat: float, lon: float, endpoints: Iterable[str] = PREFETCH_PINNED_ENDPOINTS) -> None:
+        """Снять закрепление, поставленное pin (запись остаётся закреплённой, пока её сохранил кто-то ещё)."""
+        with self._lock:
+            for endpoint in endpoints:
+                entry = self._entries.get(get_api_cache_key(lat, lon, endpoint))
+                if entry is not None and entry.pinned:
+                    entry.pinned -= 1
+                    if not entry.pinned:
+                        self._pinned_entries -= 1
+
+    def pin_locations(self, locations: Iterable[Dict[str, float]]) -> None:
+        for location in locations:
+            self.pin(location["lat"], location["lon"])
+
+    def _trim(self, now: float) -> None:
+        # Забываем наименее популярные записи; закреплённые остаются всегда и в лимит не входят
+        pinned = {key: entry for key, entry in self._entries.items() if entry.pinned}
+        ranked = sorted(
+            ((key, entry) for key, entry in self._entries.items() if not entry.pinned),
+            key=lambda item: item[1].current_score(now), reverse=True,
+        )
+        pinned.update(ranked[:PREFETCH_MAX_TRACKED])
+        self._entries = pinned
+
+    def hot_entries(self) -> List[Tuple[float, float, str]]:
+        """Top-N записей по популярности: (lat, lon, endpoint)."""
+        now = time.time()
+        with self._lock:
+            ranked = sorted(self._entries.values(), key=lambda entry: entry.current_score(now), reverse=True)
+            return [(entry.lat, entry.lon, entry.endpoint) for entry in ranked[:self.top_n]]
+
+    def run_once(self) -> int:
+        """Обновить популярные записи, которые скоро истекут. Возвращает число обновлённых."""
+        refreshed = 0
+        for lat, lon, endpoint in self.hot_entries():
+            meta = get_api_cache_metadata(lat, lon, endpoint)
+            if meta is not None and meta["expires_at"] - time.time() > self.lead_seconds:
+                continue
+            if not self._budget.try_acquire():
+                self.skipped_budget += 1
+                break
+            try:
+                with request_priority(PRIORITY_BACKGROUND):
+                    if self._refresh(lat, lon, endpoint) is not None:
+                        refreshed += 1
+            except Exception as e:
+                print(f"Ошибка предзагрузки {endpoint}: {e}")
+        self.refreshed += refreshed
+        return refreshed
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+    def start(self) -> None:
+        """Запустить фоновый поток предзагрузки (повторный вызов ничего не делает)."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="cache-prefetch", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        with self._lock:
+            thread, self._thread = self._thread, None
+        self._stop.set()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=10)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            tracked = len(self._entries)
+            pinned = self._pinned_entries
+        return {"tracked": tracked, "pinned": pinned, "refreshed": self.refreshed,
+                "skipped_budget": self.skipped_budget}
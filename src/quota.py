@@ -0,0 +1,294 @@
+import atexit
+import contextvars
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+from dotenv import load_dotenv
+
+from src.storage import DATABASE_DIR
+
+load_dotenv()
+
+# Несколько ключей OpenWeather через запятую; без API_KEYS используется API_KEY
+API_KEYS: List[str] = [key.strip() for key in os.getenv("API_KEYS", "").split(",") if key.strip()]
+if not API_KEYS and os.getenv("API_KEY"):
+    API_KEYS = [os.getenv("API_KEY")]
+
+# Лимиты тарифа на один ключ (0 — без ограничения)
+QUOTA_PER_MINUTE = int(os.getenv("QUOTA_PER_MINUTE", "60"))
+QUOTA_PER_DAY = int(os.getenv("QUOTA_PER_DAY", "0"))
+# Доля квоты, которую фоновые задачи (уведомления, предзагрузка) не трогают — она остаётся пользователям
+QUOTA_INTERACTIVE_RESERVE = float(os.getenv("QUOTA_INTERACTIVE_RESERVE", "0.2"))
+# Пауза для ключа после ответа 429 без Retry-After: QUOTA_THROTTLE_BASE секунд,
+# удваивается при повторных 429 подряд, но не больше QUOTA_THROTTLE_MAX
+QUOTA_THROTTLE_BASE = 1.0
+QUOTA_THROTTLE_MAX = 60
+QUOTA_FILE = os.path.join(DATABASE_DIR, "api_quota.json")
+QUOTA_SAVE_INTERVAL = 30
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+_priority: contextvars.ContextVar = contextvars.ContextVar("api_request_priority", default=PRIORITY_INTERACTIVE)
+
+
+@contextmanager
+def request_priority(priority: int) -> Iterator[None]:
+    """Выполнять запросы к API внутри блока с указанным приоритетом.
+
+    Приоритет хранится в contextvars: наследуется корутинами и задачами asyncio,
+    но не потоками пула — в них его нужно выставлять внутри самой задачи.
+    """
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+class SlidingWindow:
+    """Счётчик событий за последние `window` секунд, сгруппированных по `bucket` секунд."""
+
+    __slots__ = ("window", "bucket", "_buckets", "_total")
+
+    def __init__(self, window: int, bucket: int):
+        self.window = window
+        self.bucket = bucket
+        # [номер корзины, число событий] по возрастанию времени
+        self._buckets: Deque[List[int]] = deque()
+        self._total = 0
+
+    def _expire(self, now: float) -> None:
+        oldest = int(now // self.bucket) - self.window // self.bucket
+        while self._buckets and self._buckets[0][0] <= oldest:
+            self._total -= self._buckets.popleft()[1]
+
+    def add(self, now: float, count: int = 1) -> None:
+        self._expire(now)
+        index = int(now // self.bucket)
+        if self._buckets and self._buckets[-1][0] == index:
+            self._buckets[-1][1] += count
+        else:
+            self._buckets.append([index, count])
+        self._total += count
+
+    def total(self, now: float) -> int:
+        self._expire(now)
+        return self._total
+
+    def dump(self) -> List[List[int]]:
+        return [list(bucket) for bucket in self._buckets]
+
+    def load(self, buckets: List[List[int]], now: float) -> None:
+        for index, count in buckets:
+            self._buckets.append([int(index), int(count)])
+            self._total += int(count)
+        self._expire(now)
+
+
+def _key_id(api_key: str) -> str:
+    # Сами ключи на диск не пишем
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+
+class _KeyUsage:
+    __slots__ = ("api_key", "minute", "day", "endpoints", "cooldown_until", "backoff_until", "throttle_streak")
+
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+        self.minute = SlidingWindow(60, 1)
+        self.day = SlidingWindow(86400, 60)
+        self.endpoints: Dict[str, SlidingWindow] = {}
+        # Пауза по Retry-After — для всех запросов
+        self.cooldown_until = 0.0
+        # Пауза без Retry-After (оценка клиента) — только для фоновых запросов
+        self.backoff_until = 0.0
+        self.throttle_streak = 0
+
+
+class QuotaManager:
+    """Учёт вызовов OpenWeather API по ключам и endpoint в скользящих окнах.
+
+    Перед каждым запросом `acquire` выбирает ключ с наибольшим запасом. Если
+    все ключи исчерпаны, возвращает None, и запрос не выполняется. Фоновые
+    запросы останавливаются раньше интерактивных: им недоступен резерв
+    QUOTA_INTERACTIVE_RESERVE. Счётчики периодически сохраняются на диск
+    и восстанавливаются при перезапуске.
+
+    Ограничение: счётчики ведёт каждый процесс сам. Копии бота и CLI с общим
+    API кэшем (API_CACHE_BACKEND) не видят вызовов друг друга, а api_quota.json
+    перезаписывает последний сохранивший процесс. При нескольких процессах на
+    одних ключах задавайте QUOTA_PER_MINUTE и QUOTA_PER_DAY как долю лимита тарифа.
+    """
+
+    def __init__(self, api_keys: List[str], per_minute: int = QUOTA_PER_MINUTE, per_day: int = QUOTA_PER_DAY,
+                 reserve: float = QUOTA_INTERACTIVE_RESERVE, path: Optional[str] = QUOTA_FILE):
+        self.per_minute = per_minute
+        self.per_day = per_day
+        self.reserve = reserve
+        self.path = path
+        self._lock = threading.Lock()
+        # Пишет файл только один поток; снимки записываются в порядке их создания
+        self._save_lock = threading.Lock()
+        self._keys: Dict[str, _KeyUsage] = {_key_id(key): _KeyUsage(key) for key in api_keys}
+        self._rejected = {PRIORITY_INTERACTIVE: 0, PRIORITY_BACKGROUND: 0}
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        self._load()
+        atexit.register(self.save)
+
+    def _limits(self, priority: int) -> Dict[str, float]:
+        share = 1.0 if priority <= PRIORITY_INTERACTIVE else 1.0 - self.reserve
+        return {"minute": self.per_minute * share, "day": self.per_day * share}
+
+    def acquire(self, endpoint: str, priority: Optional[int] = None) -> Optional[str]:
+        """Ключ для очередного вызова endpoint или None, если квота исчерпана."""
+        if priority is None:
+            priority = current_priority()
+        limits = self._limits(priority)
+        now = time.time()
+        with self._lock:
+            best: Optional[_KeyUsage] = None
+            best_used = 0.0
+            for usage in self._keys.values():
+                if usage.cooldown_until > now:
+                    continue
+                if usage.backoff_until > now and priority > PRIORITY_INTERACTIVE:
+                    continue
+                minute, day = usage.minute.total(now), usage.day.total(now)
+                if self.per_minute and minute >= limits["minute"]:
+                    continue
+                if self.per_day and day >= limits["day"]:
+                    continue
+                used = max(minute / self.per_minute if self.per_minute else 0.0,
+                           day / self.per_day if self.per_day else 0.0)
+                if best is None or used < best_used:
+                    best, best_used = usage, used
+
+            if best is None:
+                self._rejected[PRIORITY_INTERACTIVE if priority <= PRIORITY_INTERACTIVE else PRIORITY_BACKGROUND] += 1
+                return None
+
+            best.minute.add(now)
+            best.day.add(now)
+            best.endpoints.setdefault(endpoint, SlidingWindow(86400, 60)).add(now)
+            self._dirty = True
+            save_due = time.monotonic() - self._saved_at >= QUOTA_SAVE_INTERVAL
+            if save_due:
+                # Сохранение запускает только один поток за интервал
+                self._saved_at = time.monotonic()
+        if save_due:
+            self.save()
+        return best.api_key
+
+    def report_throttled(self, api_key: str, retry_after: Optional[float] = None) -> None:
+        """API ответил 429 для ключа: приостановить его использование.
+
+        С Retry-After ключ не используется никем до конца паузы. Без него пауза
+        короткая и растёт экспоненциально при повторных 429, а запросы
+        пользователей (резерв квоты) ключ по-прежнему получают.
+        """
+        now = time.time()
+        with self._lock:
+            usage = self._keys.get(_key_id(api_key))
+            if usage is None:
+                return
+            if retry_after:
+                usage.cooldown_until = now + retry_after
+                return
+            # Долго не было 429 — начинаем с короткой паузы
+            if now - usage.backoff_until > QUOTA_THROTTLE_MAX:
+                usage.throttle_streak = 0
+            usage.backoff_until = now + min(QUOTA_THROTTLE_BASE * 2 ** usage.throttle_streak, QUOTA_THROTTLE_MAX)
+            usage.throttle_streak = min(usage.throttle_streak + 1, 16)
+
+    def stats(self) -> Dict[str, Any]:
+        """Использование по ключам (идентификатор — хэш ключа) и отказы по приоритетам."""
+        now = time.time()
+        with self._lock:
+            keys = {
+                key_id: {
+                    "minute": usage.minute.total(now),
+                    "day": usage.day.total(now),
+                    "endpoints_day": {name: window.total(now) for name, window in usage.endpoints.items()},
+                    "cooldown": max(usage.cooldown_until - now, 0.0),
+                    "backoff": max(usage.backoff_until - now, 0.0),
+                }
+                for key_id, usage in self._keys.items()
+            }
+            return {
+                "keys": keys,
+                "rejected_interactive": self._rejected[PRIORITY_INTERACTIVE],
+                "rejected_background": self._rejected[PRIORITY_BACKGROUND],
+            }
+
+    def save(self) -> None:
+        """Сохранить счётчики на диск (атомарная замена файла)."""
+        if not self.path:
+            return
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                data = {
+                    key_id: {
+                        "minute": usage.minute.dump(),
+                        "day": usage.day.dump(),
+                        "endpoints": {name: window.dump() for name, window in usage.endpoints.items()},
+                    }
+                    for key_id, usage in self._keys.items()
+                }
+                self._dirty = False
+                self._saved_at = time.monotonic()
+            directory = os.path.dirname(self.path) or "."
+            tmp_file = None
+            try:
+                os.makedirs(directory, exist_ok=True)
+                # Уникальное имя: файл могут одновременно сохранять другие процессы
+                fd, tmp_file = tempfile.mkstemp(prefix=".api_quota.", suffix=".tmp", dir=directory)
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(data, f)
+                os.replace(tmp_file, self.path)
+            except OSError as e:
+                print(f"Не удалось сохранить счётчики квоты API: {e}")
+                if tmp_file is not None:
+                    try:
+                        os.remove(tmp_file)
+                    except OSError:
+                        pass
+
+    def _load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return
+        now = time.time()
+        for key_id, saved in data.items():
+            usage = self._keys.get(key_id)
+            if usage is None:
+                continue
+            usage.minute.load(saved.get("minute", []), now)
+            usage.day.load(saved.get("day", []), now)
+            for name, buckets in saved.get("endpoints", {}).items():
+                usage.endpoints.setdefault(name, SlidingWindow(86400, 60)).load(buckets, now)
+
+
+quota = QuotaManager(API_KEYS)
+
+
+def get_quota_stats() -> Dict[str, Any]:
+    return quota.stats()
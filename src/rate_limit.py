@@ -0,0 +1,46 @@
+import threading
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """Потокобезопасный token bucket: `rate` токенов в секунду, не больше `capacity` в запасе."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Взять токены, если они есть сейчас."""
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def available(self) -> float:
+        """Сколько токенов в запасе сейчас."""
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+    def wait_time(self, tokens: float = 1.0) -> float:
+        """Сколько секунд ждать, пока наберётся нужное число токенов."""
+        with self._lock:
+            self._refill()
+            missing = tokens - self._tokens
+            return max(missing / self.rate, 0.0) if self.rate > 0 else float("inf")
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        """Дождаться и взять токены."""
+        while not self.try_acquire(tokens):
+            time.sleep(max(self.wait_time(tokens), 0.001))
@@ -0,0 +1,179 @@
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+from src.rate_limit import TokenBucket
+
+# Пауза перед повтором: случайная в [0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2^(n-1))] (full jitter)
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "1"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "30"))
+# Retry-After длиннее этого не ждём — сразу отдаём ошибку
+RETRY_AFTER_MAX = float(os.getenv("RETRY_AFTER_MAX", "60"))
+# Синхронные запросы пользователей ждут в потоке обработчика не дольше этого на одну паузу:
+# при более длинном Retry-After пользователю отдаются устаревшие или сохранённые данные
+RETRY_INTERACTIVE_MAX_DELAY = float(os.getenv("RETRY_INTERACTIVE_MAX_DELAY", "3"))
+# Общий на процесс бюджет повторов: во время сбоя API повторы не множатся лавиной
+RETRY_BUDGET_PER_SECOND = float(os.getenv("RETRY_BUDGET_PER_SECOND", "2"))
+RETRY_BUDGET_BURST = float(os.getenv("RETRY_BUDGET_BURST", "10"))
+# Circuit breaker: после N ошибок подряд endpoint «открывается» на заданное время
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RECOVERY_SECONDS = float(os.getenv("BREAKER_RECOVERY_SECONDS", "30"))
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+def is_retryable_status(status: int) -> bool:
+    """429 и временные ошибки 5xx стоит повторить."""
+    return status == 429 or 500 <= status < 600
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Заголовок Retry-After (секунды или HTTP-дата) в секундах ожидания."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class CircuitBreaker:
+    """Circuit breaker для одного endpoint.
+
+    closed — запросы идут как обычно; open — после серии ошибок запросы сразу
+    отклоняются; half_open — по истечении паузы пропускается один пробный запрос,
+    его успех закрывает breaker, ошибка снова открывает.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 recovery_seconds: float = BREAKER_RECOVERY_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self._lock = threading.Lock()
+        self._state = STATE_CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+        self.rejected = 0
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == STATE_OPEN and time.monotonic() - self._opened_at >= self.recovery_seconds:
+            self._state = STATE_HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+
+    def allow(self) -> bool:
+        """Можно ли сейчас выполнить запрос."""
+        with self._lock:
+            state = self._current_state()
+            if state == STATE_CLOSED:
+                return True
+            # Пробный запрос, который так и не завершился (например, отменён), не блокирует breaker навсегда
+            now = time.monotonic()
+            if state == STATE_HALF_OPEN and (not self._probe_in_flight
+                                             or now - self._probe_started >= self.recovery_seconds):
+                self._probe_in_flight = True
+                self._probe_started = now
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = STATE_CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            state = self._current_state()
+            if state == STATE_HALF_OPEN or (state == STATE_CLOSED and self._failures >= self.failure_threshold):
+                self._state = STATE_OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+                self.opened += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self._current_state(),
+                "failures": self._failures,
+                "opened": self.opened,
+                "rejected": self.rejected,
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+_budget = TokenBucket(RETRY_BUDGET_PER_SECOND, RETRY_BUDGET_BURST)
+_stats_lock = threading.Lock()
+_stats = {"retries": 0, "budget_exhausted": 0, "retry_after_too_long": 0}
+
+
+def get_breaker(endpoint: str) -> CircuitBreaker:
+    """Circuit breaker для endpoint (weather, forecast, air_pollution, geo)."""
+    with _breakers_lock:
+        breaker = _breakers.get(endpoint)
+        if breaker is None:
+            breaker = _breakers[endpoint] = CircuitBreaker(endpoint)
+        return breaker
+
+
+def _count(name: str) -> None:
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def retry_delay(attempt: int, max_attempts: int, retry_after: Optional[float] = None,
+                max_delay: float = RETRY_AFTER_MAX) -> Optional[float]:
+    """Пауза перед следующей попыткой или None, если повторять не нужно.
+
+    Учитывает число попыток, общий бюджет повторов и Retry-After от сервера.
+    `max_delay` — самая длинная допустимая пауза (не больше RETRY_AFTER_MAX).
+    """
+    if attempt >= max_attempts:
+        return None
+    max_delay = min(max_delay, RETRY_AFTER_MAX)
+    if retry_after is not None and retry_after > max_delay:
+        _count("retry_after_too_long")
+        return None
+    if not _budget.try_acquire():
+        _count("budget_exhausted")
+        return None
+    _count("retries")
+    delay = random.uniform(0, min(RETRY_MAX_DELAY, max_delay, RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def get_retry_stats() -> Dict[str, Any]:
+    """Метрики повторов и состояние circuit breaker'ов по endpoint."""
+    with _stats_lock:
+        stats: Dict[str, Any] = dict(_stats)
+    stats["budget_tokens"] = round(_budget.available(), 2)
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    stats["breakers"] = {breaker.name: breaker.stats() for breaker in breakers}
+    return stats
@@ -1,7 +1,16 @@
 import json
 import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
 from datetime import datetime, timezone, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
+
+from src.cache_backend import CacheBackend, CacheBackendError, CacheRecord, create_cache_backend
+from src.geo import geohash_encode
+from src.memory_cache import MemoryCache
 
 # Создаем папки если их нет
 DATABASE_DIR = "database"
@@ -11,128 +20,598 @@ for directory in [DATABASE_DIR, API_CACHE_DIR]:
     if not os.path.exists(directory):
         os.makedirs(directory)
 
+# Старый формат (одна последняя запись), переносится в WEATHER_CACHE_DB при первом запуске
 CACHE_FILE = os.path.join(DATABASE_DIR, "weather_cache.json")
+# Последние удачные ответы погоды по местоположениям — резерв при ошибках сети
+WEATHER_CACHE_DB = os.path.join(DATABASE_DIR, "weather_cache.sqlite3")
+WEATHER_CACHE_MAX_LOCATIONS = int(os.getenv("WEATHER_CACHE_MAX_LOCATIONS", "1000"))
+WEATHER_CACHE_MAX_AGE_HOURS = 3
+# Старый формат (один JSON-файл), переносится в BOT_USERS_DB при первом запуске
 BOT_USERS_FILE = os.path.join(DATABASE_DIR, "bot_users_data.json")
+BOT_USERS_DB = os.path.join(DATABASE_DIR, "bot_users.sqlite3")
+
+# Политика fsync для базы пользователей:
+# always — каждая запись сразу и с fsync, batch — пакетами с fsync на пакет,
+# off — пакетами без fsync (быстрее всего, но последние изменения могут потеряться при сбое ОС)
+BOT_USERS_FSYNC = os.getenv("BOT_USERS_FSYNC", "batch")
+_SQLITE_SYNCHRONOUS = {"always": "FULL", "batch": "FULL", "off": "OFF"}
+# Старый формат кэша геокодинга, переносится в хранилище API кэша при первом запуске
+GEOCODE_CACHE_FILE = os.path.join(API_CACHE_DIR, "geocode.json")
+API_CACHE_DB = os.path.join(API_CACHE_DIR, "api_cache.sqlite3")
+
+# Хранилище API кэша (src/cache_backend.py): sqlite — файл API_CACHE_DB,
+# file — каталог API_CACHE_FILES_DIR, redis — сервер API_CACHE_REDIS_URL (общий для нескольких машин)
+API_CACHE_BACKEND = os.getenv("API_CACHE_BACKEND", "sqlite")
+API_CACHE_FILES_DIR = os.path.join(API_CACHE_DIR, "entries")
+API_CACHE_REDIS_URL = os.getenv("API_CACHE_REDIS_URL", "redis://localhost:6379/0")
+# Пока один процесс запрашивает данные у API, другие ждут его результат не дольше этого времени
+API_CACHE_LOCK_SECONDS = 10
+API_CACHE_LOCK_WAIT_SECONDS = float(os.getenv("API_CACHE_LOCK_WAIT_SECONDS", "3"))
+API_CACHE_LOCK_POLL_SECONDS = 0.1
+
+# Время жизни записей API кэша (по умолчанию и по endpoint)
+API_CACHE_TTL_SECONDS = 10 * 60
+API_CACHE_TTL_BY_ENDPOINT = {
+    "weather": 10 * 60,
+    "forecast": 10 * 60,
+    "air_pollution": 10 * 60,
+    # Составные записи «расширенных данных» сохраняются со сроком самой ранней из частей
+    # (get_parts_expiry), значения здесь — лишь верхняя граница
+    "extended": 10 * 60,
+    "extended_forecast": 10 * 60,
+}
+# Сколько секунд после истечения записи её ещё можно отдать как устаревшую,
+# пока в фоне идёт обновление (stale-while-revalidate). 0 — не отдавать устаревшие данные
+API_CACHE_MAX_STALE_SECONDS = int(os.getenv("API_CACHE_MAX_STALE_SECONDS", str(3 * 60 * 60)))
+API_CACHE_MAX_STALE_BY_ENDPOINT = {
+    "weather": API_CACHE_MAX_STALE_SECONDS,
+    "forecast": 2 * API_CACHE_MAX_STALE_SECONDS,
+    "air_pollution": API_CACHE_MAX_STALE_SECONDS,
+    # Составные записи собираются заново из частей, каждая из которых может быть устаревшей
+    "extended": 0,
+    "extended_forecast": 0,
+}
+# Ключ с отметкой об устаревании в ответе, отданном из кэша после истечения TTL
+STALE_MARKER = "_cache"
+# Квантование координат для ключа API кэша:
+# "geohash" — соседние точки в одной ячейке делят запись кэша,
+# "round" — округление до 4 знаков (~11 м)
+API_CACHE_SPATIAL_MODE = os.getenv("API_CACHE_SPATIAL_MODE", "geohash")
+# Длина geohash по endpoint: 6 ≈ 1.2×0.6 км, 5 ≈ 4.9×4.9 км
+API_CACHE_GEOHASH_PRECISION = {
+    "weather": 6,
+    "forecast": 5,
+    "air_pollution": 5,
+    "extended": 6,
+    "extended_forecast": 6,
+}
+API_CACHE_GEOHASH_DEFAULT_PRECISION = 6
+# Лимиты кэша в памяти перед дисковым API кэшем
+API_MEMORY_CACHE_MAX_ENTRIES = int(os.getenv("API_MEMORY_CACHE_MAX_ENTRIES", "512"))
+API_MEMORY_CACHE_MAX_BYTES = int(os.getenv("API_MEMORY_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# Endpoint, сырые ответы которых не держим в кэше в памяти: прогноз хранится там
+# в компактном разобранном виде (src/forecast.py), а составная запись с прогнозом — нет
+API_MEMORY_CACHE_SKIP_ENDPOINTS = frozenset({"forecast", "extended_forecast"})
+# Раз в сколько записей в API кэш удалять устаревшие
+API_CACHE_PURGE_EVERY = 100
+
+# Координаты городов почти не меняются — храним их долго
+GEOCODE_CACHE_TTL = timedelta(days=30)
+
+
+_weather_cache_local = threading.local()
+_weather_cache_lock = threading.Lock()
+_weather_cache_writes = 0
+# Время данных (dt) последней записи по ячейке: повторная запись тех же данных пропускается.
+# LRU на столько же мест, сколько хранит сам кэш погоды
+_weather_cache_written = MemoryCache(WEATHER_CACHE_MAX_LOCATIONS)
+
 
+def _get_weather_cache_db() -> sqlite3.Connection:
+    """Соединение с хранилищем последних удачных ответов для текущего потока."""
+    conn = getattr(_weather_cache_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(WEATHER_CACHE_DB, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS weather_cache (
+                cell TEXT PRIMARY KEY,
+                city TEXT,
+                lat REAL NOT NULL,
+                lon REAL NOT NULL,
+                fetched_at REAL NOT NULL,
+                used_at REAL NOT NULL,
+                weather TEXT NOT NULL
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_weather_cache_used ON weather_cache (used_at)")
+        _weather_cache_local.conn = conn
+        _migrate_weather_cache_json(conn)
+    return conn
 
-def load_cache() -> Optional[Dict[str, Any]]:
+
+def _migrate_weather_cache_json(conn: sqlite3.Connection) -> None:
+    """Перенести запись из старого weather_cache.json и удалить файл."""
     if not os.path.exists(CACHE_FILE):
-        return None
+        return
     try:
         with open(CACHE_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except (OSError, json.JSONDecodeError):
-        return None
+            data = json.load(f)
+        fetched_at = datetime.fromisoformat(data["fetched_at"])
+        if fetched_at.tzinfo is None:
+            fetched_at = fetched_at.replace(tzinfo=timezone.utc)
+        cell = get_api_cache_cell(data["lat"], data["lon"], "weather")
+        with conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO weather_cache (cell, city, lat, lon, fetched_at, used_at, weather) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (cell, data.get("city"), data["lat"], data["lon"], fetched_at.timestamp(),
+                 fetched_at.timestamp(), json.dumps(data["weather"], ensure_ascii=False)),
+            )
+        os.remove(CACHE_FILE)
+    except (OSError, json.JSONDecodeError, KeyError, TypeError, ValueError, sqlite3.Error) as e:
+        print(f"Не удалось перенести {CACHE_FILE}: {e}")
 
 
-def save_cache(data: Dict[str, Any]) -> None:
-    try:
-        with open(CACHE_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    except OSError as e:
-        print(f"Не удалось сохранить кэш: {e}")
+def cache_weather(city: Optional[str], latitude: float, longitude: float, weather: Dict[str, Any]) -> None:
+    """Запомнить последний удачный ответ погоды для местоположения.
 
+    Запись — одна строка по ячейке координат (как в API кэше). Сверх
+    WEATHER_CACHE_MAX_LOCATIONS вытесняются давно не использованные места.
+    """
+    global _weather_cache_writes
+    cell = get_api_cache_cell(latitude, longitude, "weather")
+    dt = weather.get("dt")
+    with _weather_cache_lock:
+        if dt is not None and _weather_cache_written.get(cell) == dt:
+            return
+        _weather_cache_written.set(cell, dt, time.time() + WEATHER_CACHE_MAX_AGE_HOURS * 3600)
+        _weather_cache_writes += 1
+        evict = _weather_cache_writes % API_CACHE_PURGE_EVERY == 0
 
-def is_cache_fresh(cache: Dict[str, Any], max_age_hours: int = 3) -> bool:
-    ts = cache.get("fetched_at")
-    if not ts:
-        return False
+    now = time.time()
     try:
-        fetched_at = datetime.fromisoformat(ts)
-    except ValueError:
-        return False
-    now = datetime.now(timezone.utc)
-    if fetched_at.tzinfo is None:
-        fetched_at = fetched_at.replace(tzinfo=timezone.utc)
-    return now - fetched_at <= timedelta(hours=max_age_hours)
+        conn = _get_weather_cache_db()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO weather_cache (cell, city, lat, lon, fetched_at, used_at, weather) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (cell, city, latitude, longitude, now, now, json.dumps(weather, ensure_ascii=False)),
+            )
+            if evict:
+                conn.execute(
+                    "DELETE FROM weather_cache WHERE cell NOT IN "
+                    "(SELECT cell FROM weather_cache ORDER BY used_at DESC LIMIT ?)",
+                    (WEATHER_CACHE_MAX_LOCATIONS,),
+                )
+    except sqlite3.Error as e:
+        with _weather_cache_lock:
+            _weather_cache_written.delete(cell)
+        print(f"Не удалось сохранить кэш погоды: {e}")
 
 
-def cache_weather(city: Optional[str], latitude: float, longitude: float, weather: Dict[str, Any]) -> None:
-    data = {
-        "city": city,
-        "lat": latitude,
-        "lon": longitude,
-        "fetched_at": datetime.now(timezone.utc).isoformat(),
-        "weather": weather,
-    }
-    save_cache(data)
+def load_last_known_weather(latitude: float, longitude: float,
+                            max_age_hours: float = WEATHER_CACHE_MAX_AGE_HOURS) -> Optional[Dict[str, Any]]:
+    """Последний удачный ответ погоды для местоположения не старше `max_age_hours`.
+
+    Возвращается с отметкой STALE_MARKER, как устаревшая запись API кэша.
+    """
+    cell = get_api_cache_cell(latitude, longitude, "weather")
+    now = time.time()
+    try:
+        conn = _get_weather_cache_db()
+        row = conn.execute(
+            "SELECT fetched_at, weather FROM weather_cache WHERE cell = ? AND fetched_at > ?",
+            (cell, now - max_age_hours * 3600),
+        ).fetchone()
+        if row is None:
+            return None
+        with conn:
+            conn.execute("UPDATE weather_cache SET used_at = ? WHERE cell = ?", (now, cell))
+        weather = json.loads(row[1])
+    except (sqlite3.Error, json.JSONDecodeError):
+        return None
+    weather[STALE_MARKER] = {"stale": True, "age_seconds": int(now - row[0])}
+    return weather
 
 
 # ============================================================================
 # РАБОТА С ДАННЫМИ ПОЛЬЗОВАТЕЛЕЙ БОТА
 # ============================================================================
 
-def load_bot_users() -> Dict[str, Any]:
-    """Загрузить данные пользователей бота."""
+_bot_users_local = threading.local()
+
+
+def _get_bot_users_db() -> sqlite3.Connection:
+    """Соединение с базой пользователей бота для текущего потока."""
+    conn = getattr(_bot_users_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(BOT_USERS_DB, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={_SQLITE_SYNCHRONOUS.get(BOT_USERS_FSYNC, 'FULL')}")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS bot_users (
+                user_id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        _bot_users_local.conn = conn
+    return conn
+
+
+def _migrate_bot_users_json(conn: sqlite3.Connection) -> None:
+    """Перенести пользователей из старого bot_users_data.json, если база ещё пуста."""
     if not os.path.exists(BOT_USERS_FILE):
-        return {}
+        return
+    if conn.execute("SELECT 1 FROM bot_users LIMIT 1").fetchone():
+        return
     try:
         with open(BOT_USERS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
+            data = json.load(f)
     except (OSError, json.JSONDecodeError):
+        return
+    if save_bot_users(data):
+        print(f"Данные пользователей перенесены из {BOT_USERS_FILE} в {BOT_USERS_DB}")
+
+
+def load_bot_users() -> Dict[str, Any]:
+    """Загрузить данные пользователей бота."""
+    try:
+        conn = _get_bot_users_db()
+        _migrate_bot_users_json(conn)
+        rows = conn.execute("SELECT user_id, data FROM bot_users").fetchall()
+    except sqlite3.Error as e:
+        print(f"Не удалось загрузить данные пользователей бота: {e}")
         return {}
 
+    users: Dict[str, Any] = {}
+    for user_id, data in rows:
+        try:
+            users[user_id] = json.loads(data)
+        except json.JSONDecodeError:
+            continue
+    return users
 
-def save_bot_users(data: Dict[str, Any]) -> None:
-    """Сохранить данные пользователей бота."""
+
+def save_bot_users(data: Dict[str, Any]) -> bool:
+    """Сохранить данные пользователей бота одной транзакцией. False, если запись не удалась."""
+    now = time.time()
     try:
-        with open(BOT_USERS_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    except OSError as e:
+        rows = [(str(user_id), json.dumps(user, ensure_ascii=False), now) for user_id, user in data.items()]
+        conn = _get_bot_users_db()
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO bot_users (user_id, data, updated_at) VALUES (?, ?, ?)", rows)
+    except (sqlite3.Error, TypeError, ValueError) as e:
         print(f"Не удалось сохранить данные пользователей бота: {e}")
+        return False
+    return True
 
 
 # ============================================================================
 # API КЭШИРОВАНИЕ (10 минут)
 # ============================================================================
 
+_api_cache_backend: Optional[CacheBackend] = None
+_api_cache_backend_lock = threading.Lock()
+_api_cache_writes = 0
+_api_memory_cache = MemoryCache(API_MEMORY_CACHE_MAX_ENTRIES, API_MEMORY_CACHE_MAX_BYTES)
+
+
+def get_api_cache_backend() -> CacheBackend:
+    """Хранилище API кэша, выбранное API_CACHE_BACKEND (создаётся при первом обращении)."""
+    global _api_cache_backend
+    if _api_cache_backend is None:
+        with _api_cache_backend_lock:
+            if _api_cache_backend is None:
+                _api_cache_backend = create_cache_backend(
+                    API_CACHE_BACKEND, API_CACHE_DB, API_CACHE_FILES_DIR, API_CACHE_REDIS_URL
+                )
+                _remove_legacy_api_cache_files()
+    return _api_cache_backend
+
+
+def _remove_legacy_api_cache_files() -> None:
+    """Удалить файлы старого формата API кэша (один <ключ>.json на запись в API_CACHE_DIR).
+
+    Записи живут минуты, переносить их незачем. geocode.json не трогаем —
+    его переносит _get_geocode_cache.
+    """
+    try:
+        names = os.listdir(API_CACHE_DIR)
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(API_CACHE_DIR, name)
+        if not name.endswith(".json") or path == GEOCODE_CACHE_FILE or not os.path.isfile(path):
+            continue
+        try:
+            os.remove(path)
+        except OSError as e:
+            print(f"Не удалось удалить {path}: {e}")
+
+
+def get_api_cache_ttl(endpoint: str) -> int:
+    """Время жизни записи API кэша для endpoint (в секундах)."""
+    return API_CACHE_TTL_BY_ENDPOINT.get(endpoint, API_CACHE_TTL_SECONDS)
+
+
+def get_api_cache_max_stale(endpoint: str) -> int:
+    """Сколько секунд после истечения запись endpoint ещё можно отдавать устаревшей."""
+    return API_CACHE_MAX_STALE_BY_ENDPOINT.get(endpoint, API_CACHE_MAX_STALE_SECONDS)
+
+
+def get_stale_age(response: Optional[Dict[str, Any]]) -> Optional[int]:
+    """Возраст данных в секундах, если ответ отдан из кэша устаревшим, иначе None."""
+    if not isinstance(response, dict):
+        return None
+    marker = response.get(STALE_MARKER)
+    if not marker or not marker.get("stale"):
+        return None
+    return int(marker.get("age_seconds", 0))
+
+
+def get_api_memory_cache_stats() -> Dict[str, Any]:
+    """Статистика кэша в памяти (попадания, промахи, вытеснения)."""
+    return _api_memory_cache.stats()
+
+
+def get_api_cache_cell(lat: float, lon: float, endpoint: str) -> str:
+    """Ячейка пространственной сетки, в которую попадают координаты для endpoint."""
+    if API_CACHE_SPATIAL_MODE == "geohash":
+        precision = API_CACHE_GEOHASH_PRECISION.get(endpoint, API_CACHE_GEOHASH_DEFAULT_PRECISION)
+        return geohash_encode(lat, lon, precision)
+    return f"{lat:.4f}_{lon:.4f}"
+
+
 def get_api_cache_key(lat: float, lon: float, endpoint: str) -> str:
     """Генерировать ключ кэша для API."""
-    return f"{lat:.4f}_{lon:.4f}_{endpoint}"
+    return f"{get_api_cache_cell(lat, lon, endpoint)}_{endpoint}"
 
 
 def load_api_cache(lat: float, lon: float, endpoint: str) -> Optional[Dict[str, Any]]:
-    """Загрузить данные из API кэша."""
+    """Загрузить данные из API кэша: сначала из памяти, затем из хранилища.
+
+    Свежесть проверяется по сроку записи, ответ разбирается только для свежей записи.
+    """
     cache_key = get_api_cache_key(lat, lon, endpoint)
-    cache_file = os.path.join(API_CACHE_DIR, f"{cache_key}.json")
-    
-    if not os.path.exists(cache_file):
+    in_memory = endpoint not in API_MEMORY_CACHE_SKIP_ENDPOINTS
+    cached = _api_memory_cache.get(cache_key) if in_memory else None
+    if cached is not None:
+        return cached
+
+    try:
+        record = get_api_cache_backend().get(cache_key)
+        if record is None or record.expires_at <= time.time():
+            return None
+        response = json.loads(record.response)
+    except (CacheBackendError, json.JSONDecodeError):
         return None
-    
+
+    if in_memory:
+        _api_memory_cache.set(cache_key, response, record.expires_at, len(record.response))
+    return response
+
+
+def load_stale_api_cache(lat: float, lon: float, endpoint: str) -> Optional[Dict[str, Any]]:
+    """Истёкшая, но ещё допустимая запись API кэша (не старше get_api_cache_max_stale).
+
+    Возвращает копию ответа с отметкой STALE_MARKER: {"stale": True, "age_seconds": ...}.
+    Такие ответы не попадают в кэш в памяти.
+    """
+    cache_key = get_api_cache_key(lat, lon, endpoint)
+    now = time.time()
     try:
-        with open(cache_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        
-        # Проверяем свежесть (10 минут)
-        cached_at = datetime.fromisoformat(data.get("cached_at", ""))
-        now = datetime.now(timezone.utc)
-        if cached_at.tzinfo is None:
-            cached_at = cached_at.replace(tzinfo=timezone.utc)
-        
-        if now - cached_at <= timedelta(minutes=10):
-            return data.get("response")
-        
-        # Кэш устарел - удаляем
-        os.remove(cache_file)
+        record = get_api_cache_backend().get(cache_key)
+        if record is None or record.stale_until <= now:
+            return None
+        response = json.loads(record.response)
+    except (CacheBackendError, json.JSONDecodeError):
         return None
-    except (OSError, json.JSONDecodeError, ValueError):
+    if not isinstance(response, dict):
         return None
+    response[STALE_MARKER] = {"stale": True, "age_seconds": int(now - record.cached_at)}
+    return response
 
 
-def save_api_cache(lat: float, lon: float, endpoint: str, response: Dict[str, Any]) -> None:
-    """Сохранить данные в API кэш."""
-    cache_key = get_api_cache_key(lat, lon, endpoint)
-    cache_file = os.path.join(API_CACHE_DIR, f"{cache_key}.json")
-    
-    data = {
-        "cached_at": datetime.now(timezone.utc).isoformat(),
-        "response": response
-    }
-    
-    try:
-        with open(cache_file, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    except OSError as e:
+def save_api_cache(lat: float, lon: float, endpoint: str, response: Dict[str, Any],
+                   expires_at: Optional[float] = None) -> None:
+    """Сохранить данные в API кэш (`expires_at` — срок раньше обычного TTL, например для составных записей)."""
+    global _api_cache_writes
+    cell = get_api_cache_cell(lat, lon, endpoint)
+    cache_key = f"{cell}_{endpoint}"
+    now = time.time()
+    ttl_expires_at = now + get_api_cache_ttl(endpoint)
+    expires_at = ttl_expires_at if expires_at is None else min(expires_at, ttl_expires_at)
+    stale_until = expires_at + get_api_cache_max_stale(endpoint)
+    payload = json.dumps(response, ensure_ascii=False)
+    if endpoint not in API_MEMORY_CACHE_SKIP_ENDPOINTS:
+        _api_memory_cache.set(cache_key, response, expires_at, len(payload))
+
+    try:
+        get_api_cache_backend().set(cache_key, endpoint, CacheRecord(payload, now, expires_at, stale_until, cell))
+    except CacheBackendError as e:
         print(f"Не удалось сохранить API кэш: {e}")
+        return
+
+    # Периодически удаляем устаревшие записи, чтобы файл не рос бесконечно
+    _api_cache_writes += 1
+    if _api_cache_writes % API_CACHE_PURGE_EVERY == 0:
+        purge_expired_api_cache()
+
+
+def get_api_cache_metadata(lat: float, lon: float, endpoint: str) -> Optional[Dict[str, Any]]:
+    """Метаданные записи API кэша (ячейка сетки, время сохранения и истечения) без разбора ответа."""
+    cache_key = get_api_cache_key(lat, lon, endpoint)
+    try:
+        record = get_api_cache_backend().metadata(cache_key)
+    except CacheBackendError:
+        return None
+    if record is None:
+        return None
+    return {"key": cache_key, "cell": record.cell, "cached_at": record.cached_at, "expires_at": record.expires_at}
+
+
+def get_parts_expiry(lat: float, lon: float, endpoints: List[str]) -> Optional[float]:
+    """Самый ранний срок истечения записей endpoints или None, если какой-то записи нет."""
+    expiry = None
+    for endpoint in endpoints:
+        meta = get_api_cache_metadata(lat, lon, endpoint)
+        if meta is None:
+            return None
+        expiry = meta["expires_at"] if expiry is None else min(expiry, meta["expires_at"])
+    return expiry
+
+
+def purge_expired_api_cache() -> int:
+    """Удалить записи API кэша, которые нельзя отдать даже устаревшими. Возвращает число удалённых записей."""
+    try:
+        return get_api_cache_backend().purge(time.time())
+    except CacheBackendError as e:
+        print(f"Не удалось очистить API кэш: {e}")
+        return 0
+
+
+def acquire_api_fetch_lock(lat: float, lon: float, endpoint: str) -> Optional[str]:
+    """Занять запрос данных endpoint для других процессов. Возвращает токен для release_api_fetch_lock.
+
+    None — данные уже запрашивает другой процесс. Если хранилище недоступно,
+    возвращает пустой токен: лучше лишний запрос к API, чем ни одного.
+    """
+    try:
+        return get_api_cache_backend().lock(get_api_cache_key(lat, lon, endpoint), API_CACHE_LOCK_SECONDS)
+    except CacheBackendError:
+        return ""
+
+
+def release_api_fetch_lock(lat: float, lon: float, endpoint: str, token: str) -> None:
+    if not token:
+        return
+    try:
+        get_api_cache_backend().unlock(get_api_cache_key(lat, lon, endpoint), token)
+    except CacheBackendError as e:
+        print(f"Не удалось снять блокировку API кэша: {e}")
+
 
+def wait_for_api_cache(lat: float, lon: float, endpoint: str,
+                       timeout: float = API_CACHE_LOCK_WAIT_SECONDS) -> Optional[Dict[str, Any]]:
+    """Подождать, пока другой процесс сохранит запись; None, если не дождались."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        time.sleep(API_CACHE_LOCK_POLL_SECONDS)
+        cached = load_api_cache(lat, lon, endpoint)
+        if cached:
+            return cached
+    return None
 
+
+# ============================================================================
+# КЭШ ГЕОКОДИНГА (30 дней)
+# ============================================================================
+
+_geocode_cache: Optional[Dict[str, Dict[str, Any]]] = None
+_geocode_lock = threading.Lock()
+
+
+def normalize_city_name(city: str) -> str:
+    """Нормализовать название города для ключа кэша (регистр, пробелы, Unicode)."""
+    normalized = unicodedata.normalize("NFKC", city).casefold().replace("ё", "е")
+    return re.sub(r"\s+", " ", normalized).strip()
+
+
+def _write_geocode_entry(key: str, entry: Dict[str, Any]) -> None:
+    """Записать результат геокодинга в хранилище API кэша (endpoint "geocode")."""
+    cached_at = datetime.fromisoformat(entry["cached_at"]).timestamp()
+    expires_at = cached_at + GEOCODE_CACHE_TTL.total_seconds()
+    record = CacheRecord(json.dumps(entry, ensure_ascii=False), cached_at, expires_at, expires_at)
+    get_api_cache_backend().set(f"geocode_{key}", "geocode", record)
+
+
+def _read_geocode_entry(key: str) -> Optional[Dict[str, Any]]:
+    try:
+        record = get_api_cache_backend().get(f"geocode_{key}")
+        return json.loads(record.response) if record else None
+    except (CacheBackendError, json.JSONDecodeError):
+        return None
+
+
+def _get_geocode_cache() -> Dict[str, Dict[str, Any]]:
+    """Кэш геокодинга в памяти процесса; при первом обращении переносит старый geocode.json в хранилище."""
+    global _geocode_cache
+    if _geocode_cache is None:
+        _geocode_cache = {}
+        if os.path.exists(GEOCODE_CACHE_FILE):
+            try:
+                with open(GEOCODE_CACHE_FILE, "r", encoding="utf-8") as f:
+                    for key, entry in json.load(f).items():
+                        _write_geocode_entry(key, entry)
+                        _geocode_cache[key] = entry
+                os.remove(GEOCODE_CACHE_FILE)
+            except (OSError, json.JSONDecodeError, KeyError, ValueError, CacheBackendError) as e:
+                print(f"Не удалось перенести {GEOCODE_CACHE_FILE}: {e}")
+    return _geocode_cache
+
+
+def _match_geocode_entry(entry: Optional[Dict[str, Any]], limit: int) -> Optional[List[Dict[str, Any]]]:
+    if not entry:
+        return None
+    try:
+        cached_at = datetime.fromisoformat(entry["cached_at"])
+    except (KeyError, ValueError):
+        return None
+    if datetime.now(timezone.utc) - cached_at > GEOCODE_CACHE_TTL:
+        return None
+
+    locations = entry.get("locations", [])
+    is_complete = len(locations) < entry.get("limit", 0)
+    if entry.get("limit", 0) >= limit or is_complete:
+        return locations[:limit]
+    return None
+
+
+def load_geocode_cache(city: str, limit: int = 1) -> Optional[List[Dict[str, Any]]]:
+    """Найти координаты города в кэше геокодинга.
+
+    Запись, сохранённая с большим `limit`, обслуживает и меньшие. Если API вернул
+    меньше вариантов, чем запрашивалось, список полный и подходит для любого `limit`.
+    При промахе в памяти проверяется общее хранилище: город мог найти другой процесс.
+    """
+    key = normalize_city_name(city)
+    with _geocode_lock:
+        entry = _get_geocode_cache().get(key)
+    locations = _match_geocode_entry(entry, limit)
+    if locations is not None:
+        return locations
+
+    entry = _read_geocode_entry(key)
+    if entry is None:
+        return None
+    with _geocode_lock:
+        _get_geocode_cache()[key] = entry
+    return _match_geocode_entry(entry, limit)
+
+
+def save_geocode_cache(city: str, limit: int, locations: List[Dict[str, Any]]) -> None:
+    """Сохранить результат геокодинга в память и в хранилище API кэша."""
+    key = normalize_city_name(city)
+    with _geocode_lock:
+        cache = _get_geocode_cache()
+        existing = cache.get(key)
+        # Не заменяем более полный ответ менее полным
+        if existing and existing.get("limit", 0) > limit and len(existing.get("locations", [])) >= len(locations):
+            return
+        entry = {
+            "cached_at": datetime.now(timezone.utc).isoformat(),
+            "limit": limit,
+            "locations": locations,
+        }
+        cache[key] = entry
+    try:
+        _write_geocode_entry(key, entry)
+    except CacheBackendError as e:
+        print(f"Не удалось сохранить кэш геокодинга: {e}")
@@ -0,0 +1,57 @@
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.storage import get_api_cache_cell
+
+# Подписчики одной ячейки: (user_id, location)
+CellGroup = List[Tuple[str, Dict[str, float]]]
+
+
+class SubscriberIndex:
+    """Индекс пользователей с включёнными уведомлениями, сгруппированных по ячейкам прогноза.
+
+    Обновляется точечно при изменении пользователя, так что рассылка
+    перебирает только подписчиков и уникальные местоположения.
+    """
+
+    def __init__(self, user_data: Optional[Dict[str, Any]] = None):
+        self._lock = threading.Lock()
+        # cell -> {user_id: location}
+        self._cells: Dict[str, Dict[str, Dict[str, float]]] = {}
+        # user_id -> cell
+        self._user_cells: Dict[str, str] = {}
+        if user_data:
+            for user_id, data in list(user_data.items()):
+                self.update(user_id, data)
+
+    def update(self, user_id: str, data: Optional[Dict[str, Any]]) -> None:
+        """Пересчитать членство пользователя после изменения его данных."""
+        user_id = str(user_id)
+        location = (data or {}).get("location")
+        subscribed = bool((data or {}).get("notifications")) and bool(location)
+
+        with self._lock:
+            old_cell = self._user_cells.pop(user_id, None)
+            if old_cell is not None:
+                members = self._cells.get(old_cell, {})
+                members.pop(user_id, None)
+                if not members:
+                    self._cells.pop(old_cell, None)
+
+            if subscribed:
+                cell = get_api_cache_cell(location["lat"], location["lon"], "forecast")
+                self._cells.setdefault(cell, {})[user_id] = location
+                self._user_cells[user_id] = cell
+
+    def remove(self, user_id: str) -> None:
+        """Убрать пользователя из индекса."""
+        self.update(user_id, None)
+
+    def groups(self) -> Dict[str, CellGroup]:
+        """Снимок индекса: ячейка -> подписчики."""
+        with self._lock:
+            return {cell: list(members.items()) for cell, members in self._cells.items()}
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._user_cells)
@@ -0,0 +1,117 @@
+import atexit
+import os
+import threading
+from typing import Any, Dict, Optional, Set, Tuple
+
+from src.storage import BOT_USERS_FSYNC, save_bot_users
+
+# Сбрасывать изменения на диск не реже чем раз в N миллисекунд...
+USER_FLUSH_INTERVAL_MS = int(os.getenv("USER_FLUSH_INTERVAL_MS", "500"))
+# ...или сразу, как только накопилось M изменённых пользователей
+USER_FLUSH_MAX_MUTATIONS = int(os.getenv("USER_FLUSH_MAX_MUTATIONS", "100"))
+
+
+class WriteBehindWriter:
+    """Отложенная пакетная запись данных пользователей бота.
+
+    Обработчик только помечает пользователя изменённым, а фоновый поток
+    записывает накопившиеся изменения одной транзакцией. При BOT_USERS_FSYNC=always
+    запись синхронная (write-through). При остановке процесса всё несохранённое сбрасывается.
+    """
+
+    def __init__(self, user_data: Dict[str, Any], interval_ms: int = USER_FLUSH_INTERVAL_MS,
+                 max_mutations: int = USER_FLUSH_MAX_MUTATIONS, fsync: str = BOT_USERS_FSYNC):
+        self._user_data = user_data
+        self._interval = interval_ms / 1000
+        self._max_mutations = max_mutations
+        self._write_through = fsync == "always"
+        self._dirty: Set[str] = set()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+        self.flushes = 0
+        self.written = 0
+        self.failed = 0
+        atexit.register(self.stop)
+
+    def start(self) -> None:
+        """Запустить фоновый поток записи (повторный вызов ничего не делает)."""
+        with self._cond:
+            if self._thread is not None or self._write_through:
+                return
+            self._thread = threading.Thread(target=self._run, name="user-write-behind", daemon=True)
+            self._thread.start()
+
+    def mark_dirty(self, user_id: str) -> None:
+        """Отметить пользователя изменённым; запись произойдёт в ближайшем пакете."""
+        with self._cond:
+            self._dirty.add(str(user_id))
+            synchronous = self._write_through or self._stopped
+            if not synchronous and len(self._dirty) >= self._max_mutations:
+                self._cond.notify()
+        if synchronous:
+            self.flush()
+        else:
+            self.start()
+
+    def flush(self) -> int:
+        """Записать все накопившиеся изменения. Возвращает число записанных пользователей."""
+        return self._flush()[0]
+
+    def _flush(self) -> Tuple[int, bool]:
+        # (число записанных, удалась ли запись); при ошибке пользователи снова помечаются изменёнными
+        with self._flush_lock:
+            with self._cond:
+                dirty, self._dirty = self._dirty, set()
+            batch = {
+                user_id: self._user_data[user_id]
+                for user_id in dirty
+                if user_id in self._user_data
+            }
+            if not batch:
+                return 0, True
+            try:
+                saved = save_bot_users(batch)
+            except Exception as e:
+                print(f"Ошибка записи данных пользователей бота: {e}")
+                saved = False
+            if not saved:
+                with self._cond:
+                    self._dirty |= dirty
+                self.failed += 1
+                return 0, False
+            self.flushes += 1
+            self.written += len(batch)
+            return len(batch), True
+
+    def _run(self) -> None:
+        failed = False
+        while True:
+            with self._cond:
+                # После ошибки записи ждём интервал даже при полном пакете, чтобы не повторять запись в цикле
+                if not self._stopped and (failed or len(self._dirty) < self._max_mutations):
+                    self._cond.wait(self._interval)
+                stopped = self._stopped
+            try:
+                failed = not self._flush()[1]
+            except Exception as e:
+                print(f"Ошибка фоновой записи данных пользователей бота: {e}")
+                failed = True
+            if stopped:
+                return
+
+    def stop(self) -> None:
+        """Остановить фоновый поток, предварительно сбросив все изменения на диск."""
+        with self._cond:
+            self._stopped = True
+            thread, self._thread = self._thread, None
+            self._cond.notify()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=10)
+        self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            pending = len(self._dirty)
+        return {"pending": pending, "flushes": self.flushes, "written": self.written, "failed": self.failed}
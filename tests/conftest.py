@@ -0,0 +1,31 @@
+"""Общие настройки тестов: отдельный рабочий каталог и фиктивный ключ API."""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# src.storage создаёт database/ и .cache/ в текущем каталоге — не в репозитории
+os.chdir(tempfile.mkdtemp(prefix="weather-tests-"))
+os.environ.setdefault("API_KEY", "test-key")
+
+
+@pytest.fixture
+def weather_store(tmp_path, monkeypatch):
+    """Пустое хранилище последних удачных ответов погоды во временном каталоге."""
+    from src import storage
+
+    monkeypatch.setattr(storage, "WEATHER_CACHE_DB", str(tmp_path / "weather_cache.sqlite3"))
+    monkeypatch.setattr(storage, "CACHE_FILE", str(tmp_path / "weather_cache.json"))
+    storage._weather_cache_local.conn = None
+    storage._weather_cache_written.clear()
+    yield storage
+    conn = getattr(storage._weather_cache_local, "conn", None)
+    if conn is not None:
+        conn.close()
+    storage._weather_cache_local.conn = None
@@ -0,0 +1,200 @@
+"""Тесты хранилищ API кэша: sqlite, file и redis (через встроенный поддельный RESP-сервер)."""
+
+import os
+import socketserver
+import threading
+import time
+
+import pytest
+
+from src.cache_backend import (
+    _UNLOCK_SCRIPT,
+    CacheRecord,
+    FileCacheBackend,
+    RedisCacheBackend,
+    SQLiteCacheBackend,
+)
+
+
+# ============================================================================
+# ПОДДЕЛЬНЫЙ СЕРВЕР RESP
+# ============================================================================
+
+class _FakeRedisHandler(socketserver.StreamRequestHandler):
+    """Команды, которые использует RedisCacheBackend: GET, SET [NX] [PX], DEL, EVAL (скрипт снятия блокировки)."""
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        assert line.startswith(b"*")
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def _bulk(self, value):
+        if value is None:
+            return b"$-1\r\n"
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def handle(self):
+        while True:
+            args = self._read_command()
+            if args is None:
+                return
+            self.wfile.write(self.server.execute(args, self._bulk))
+
+
+class _FakeRedisServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _FakeRedisHandler)
+        self.data = {}
+        self.lock = threading.Lock()
+
+    def _get(self, key):
+        value, expires_at = self.data.get(key, (None, None))
+        if expires_at is not None and expires_at <= time.monotonic():
+            self.data.pop(key, None)
+            return None
+        return value
+
+    def execute(self, args, bulk):
+        name = args[0].upper()
+        with self.lock:
+            if name in (b"AUTH", b"SELECT", b"PING"):
+                return b"+OK\r\n"
+            if name == b"GET":
+                return bulk(self._get(args[1]))
+            if name == b"DEL":
+                removed = sum(1 for key in args[1:] if self.data.pop(key, None) is not None)
+                return b":%d\r\n" % removed
+            if name == b"SET":
+                options = [arg.upper() for arg in args[3:]]
+                if b"NX" in options and self._get(args[1]) is not None:
+                    return b"$-1\r\n"
+                expires_at = None
+                if b"PX" in options:
+                    expires_at = time.monotonic() + int(args[3 + options.index(b"PX") + 1]) / 1000
+                self.data[args[1]] = (args[2], expires_at)
+                return b"+OK\r\n"
+            if name == b"EVAL":
+                if args[1].decode() != _UNLOCK_SCRIPT or args[2] != b"1":
+                    return b"-ERR unknown script\r\n"
+                if self._get(args[3]) == args[4]:
+                    del self.data[args[3]]
+                    return b":1\r\n"
+                return b":0\r\n"
+            return b"-ERR unknown command\r\n"
+
+
+@pytest.fixture
+def redis_server():
+    server = _FakeRedisServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(params=["sqlite", "file", "redis"])
+def backend(request, tmp_path):
+    if request.param == "sqlite":
+        backend = SQLiteCacheBackend(str(tmp_path / "api_cache.sqlite3"))
+    elif request.param == "file":
+        backend = FileCacheBackend(str(tmp_path / "entries"))
+    else:
+        server = request.getfixturevalue("redis_server")
+        backend = RedisCacheBackend(f"redis://127.0.0.1:{server.server_address[1]}/0")
+    yield backend
+    backend.close()
+
+
+def _record(ttl: float = 60, stale: float = 120) -> CacheRecord:
+    now = time.time()
+    return CacheRecord('{"temp": 1}', now, now + ttl, now + stale, "u4pruy")
+
+
+# ============================================================================
+# ЗАПИСИ
+# ============================================================================
+
+def test_get_missing_key(backend):
+    assert backend.get("missing") is None
+
+
+def test_set_and_get(backend):
+    record = _record()
+    backend.set("55.75_37.62_weather", "weather", record)
+
+    cached = backend.get("55.75_37.62_weather")
+    assert cached.response == record.response
+    assert cached.expires_at == pytest.approx(record.expires_at)
+    assert cached.stale_until == pytest.approx(record.stale_until)
+    assert cached.cell == record.cell
+
+
+def test_set_replaces_record(backend):
+    backend.set("key", "weather", _record())
+    backend.set("key", "weather", _record()._replace(response='{"temp": 2}'))
+    assert backend.get("key").response == '{"temp": 2}'
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "file"], indirect=True)
+def test_purge_removes_only_expired(backend):
+    backend.set("old", "weather", _record(ttl=-20, stale=-10))
+    backend.set("fresh", "weather", _record())
+
+    assert backend.purge(time.time()) == 1
+    assert backend.get("old") is None
+    assert backend.get("fresh") is not None
+
+
+# ============================================================================
+# БЛОКИРОВКИ
+# ============================================================================
+
+def test_lock_is_exclusive(backend):
+    token = backend.lock("key", 10)
+    assert token
+    assert backend.lock("key", 10) is None
+
+    backend.unlock("key", token)
+    assert backend.lock("key", 10) is not None
+
+
+def test_expired_lock_can_be_taken(backend):
+    assert backend.lock("key", 0.05)
+    time.sleep(0.1)
+    assert backend.lock("key", 10) is not None
+
+
+def test_unlock_with_stale_token_keeps_new_lock(backend):
+    stale_token = backend.lock("key", 0.05)
+    time.sleep(0.1)
+    token = backend.lock("key", 10)
+    assert token
+
+    # Процесс, чья блокировка истекла, не должен снять чужую
+    backend.unlock("key", stale_token)
+    assert backend.lock("key", 10) is None
+
+    backend.unlock("key", token)
+    assert backend.lock("key", 10) is not None
+
+
+def test_unlock_without_lock(backend):
+    backend.unlock("key", "unknown")
+    assert backend.lock("key", 10) is not None
+
+
+@pytest.mark.parametrize("backend", ["file"], indirect=True)
+def test_file_lock_leaves_no_entry(backend):
+    token = backend.lock("key", 10)
+    backend.unlock("key", token)
+    assert not [name for name in os.listdir(backend.directory) if name.endswith(".fetch")]
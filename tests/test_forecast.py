@@ -0,0 +1,63 @@
+"""Колоночный прогноз: группировка по дням, агрегаты и тексты дней."""
+
+from src.forecast import ParsedForecast
+
+DAY = 86400
+START = 1700006400  # 2023-11-15 00:00 UTC
+
+
+def _item(offset_hours: int, temp: float, code: int = 800, description: str = "ясно"):
+    return {
+        "dt": START + offset_hours * 3600,
+        "main": {"temp": temp, "humidity": 70},
+        "wind": {"speed": 3.0},
+        "weather": [{"id": code, "description": description}],
+    }
+
+
+FORECAST = {
+    "city": {"name": "Moscow"},
+    "list": [
+        _item(0, 1.0),
+        _item(3, 3.0, 500, "дождь"),
+        _item(24, -2.0, 600, "снег"),
+        _item(27, -4.0, 600, "снег"),
+    ],
+}
+
+
+def test_days_and_aggregates():
+    forecast = ParsedForecast(FORECAST)
+
+    assert len(forecast) == 4
+    assert forecast.dates == ["2023-11-15", "2023-11-16"]
+    first, second = (forecast.days[date] for date in forecast.dates)
+    assert (first.start, first.end) == (0, 2)
+    assert first.avg_temp == 2.0
+    assert (second.min_temp, second.max_temp) == (-4.0, -2.0)
+    assert first.has_rain and not first.has_snow
+    assert second.has_snow and not second.has_rain
+    assert forecast.daily_means() == {"2023-11-15": 2.0, "2023-11-16": -3.0}
+
+
+def test_descriptions_stored_once():
+    forecast = ParsedForecast(FORECAST)
+    assert forecast.descriptions == ("ясно", "дождь", "снег")
+    assert forecast.description(3) == "снег"
+
+
+def test_upcoming_precipitation():
+    forecast = ParsedForecast(FORECAST)
+    assert forecast.upcoming_precipitation(1) is None
+    assert forecast.upcoming_precipitation(2) == "rain"
+
+
+def test_day_texts_built_once():
+    day = ParsedForecast(FORECAST).days["2023-11-16"]
+
+    assert day.button_text == "16.11 (-3.0°C)"
+    assert "🕐 *00:00*" in day.details_text
+    assert "🌡 -4.0°C, снег" in day.details_text
+    # Повторный показ не собирает тексты заново
+    assert day.button_text is day.button_text
+    assert day.details_text is day.details_text
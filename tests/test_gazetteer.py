@@ -0,0 +1,82 @@
+"""Тесты локального справочника городов."""
+
+import pytest
+
+from src import gazetteer
+from src.gazetteer import Gazetteer, build_gazetteer, make_key
+
+
+def _line(geoname_id, name, ascii_name, alternate, lat, lon, country, admin1, population, feature="P"):
+    return "\t".join([
+        str(geoname_id), name, ascii_name, ",".join(alternate), str(lat), str(lon), feature, "PPLC",
+        country, "", admin1, "", "", "", str(population), "", "150", "Europe/Moscow", "2024-01-01",
+    ])
+
+
+@pytest.fixture
+def index_path(tmp_path):
+    dump = tmp_path / "cities.txt"
+    dump.write_text("\n".join([
+        _line(524901, "Moscow", "Moscow", ["Москва", "Moskva"], 55.75222, 37.61556, "RU", "48", 10381222),
+        _line(5601538, "Moscow", "Moscow", [], 46.73239, -117.00017, "US", "ID", 25435),
+        _line(2996944, "Lyon", "Lyon", ["Лион"], 45.74846, 4.84671, "FR", "84", 522969),
+        _line(1, "Moscow River", "Moscow River", [], 55.0, 37.0, "RU", "48", 0, feature="H"),
+    ]) + "\n", encoding="utf-8")
+    admin1 = tmp_path / "admin1.txt"
+    admin1.write_text("RU.48\tMoscow\tMoscow\t524894\nUS.ID\tIdaho\tIdaho\t5596512\n", encoding="utf-8")
+
+    path = tmp_path / "gazetteer.idx"
+    cities, keys = build_gazetteer(str(dump), str(path), str(admin1))
+    assert cities == 3
+    assert keys > cities
+    return str(path)
+
+
+def test_make_key_transliterates():
+    assert make_key("Москва") == "moskva"
+    assert make_key("  São Paulo ") == "sao paulo"
+    assert make_key("Ёлки") == "elki"
+
+
+def test_lookup_largest_first(index_path):
+    index = Gazetteer(index_path)
+    try:
+        first, second = index.lookup("moscow", limit=2)
+        assert (first["country"], first["state"]) == ("RU", "Moscow")
+        assert (second["country"], second["state"]) == ("US", "Idaho")
+        assert first["lat"] == pytest.approx(55.75222)
+    finally:
+        index.close()
+
+
+def test_lookup_cyrillic_and_alternate_names(index_path):
+    index = Gazetteer(index_path)
+    try:
+        assert index.lookup("Москва")[0]["name"] == "Moscow"
+        assert index.lookup("лион")[0]["name"] == "Lyon"
+        assert index.lookup("Moscow River") == []
+    finally:
+        index.close()
+
+
+def test_fuzzy_lookup_only_when_asked(index_path):
+    index = Gazetteer(index_path)
+    try:
+        assert index.lookup("Moskow") == []
+        assert index.lookup("Moskow", fuzzy=True)[0]["country"] == "RU"
+    finally:
+        index.close()
+
+
+def test_not_an_index(tmp_path):
+    path = tmp_path / "broken.idx"
+    path.write_bytes(b"JUNK" + bytes(16))
+    with pytest.raises(ValueError):
+        Gazetteer(str(path))
+
+
+def test_lookup_city_without_index(monkeypatch):
+    monkeypatch.setattr(gazetteer, "GAZETTEER_PATH", "")
+    monkeypatch.setattr(gazetteer, "_gazetteer", None)
+    monkeypatch.setattr(gazetteer, "_gazetteer_loaded", False)
+    assert gazetteer.lookup_city("Москва") is None
@@ -0,0 +1,21 @@
+"""Тесты geohash."""
+
+import pytest
+
+from src.geo import geohash_decode, geohash_encode
+
+
+def test_encode_reference_cell():
+    assert geohash_encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+
+
+def test_nearby_points_share_cell():
+    assert geohash_encode(55.7558, 37.6173) == geohash_encode(55.7560, 37.6175)
+    assert geohash_encode(55.7558, 37.6173) != geohash_encode(55.80, 37.6173)
+
+
+def test_decode_returns_cell_center():
+    lat, lon = geohash_decode(geohash_encode(55.7558, 37.6173, 7))
+    assert lat == pytest.approx(55.7558, abs=0.001)
+    assert lon == pytest.approx(37.6173, abs=0.001)
+    assert geohash_encode(lat, lon, 7) == geohash_encode(55.7558, 37.6173, 7)
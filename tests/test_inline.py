@@ -0,0 +1,136 @@
+"""Тесты обработки inline-запросов."""
+
+import asyncio
+import threading
+
+from src.inline import AsyncInlineEngine, InlineEngine, InlineIndex
+
+
+def _result(name: str):
+    return [{"location": {"name": name, "lat": 1.0, "lon": 2.0}, "weather": {"main": {"temp": 5}}}]
+
+
+# ============================================================================
+# ИНДЕКС
+# ============================================================================
+
+def test_suggest_by_prefix_of_found_city():
+    index = InlineIndex()
+    index.store("моск", _result("Moscow"))
+
+    assert index.suggest("mos") == _result("Moscow")
+    assert index.suggest("мо") == _result("Moscow")
+    assert index.suggest("тул") == []
+
+
+def test_empty_results_not_suggested():
+    index = InlineIndex()
+    index.store("абв", [])
+    assert index.get("абв") == []
+    assert index.suggest("аб") == []
+
+
+def test_expired_results_removed_from_trie():
+    index = InlineIndex()
+    index.store("тула", _result("Tula"))
+    index._results.delete("тула")
+
+    assert index.suggest("ту") == []
+    assert index._root.children == {}
+    assert index._names == {}
+
+
+# ============================================================================
+# ЗАПРОСЫ
+# ============================================================================
+
+def test_repeated_query_served_from_cache():
+    calls = []
+    engine = InlineEngine(lambda query: calls.append(query) or _result(query), debounce_ms=0)
+
+    assert engine.resolve(1, "Тула") == (_result("Тула"), True)
+    assert engine.resolve(2, " тула ") == (_result("Тула"), True)
+    assert calls == ["Тула"]
+
+
+def test_newer_query_supersedes_previous():
+    engine = InlineEngine(lambda query: _result(query), debounce_ms=200)
+    results = []
+    first = threading.Thread(target=lambda: results.append(engine.resolve(1, "Мо")))
+    first.start()
+    while not engine._pending:
+        pass
+
+    assert engine.resolve(1, "Москва") == (_result("Москва"), True)
+    first.join()
+    assert results == [None]
+    assert engine.superseded == 1
+    assert engine.index.get("мо") is None
+
+
+def test_timeout_answers_with_suggestions():
+    release = threading.Event()
+
+    def fetch(query):
+        release.wait(5)
+        return _result(query)
+
+    engine = InlineEngine(fetch, debounce_ms=0, deadline=0.05)
+    engine.index.store("тула", _result("Тула"))
+
+    assert engine.resolve(1, "Ту") == (_result("Тула"), False)
+    release.set()
+
+
+# ============================================================================
+# СОСТОЯНИЕ ПОЛЬЗОВАТЕЛЕЙ
+# ============================================================================
+
+def test_finished_requests_leave_no_user_state():
+    engine = InlineEngine(lambda query: _result(query), debounce_ms=0)
+
+    assert engine.resolve(1, "Москва") == (_result("Москва"), True)
+    assert engine.resolve(2, "Москва") == (_result("Москва"), True)
+
+    assert engine._latest == {}
+    assert engine._pending == {}
+
+
+def test_timed_out_request_cleans_up_after_load():
+    release = threading.Event()
+
+    def fetch(query):
+        release.wait(5)
+        return _result(query)
+
+    engine = InlineEngine(fetch, debounce_ms=0, deadline=0.05)
+    assert engine.resolve(1, "Тула") is None
+    assert "1" in engine._latest
+
+    release.set()
+    engine._pool.shutdown(wait=True)
+
+    assert engine._latest == {}
+    assert engine.index.get("тула") == _result("Тула")
+
+
+def test_async_timed_out_task_forgotten_after_load():
+    async def scenario():
+        release = asyncio.Event()
+
+        async def fetch(query):
+            await release.wait()
+            return _result(query)
+
+        engine = AsyncInlineEngine(fetch, debounce_ms=0, deadline=0.05)
+        assert await engine.resolve(1, "Тула") is None
+        assert "1" in engine._tasks
+
+        release.set()
+        for _ in range(5):
+            await asyncio.sleep(0)
+        return engine
+
+    engine = asyncio.run(scenario())
+    assert engine._tasks == {}
+    assert engine.index.get("тула") == _result("Тула")
@@ -0,0 +1,83 @@
+"""Пакетная рассылка уведомлений по ячейкам прогноза."""
+
+from concurrent.futures import Future
+
+from src import notifications
+from src.forecast import ParsedForecast
+
+RAINY = ParsedForecast({"list": [
+    {"dt": 1700006400, "main": {"temp": 5.0}, "weather": [{"id": 501, "description": "дождь"}]},
+]})
+CLEAR = ParsedForecast({"list": [
+    {"dt": 1700006400, "main": {"temp": 5.0}, "weather": [{"id": 800, "description": "ясно"}]},
+]})
+
+GROUPS = {
+    "rain": [("1", {"lat": 1.0, "lon": 1.0}), ("2", {"lat": 1.0, "lon": 1.0})],
+    "clear": [("3", {"lat": 2.0, "lon": 2.0})],
+}
+
+
+def _done(value=None, error=None) -> Future:
+    future: Future = Future()
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(value)
+    return future
+
+
+def test_one_forecast_per_cell_and_failed_sends_not_counted(monkeypatch):
+    fetched = []
+
+    def forecast(lat, lon):
+        fetched.append((lat, lon))
+        return RAINY if lat == 1.0 else CLEAR
+
+    monkeypatch.setattr(notifications, "get_parsed_forecast", forecast)
+    monkeypatch.setattr(notifications, "get_weather_by_coordinates", lambda lat, lon: {"main": {"temp": 7.5}})
+
+    sent = []
+
+    def send(chat_id, text):
+        sent.append((chat_id, text))
+        return _done(error=RuntimeError("blocked")) if chat_id == 2 else _done()
+
+    report = notifications.run_notifications(GROUPS, send)
+
+    assert sorted(fetched) == [(1.0, 1.0), (2.0, 2.0)]
+    assert [chat_id for chat_id, _ in sent] == [1, 2]
+    assert "дождь" in sent[0][1] and "7.5°C" in sent[0][1]
+    assert (report["to_send"], report["sent"], report["cells"], report["subscribers"]) == (2, 1, 2, 3)
+
+
+def test_no_message_without_current_weather(monkeypatch):
+    monkeypatch.setattr(notifications, "get_parsed_forecast", lambda lat, lon: RAINY)
+    monkeypatch.setattr(notifications, "get_weather_by_coordinates", lambda lat, lon: None)
+
+    report = notifications.run_notifications(GROUPS, lambda chat_id, text: _done())
+    assert report["to_send"] == 0
+
+
+def test_async_run_uses_same_rules():
+    import asyncio
+
+    async def forecast(lat, lon):
+        return RAINY if lat == 1.0 else CLEAR
+
+    async def weather(lat, lon):
+        return {"main": {"temp": 7.5}}
+
+    sent = []
+
+    async def send(chat_id, text):
+        sent.append((chat_id, text))
+        if chat_id == 2:
+            raise RuntimeError("blocked")
+
+    report = asyncio.run(notifications.run_notifications_async(GROUPS, forecast, weather, send))
+
+    assert [chat_id for chat_id, _ in sent] == [1, 2]
+    expected = notifications.build_notification(notifications.build_precipitation_message(RAINY), {"main": {"temp": 7.5}})
+    assert sent[0][1] == expected
+    assert (report["to_send"], report["sent"]) == (2, 1)
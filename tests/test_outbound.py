@@ -0,0 +1,103 @@
+"""Тесты очереди исходящих сообщений."""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src import outbound
+from src.outbound import PRIORITY_INTERACTIVE, OutboundQueue
+
+
+def test_chat_buckets_evict_least_recently_used(monkeypatch):
+    monkeypatch.setattr(outbound, "_CHAT_BUCKETS_LIMIT", 3)
+    queue = OutboundQueue(workers=0)
+    first = queue._chat_bucket(1)
+    queue._chat_bucket(2)
+    queue._chat_bucket(3)
+    assert queue._chat_bucket(1) is first
+
+    queue._chat_bucket(4)
+
+    # Вытесняется чат 2: к чату 1 обращались позже
+    assert list(queue._chat_buckets) == [3, 1, 4]
+    assert queue._chat_bucket(1) is first
+
+
+class _TooManyRequests(Exception):
+    error_code = 429
+
+    def __init__(self, retry_after: float):
+        super().__init__("Too Many Requests")
+        self.result_json = {"parameters": {"retry_after": retry_after}}
+
+
+# ============================================================================
+# ОЧЕРЕДИ И ЛИМИТЫ
+# ============================================================================
+
+def test_interactive_messages_go_first():
+    queue = OutboundQueue(workers=1, global_rate=1000, chat_rate=1000, chat_burst=1000)
+    release = threading.Event()
+    sent = []
+    queue.submit("block", release.wait, 5)
+    futures = [queue.submit(chat_id, sent.append, chat_id) for chat_id in ("b1", "b2")]
+    futures.append(queue.submit("i1", sent.append, "i1", priority=PRIORITY_INTERACTIVE))
+    release.set()
+    for future in futures:
+        future.result(5)
+
+    assert sent == ["i1", "b1", "b2"]
+    assert queue.metrics()["sent"] == {"interactive": 1, "broadcast": 3}
+
+
+def test_limited_chat_does_not_delay_others():
+    queue = OutboundQueue(workers=1, global_rate=1000, chat_rate=5, chat_burst=1)
+    sent = []
+    first = [queue.submit(1, sent.append, f"1-{index}") for index in range(2)]
+    other = queue.submit(2, sent.append, "2-0")
+    for future in first + [other]:
+        future.result(5)
+
+    assert sent.index("2-0") < sent.index("1-1")
+    assert queue.metrics()["throttled"] >= 1
+
+
+def test_telegram_429_is_retried_after_pause():
+    queue = OutboundQueue(workers=1, global_rate=1000, chat_rate=1000, chat_burst=1000)
+    attempts = []
+
+    def send(text):
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise _TooManyRequests(0.05)
+        return text
+
+    assert queue.call(1, send, "hello") == "hello"
+    assert attempts[1] - attempts[0] >= 0.05
+
+
+def test_errors_are_passed_to_caller():
+    queue = OutboundQueue(workers=1)
+
+    def send():
+        raise ValueError("chat not found")
+
+    with pytest.raises(ValueError):
+        queue.call(1, send)
+    assert queue.metrics()["failed"] == 1
+
+
+def test_submit_async_runs_coroutine_in_caller_loop():
+    queue = OutboundQueue(workers=1, global_rate=1000, chat_rate=1000, chat_burst=1000)
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+
+        async def send(text):
+            return text, asyncio.get_running_loop() is loop
+
+        return await queue.call_async(1, send, "hello")
+
+    assert asyncio.run(scenario()) == ("hello", True)
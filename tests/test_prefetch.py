@@ -0,0 +1,66 @@
+"""Предзагрузка популярных записей кэша (refresh-ahead)."""
+
+import time
+
+from src import prefetch
+from src.prefetch import Prefetcher
+
+
+def _prefetcher(refreshed=None, **kwargs):
+    refreshed = [] if refreshed is None else refreshed
+
+    def refresh(lat, lon, endpoint):
+        refreshed.append((lat, lon, endpoint))
+        return {}
+
+    return Prefetcher(refresh, **kwargs)
+
+
+def test_hot_entries_ranked_by_access():
+    prefetcher = _prefetcher(top_n=2)
+    for _ in range(3):
+        prefetcher.record(1.0, 1.0, "weather")
+    prefetcher.record(2.0, 2.0, "weather")
+    prefetcher.record(3.0, 3.0, "weather")
+    prefetcher.record(3.0, 3.0, "weather")
+
+    assert prefetcher.hot_entries() == [(1.0, 1.0, "weather"), (3.0, 3.0, "weather")]
+
+
+def test_pinned_entries_survive_trim(monkeypatch):
+    monkeypatch.setattr(prefetch, "PREFETCH_MAX_TRACKED", 10)
+    prefetcher = _prefetcher()
+    prefetcher.pin(55.0, 37.0)
+    for index in range(100):
+        for _ in range(10):
+            prefetcher.record(float(index), 0.0, "weather")
+
+    assert prefetcher.stats()["pinned"] == 2
+    assert prefetcher.stats()["tracked"] <= 10 * 1.1 + 2
+    prefetcher.unpin(55.0, 37.0)
+    assert prefetcher.stats()["pinned"] == 0
+
+
+def test_pins_are_counted_per_location():
+    prefetcher = _prefetcher()
+    prefetcher.pin(55.0, 37.0)
+    prefetcher.pin(55.0, 37.0)
+    prefetcher.unpin(55.0, 37.0)
+    assert prefetcher.stats()["pinned"] == 2
+    prefetcher.unpin(55.0, 37.0)
+    prefetcher.unpin(55.0, 37.0)
+    assert prefetcher.stats()["pinned"] == 0
+
+
+def test_run_once_refreshes_only_expiring_entries_within_budget(monkeypatch):
+    expiry = {1.0: time.time() + 3600, 2.0: time.time() + 10}
+    monkeypatch.setattr(prefetch, "get_api_cache_metadata",
+                        lambda lat, lon, endpoint: {"expires_at": expiry[lat]} if lat in expiry else None)
+    refreshed = []
+    prefetcher = _prefetcher(refreshed, calls_per_minute=1)
+    for lat in (1.0, 2.0, 3.0):
+        prefetcher.record(lat, 0.0, "weather")
+
+    assert prefetcher.run_once() == 1
+    assert len(refreshed) == 1 and refreshed[0][0] in (2.0, 3.0)
+    assert prefetcher.stats()["skipped_budget"] == 1
@@ -0,0 +1,119 @@
+"""Тесты учёта квоты OpenWeather API."""
+
+import json
+import os
+import threading
+
+from src import quota as quota_module
+from src.quota import PRIORITY_BACKGROUND, QuotaManager, SlidingWindow, _key_id, request_priority
+
+
+# ============================================================================
+# СОХРАНЕНИЕ
+# ============================================================================
+
+def test_concurrent_saves_leave_valid_file(tmp_path):
+    path = str(tmp_path / "api_quota.json")
+    manager = QuotaManager(["key"], per_minute=0, path=path)
+    errors = []
+
+    def worker():
+        try:
+            for _ in range(50):
+                manager.acquire("weather")
+                manager.save()
+        except Exception as e:  # noqa: BLE001
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert os.listdir(tmp_path) == ["api_quota.json"]
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    assert sum(count for _, count in data[_key_id("key")]["minute"]) == 400
+
+
+def test_save_is_triggered_once_per_interval(tmp_path, monkeypatch):
+    manager = QuotaManager(["key"], per_minute=0, path=str(tmp_path / "api_quota.json"))
+    calls = []
+    monkeypatch.setattr(manager, "save", lambda: calls.append(1))
+    monkeypatch.setattr(quota_module, "QUOTA_SAVE_INTERVAL", 0.5)
+    manager._saved_at -= 1
+
+    for _ in range(5):
+        manager.acquire("weather")
+
+    assert len(calls) == 1
+
+
+def test_counters_restored_after_restart(tmp_path):
+    path = str(tmp_path / "api_quota.json")
+    manager = QuotaManager(["key"], per_minute=0, path=path)
+    for _ in range(3):
+        manager.acquire("weather")
+    manager.save()
+
+    restored = QuotaManager(["key"], per_minute=0, path=path)
+    assert restored.stats()["keys"][_key_id("key")]["minute"] == 3
+    assert restored.stats()["keys"][_key_id("key")]["endpoints_day"] == {"weather": 3}
+
+
+# ============================================================================
+# ОКНА И ПРИОРИТЕТЫ
+# ============================================================================
+
+def test_sliding_window_expires_old_buckets():
+    window = SlidingWindow(60, 1)
+    window.add(1000)
+    window.add(1030, 2)
+    assert window.total(1059) == 3
+    assert window.total(1061) == 2
+    assert window.total(1100) == 0
+
+
+def test_minute_limit_rejects_requests():
+    manager = QuotaManager(["key"], per_minute=2, reserve=0, path=None)
+    assert manager.acquire("weather") == "key"
+    assert manager.acquire("weather") == "key"
+    assert manager.acquire("weather") is None
+    assert manager.stats()["rejected_interactive"] == 1
+
+
+def test_background_requests_leave_reserve():
+    manager = QuotaManager(["key"], per_minute=10, reserve=0.2, path=None)
+    with request_priority(PRIORITY_BACKGROUND):
+        granted = sum(manager.acquire("weather") is not None for _ in range(10))
+    assert granted == 8
+    assert manager.acquire("weather") == "key"
+    assert manager.stats()["rejected_background"] == 2
+
+
+def test_least_used_key_is_chosen():
+    manager = QuotaManager(["first", "second"], per_minute=10, path=None)
+    keys = [manager.acquire("weather") for _ in range(4)]
+    assert sorted(keys) == ["first", "first", "second", "second"]
+
+
+def test_retry_after_pauses_key_for_everyone():
+    manager = QuotaManager(["key"], per_minute=0, path=None)
+    manager.report_throttled("key", retry_after=30)
+    assert manager.acquire("weather") is None
+    with request_priority(PRIORITY_BACKGROUND):
+        assert manager.acquire("weather") is None
+
+
+def test_backoff_without_retry_after_pauses_background_only():
+    manager = QuotaManager(["key"], per_minute=0, path=None)
+    manager.report_throttled("key")
+    first = manager.stats()["keys"][_key_id("key")]["backoff"]
+    manager.report_throttled("key")
+    assert manager.stats()["keys"][_key_id("key")]["backoff"] > first
+
+    assert manager.acquire("weather") == "key"
+    with request_priority(PRIORITY_BACKGROUND):
+        assert manager.acquire("weather") is None
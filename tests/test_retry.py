@@ -0,0 +1,157 @@
+"""Тесты повторов запросов и circuit breaker."""
+
+import time
+
+import pytest
+import requests
+
+from src import api_client, retry
+from src.quota import QuotaManager
+from src.rate_limit import TokenBucket
+from src.retry import STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN, CircuitBreaker
+
+
+class _Response:
+    def __init__(self, status_code: int, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """request_with_retries без пауз, с отдельной квотой и поддельным HTTP."""
+    responses = []
+    urls = []
+
+    def http_get(url, timeout):
+        urls.append(url)
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    monkeypatch.setattr(api_client, "http_get", http_get)
+    monkeypatch.setattr(api_client, "quota", QuotaManager(["key"], per_minute=0, path=None))
+    monkeypatch.setattr(api_client.time, "sleep", lambda seconds: None)
+    monkeypatch.setattr(retry, "_budget", TokenBucket(100, 100))
+    return responses, urls
+
+
+# ============================================================================
+# RETRY-AFTER И ПАУЗЫ
+# ============================================================================
+
+def test_retryable_statuses():
+    assert retry.is_retryable_status(429)
+    assert retry.is_retryable_status(503)
+    assert not retry.is_retryable_status(404)
+
+
+def test_parse_retry_after():
+    assert retry.parse_retry_after("7") == 7
+    assert retry.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+    assert retry.parse_retry_after("soon") is None
+    assert retry.parse_retry_after(None) is None
+
+
+def test_retry_delay_limits(monkeypatch):
+    monkeypatch.setattr(retry, "_budget", TokenBucket(100, 100))
+    assert retry.retry_delay(3, 3) is None
+    assert 0 <= retry.retry_delay(1, 3) <= retry.RETRY_BASE_DELAY
+    assert retry.retry_delay(1, 3, retry_after=2, max_delay=5) == 2
+    # Retry-After длиннее допустимой паузы не ждём
+    assert retry.retry_delay(1, 3, retry_after=10, max_delay=5) is None
+
+
+def test_retry_budget_exhausted(monkeypatch):
+    monkeypatch.setattr(retry, "_budget", TokenBucket(0.001, 1))
+    assert retry.retry_delay(1, 3) is not None
+    assert retry.retry_delay(1, 3) is None
+
+
+# ============================================================================
+# CIRCUIT BREAKER
+# ============================================================================
+
+def test_breaker_opens_after_failures():
+    breaker = CircuitBreaker("test", failure_threshold=2, recovery_seconds=60)
+    breaker.record_failure()
+    assert breaker.state == STATE_CLOSED
+    breaker.record_failure()
+    assert breaker.state == STATE_OPEN
+    assert not breaker.allow()
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_breaker_half_open_allows_single_probe():
+    breaker = CircuitBreaker("test", failure_threshold=1, recovery_seconds=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+
+    assert breaker.state == STATE_HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == STATE_CLOSED
+    assert breaker.allow()
+
+
+def test_breaker_failed_probe_reopens():
+    breaker = CircuitBreaker("test", failure_threshold=1, recovery_seconds=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == STATE_OPEN
+    assert breaker.stats()["opened"] == 2
+
+
+# ============================================================================
+# ЗАПРОСЫ С ПОВТОРАМИ
+# ============================================================================
+
+def test_request_retries_temporary_errors(api):
+    responses, urls = api
+    responses.extend([requests.ConnectionError("down"), _Response(503), _Response(200)])
+
+    response = api_client.request_with_retries("https://api.test/weather?q=x", "retry-ok")
+    assert response.status_code == 200
+    assert len(urls) == 3
+    assert all(url.endswith("&appid=key") for url in urls)
+    assert retry.get_breaker("retry-ok").state == STATE_CLOSED
+
+
+def test_request_returns_last_response_after_retries(api):
+    responses, urls = api
+    responses.extend([_Response(500), _Response(500), _Response(500)])
+
+    response = api_client.request_with_retries("https://api.test/weather?q=x", "retry-fail")
+    assert response.status_code == 500
+    assert len(urls) == 3
+
+
+def test_request_skipped_while_breaker_open(api):
+    responses, urls = api
+    breaker = retry.get_breaker("retry-open")
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+
+    assert api_client.request_with_retries("https://api.test/weather?q=x", "retry-open") is None
+    assert urls == []
+
+
+def test_rate_limited_key_is_paused(api, monkeypatch):
+    responses, urls = api
+    monkeypatch.setattr(api_client, "quota", QuotaManager(["first", "second"], per_minute=0, path=None))
+    responses.extend([_Response(429, {"Retry-After": "30"}), _Response(200), _Response(200)])
+
+    # Запрос пользователя не ждёт Retry-After дольше RETRY_INTERACTIVE_MAX_DELAY
+    assert api_client.request_with_retries("https://api.test/weather?q=x", "retry-429").status_code == 429
+    assert api_client.request_with_retries("https://api.test/weather?q=x", "retry-429").status_code == 200
+    assert api_client.request_with_retries("https://api.test/weather?q=x", "retry-429").status_code == 200
+
+    # До конца паузы запросы идут через другой ключ
+    keys = [url.rsplit("=", 1)[1] for url in urls]
+    assert keys[1] == keys[2] != keys[0]
@@ -0,0 +1,86 @@
+"""Тесты объединения одновременных запросов."""
+
+import asyncio
+import threading
+
+import pytest
+
+from src.singleflight import AsyncSingleFlight, SingleFlight
+
+
+def test_concurrent_calls_share_result():
+    flights = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {"temp": 1}
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flights.do("key", fetch)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flights.do("key", fetch))) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    while flights.stats()["shared"] < 3:
+        pass
+    release.set()
+    for thread in [leader] + followers:
+        thread.join()
+
+    assert calls == [1]
+    assert results == [{"temp": 1}] * 4
+    assert flights.stats() == {"executed": 1, "shared": 3, "in_flight": 0}
+
+
+def test_error_is_shared_and_key_released():
+    flights = SingleFlight()
+
+    def fail():
+        raise ValueError("api")
+
+    with pytest.raises(ValueError):
+        flights.do("key", fail)
+    assert flights.do("key", lambda: 2) == 2
+    assert flights.stats()["in_flight"] == 0
+
+
+def test_async_calls_share_result():
+    async def scenario():
+        flights = AsyncSingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "result"
+
+        results = await asyncio.gather(*(flights.do("key", fetch) for _ in range(4)))
+        return flights, calls, results
+
+    flights, calls, results = asyncio.run(scenario())
+    assert calls == [1]
+    assert results == ["result"] * 4
+    assert flights.stats() == {"executed": 1, "shared": 3, "in_flight": 0}
+
+
+def test_async_cancelled_waiter_keeps_shared_call():
+    async def scenario():
+        flights = AsyncSingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.02)
+            return "result"
+
+        waiter = asyncio.ensure_future(flights.do("key", fetch))
+        other = asyncio.ensure_future(flights.do("key", fetch))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        return await other
+
+    assert asyncio.run(scenario()) == "result"
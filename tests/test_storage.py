@@ -0,0 +1,73 @@
+"""Тесты локальных хранилищ: старый формат API кэша и последние удачные ответы погоды."""
+
+import json
+import os
+from datetime import datetime, timezone
+
+from src import storage
+
+
+def test_legacy_api_cache_files_removed(tmp_path, monkeypatch):
+    cache_dir = tmp_path / ".cache"
+    (cache_dir / "entries").mkdir(parents=True)
+    (cache_dir / "55.75_37.62_weather.json").write_text("{}", encoding="utf-8")
+    (cache_dir / "geocode.json").write_text("{}", encoding="utf-8")
+    (cache_dir / "api_cache.sqlite3").write_text("", encoding="utf-8")
+    (cache_dir / "entries" / "key.json").write_text("{}", encoding="utf-8")
+    monkeypatch.setattr(storage, "API_CACHE_DIR", str(cache_dir))
+    monkeypatch.setattr(storage, "GEOCODE_CACHE_FILE", str(cache_dir / "geocode.json"))
+
+    storage._remove_legacy_api_cache_files()
+
+    # geocode.json переносит кэш геокодинга, entries/ — каталог хранилища file
+    assert sorted(os.listdir(cache_dir)) == ["api_cache.sqlite3", "entries", "geocode.json"]
+    assert os.listdir(cache_dir / "entries") == ["key.json"]
+
+
+# ============================================================================
+# ПОСЛЕДНИЕ УДАЧНЫЕ ОТВЕТЫ ПОГОДЫ
+# ============================================================================
+
+WEATHER = {"name": "Moscow", "dt": 1700000000, "main": {"temp": -3.5}}
+
+
+def test_last_known_weather_marked_stale(weather_store):
+    weather_store.cache_weather("Moscow", 55.7558, 37.6173, WEATHER)
+
+    # Соседняя точка той же ячейки получает ту же запись
+    weather = weather_store.load_last_known_weather(55.7559, 37.6174)
+    assert weather["main"]["temp"] == -3.5
+    assert weather_store.get_stale_age(weather) == 0
+    assert weather_store.load_last_known_weather(59.9343, 30.3351) is None
+
+
+def test_last_known_weather_too_old(weather_store):
+    weather_store.cache_weather("Moscow", 55.7558, 37.6173, WEATHER)
+    assert weather_store.load_last_known_weather(55.7558, 37.6173, max_age_hours=0) is None
+
+
+def test_same_weather_written_once(weather_store):
+    weather_store.cache_weather("Moscow", 55.7558, 37.6173, WEATHER)
+    conn = weather_store._get_weather_cache_db()
+    fetched_at, = conn.execute("SELECT fetched_at FROM weather_cache").fetchone()
+
+    weather_store.cache_weather("Moscow", 55.7558, 37.6173, dict(WEATHER))
+    assert conn.execute("SELECT fetched_at FROM weather_cache").fetchone() == (fetched_at,)
+
+    weather_store.cache_weather("Moscow", 55.7558, 37.6173, dict(WEATHER, dt=WEATHER["dt"] + 600))
+    assert json.loads(conn.execute("SELECT weather FROM weather_cache").fetchone()[0])["dt"] == WEATHER["dt"] + 600
+
+
+def test_legacy_weather_cache_json_migrated(weather_store):
+    legacy = {
+        "city": "Moscow",
+        "lat": 55.7558,
+        "lon": 37.6173,
+        "fetched_at": datetime.now(timezone.utc).isoformat(),
+        "weather": WEATHER,
+    }
+    with open(weather_store.CACHE_FILE, "w", encoding="utf-8") as f:
+        json.dump(legacy, f)
+
+    assert weather_store.load_last_known_weather(55.7558, 37.6173)["main"]["temp"] == -3.5
+    assert not os.path.exists(weather_store.CACHE_FILE)
@@ -0,0 +1,90 @@
+"""Резерв последних удачных ответов погоды при ошибках сети."""
+
+import asyncio
+
+from src import api_client, async_api_client
+
+MOSCOW = {"name": "Moscow", "state": None, "country": "RU", "lat": 55.7558, "lon": 37.6173}
+WEATHER = {"name": "Moscow", "dt": 1700000000, "main": {"temp": -3.5}}
+
+
+def _network_down(monkeypatch):
+    monkeypatch.setattr(api_client, "get_weather_by_coordinates", lambda lat, lon: None)
+    monkeypatch.setattr(api_client, "get_coordinates", lambda city, limit=1: [MOSCOW])
+
+
+def test_coordinates_fall_back_to_last_known(weather_store, monkeypatch):
+    weather_store.cache_weather("Moscow", MOSCOW["lat"], MOSCOW["lon"], WEATHER)
+    _network_down(monkeypatch)
+
+    weather = api_client.get_current_weather(latitude=MOSCOW["lat"], longitude=MOSCOW["lon"])
+    assert weather["main"]["temp"] == -3.5
+    assert api_client.get_stale_age(weather) is not None
+
+
+def test_city_falls_back_to_last_known(weather_store, monkeypatch):
+    weather_store.cache_weather("Moscow", MOSCOW["lat"], MOSCOW["lon"], WEATHER)
+    _network_down(monkeypatch)
+
+    results = api_client.get_current_weather(city="Москва")
+    assert len(results) == 1
+    assert results[0]["location"] == MOSCOW
+    assert results[0]["weather"]["main"]["temp"] == -3.5
+
+
+def test_batch_error_without_saved_weather(weather_store, monkeypatch):
+    _network_down(monkeypatch)
+
+    item, = api_client.get_weather_batch(["Москва"])
+    assert item["weather"] is None
+    assert item["error"] == "не удалось получить погоду"
+
+
+def test_batch_saves_fresh_weather(weather_store, monkeypatch):
+    monkeypatch.setattr(api_client, "get_weather_by_coordinates", lambda lat, lon: dict(WEATHER))
+    item, = api_client.get_weather_batch([(MOSCOW["lat"], MOSCOW["lon"])])
+    assert item["error"] is None
+
+    stored = weather_store.load_last_known_weather(MOSCOW["lat"], MOSCOW["lon"])
+    assert stored["main"]["temp"] == -3.5
+
+
+def test_async_city_falls_back_to_last_known(weather_store, monkeypatch):
+    weather_store.cache_weather("Moscow", MOSCOW["lat"], MOSCOW["lon"], WEATHER)
+
+    async def no_weather(lat, lon):
+        return None
+
+    async def coordinates(city, limit=1):
+        return [MOSCOW]
+
+    monkeypatch.setattr(async_api_client, "get_weather_by_coordinates", no_weather)
+    monkeypatch.setattr(async_api_client, "get_coordinates", coordinates)
+
+    results = asyncio.run(async_api_client.get_current_weather(city="Москва"))
+    assert [item["weather"]["main"]["temp"] for item in results] == [-3.5]
+    weather = asyncio.run(async_api_client.get_current_weather(latitude=MOSCOW["lat"], longitude=MOSCOW["lon"]))
+    assert async_api_client.get_stale_age(weather) is not None
+
+
+def test_extended_bundle_falls_back_to_last_known(weather_store, monkeypatch):
+    weather_store.cache_weather("Moscow", MOSCOW["lat"], MOSCOW["lon"], WEATHER)
+    monkeypatch.setattr(api_client, "get_weather_by_coordinates", lambda lat, lon: None)
+    monkeypatch.setattr(api_client, "get_air_pollution", lambda lat, lon: None)
+
+    bundle = api_client.get_extended_bundle(MOSCOW["lat"], MOSCOW["lon"])
+    assert bundle["weather"]["main"]["temp"] == -3.5
+    assert bundle["air_pollution"] is None
+
+
+def test_async_extended_bundle_falls_back_to_last_known(weather_store, monkeypatch):
+    weather_store.cache_weather("Moscow", MOSCOW["lat"], MOSCOW["lon"], WEATHER)
+
+    async def unavailable(lat, lon):
+        return None
+
+    monkeypatch.setattr(async_api_client, "get_weather_by_coordinates", unavailable)
+    monkeypatch.setattr(async_api_client, "get_air_pollution", unavailable)
+
+    bundle = asyncio.run(async_api_client.get_extended_bundle(MOSCOW["lat"], MOSCOW["lon"]))
+    assert bundle["weather"]["main"]["temp"] == -3.5
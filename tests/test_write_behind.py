@@ -0,0 +1,74 @@
+"""Тесты отложенной записи данных пользователей бота."""
+
+import time
+
+import pytest
+
+from src import write_behind
+from src.write_behind import WriteBehindWriter
+
+
+@pytest.fixture
+def saved(monkeypatch):
+    """Пакеты, переданные в save_bot_users (вместо записи в базу)."""
+    batches = []
+
+    def save_bot_users(batch):
+        batches.append(dict(batch))
+        return True
+
+    monkeypatch.setattr(write_behind, "save_bot_users", save_bot_users)
+    return batches
+
+
+def test_changes_written_in_one_batch(saved):
+    users = {"1": {"city": "Москва"}, "2": {"city": "Тула"}}
+    writer = WriteBehindWriter(users, interval_ms=60000, max_mutations=100, fsync="batch")
+    writer.mark_dirty(1)
+    writer.mark_dirty("2")
+    writer.mark_dirty(1)
+    assert saved == []
+
+    writer.stop()
+    assert saved == [users]
+    assert writer.stats() == {"pending": 0, "flushes": 1, "written": 2, "failed": 0}
+
+
+def test_full_batch_flushed_without_waiting(saved):
+    users = {str(index): {"n": index} for index in range(3)}
+    writer = WriteBehindWriter(users, interval_ms=60000, max_mutations=3, fsync="batch")
+    for user_id in users:
+        writer.mark_dirty(user_id)
+
+    deadline = time.monotonic() + 5
+    while not saved and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert saved == [users]
+    writer.stop()
+
+
+def test_write_through_saves_immediately(saved):
+    writer = WriteBehindWriter({"1": {"city": "Москва"}}, fsync="always")
+    writer.mark_dirty("1")
+    assert saved == [{"1": {"city": "Москва"}}]
+    assert writer._thread is None
+    writer.stop()
+
+
+def test_failed_write_is_retried(monkeypatch):
+    results = [False, True]
+    batches = []
+
+    def save_bot_users(batch):
+        batches.append(dict(batch))
+        return results.pop(0)
+
+    monkeypatch.setattr(write_behind, "save_bot_users", save_bot_users)
+    writer = WriteBehindWriter({"1": {"city": "Москва"}}, interval_ms=60000, fsync="batch")
+    writer._dirty.add("1")
+
+    assert writer.flush() == 0
+    assert writer.stats()["pending"] == 1
+    assert writer.flush() == 1
+    assert len(batches) == 2
+    assert writer.stats()["failed"] == 1